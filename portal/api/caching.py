@@ -0,0 +1,83 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+from api.models import ChangeCounter
+
+
+def bump(*names):
+    now = timezone.now()
+    for name in names:
+        if ChangeCounter.objects.filter(name=name).update(version=F("version") + 1, changed=now):
+            continue
+        try:
+            with transaction.atomic():
+                ChangeCounter.objects.create(name=name, version=1, changed=now)
+        except IntegrityError:  # created meanwhile by another request
+            ChangeCounter.objects.filter(name=name).update(version=F("version") + 1, changed=now)
+
+
+def get_versions(names):
+    versions = dict((name, (0, None)) for name in names)
+    for name, version, changed in ChangeCounter.objects.filter(name__in=names).values_list("name", "version",
+                                                                                           "changed"):
+        versions[name] = (version, changed)
+    return versions
+
+
+class ConditionalGetMixin(object):
+    """ETag & Last-Modified for list & retrieve, derived from the change counters of `cache_models` (every model
+    whose rows show up in the response); answers 304 when the client's copy is current and otherwise serves the
+    rendered response from the cache while none of those models changed"""
+
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(request) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(request) or super().retrieve(request, *args, **kwargs)
+
+    def get_cached_response(self, request):
+        versions = get_versions(self.cache_models)
+        variant = [request.get_full_path(), request.scheme, request.get_host(), request.META.get("HTTP_ACCEPT", "")]
+        variant.extend("%s:%d" % (name, versions[name][0]) for name in sorted(versions))
+        etag = quote_etag(hashlib.sha1("|".join(variant).encode("utf-8")).hexdigest())
+        changes = [changed for _, changed in versions.values() if changed]
+        last_modified = max(changes) if changes else None
+        request.cache_validators = (etag, last_modified)
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+        if if_none_match:
+            if etag in parse_etags(if_none_match) or if_none_match.strip() == "*":
+                return HttpResponseNotModified()
+        elif if_modified_since and last_modified and int(last_modified.timestamp()) <= if_modified_since:
+            return HttpResponseNotModified()
+        cached = cache.get("response:" + etag)
+        if cached:
+            response = HttpResponse(cached[0], content_type=cached[1])
+            response["X-Cache"] = "HIT"
+            return response
+        return None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(request, "cache_validators", None)
+        if validators is None or response.status_code not in (200, 304):
+            return response
+        etag, last_modified = validators
+        if isinstance(response, Response):
+            response.render()
+            cache.set("response:" + etag, (response.content, response["Content-Type"]),
+                      settings.RESPONSE_CACHE_SECONDS)
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+        patch_vary_headers(response, ["Accept"])
+        return response
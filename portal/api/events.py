@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from api import metrics
+from api.models import ChangeEvent
+
+_condition = threading.Condition()
+_clients = 0
+_clients_lock = threading.Lock()
+
+
+def _notify():
+    with _condition:
+        _condition.notify_all()
+
+
+def record(model, object_id, status, previous_status=None):
+    event = ChangeEvent.objects.create(model=model, object_id=object_id, status=status,
+                                       previous_status=previous_status)
+    if event.id % 1000 == 0:
+        ChangeEvent.objects.filter(id__lte=event.id - settings.EVENTS_RETENTION).delete()
+    transaction.on_commit(_notify)
+    return event
+
+
+def record_many(model, object_ids, status, previous_status=None):
+    """for changes made with queryset.update(), which saves no instances and so sends no signals"""
+    if object_ids:
+        ChangeEvent.objects.bulk_create([ChangeEvent(model=model, object_id=object_id, status=status,
+                                                     previous_status=previous_status) for object_id in object_ids])
+        transaction.on_commit(_notify)
+
+
+def to_message(event):
+    data = {"seq": event.id, "model": event.model, "id": event.object_id, "status": event.status,
+            "previous": event.previous_status, "at": event.created.isoformat()}
+    return "id: %d\nevent: %s\ndata: %s\n\n" % (event.id, event.model, json.dumps(data, separators=(",", ":")))
+
+
+def stream(since, models=None):
+    """server-sent events after sequence number `since`. Events of this process wake the stream at once, those of
+    other worker processes show up within EVENTS_POLL_INTERVAL. The stream ends after EVENTS_STREAM_SECONDS to free
+    the worker; clients reconnect with Last-Event-ID as EventSource does"""
+    oldest = ChangeEvent.objects.order_by("id").values_list("id", flat=True).first()
+    if since is None:
+        since = ChangeEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    elif oldest is not None and since < oldest - 1:
+        yield "event: reset\ndata: {}\n\n"  # events were pruned, the client has to reload full state
+    yield "retry: %d\n\n" % int(settings.EVENTS_RETRY_SECONDS * 1000)
+    ends = time.monotonic() + settings.EVENTS_STREAM_SECONDS
+    next_keepalive = time.monotonic() + settings.EVENTS_KEEPALIVE_SECONDS
+    while time.monotonic() < ends:
+        events = ChangeEvent.objects.filter(id__gt=since).order_by("id")
+        if models:
+            events = events.filter(model__in=models)
+        events = list(events[:settings.EVENTS_BATCH_SIZE])
+        for event in events:
+            yield to_message(event)
+            since = event.id
+        if len(events) == settings.EVENTS_BATCH_SIZE:
+            continue
+        if time.monotonic() >= next_keepalive:
+            yield ": keepalive\n\n"
+            next_keepalive = time.monotonic() + settings.EVENTS_KEEPALIVE_SECONDS
+        with _condition:
+            _condition.wait(settings.EVENTS_POLL_INTERVAL)
+
+
+class _Subscription(object):
+    """a stream that frees its client slot once the response is closed, read to the end or not"""
+
+    def __init__(self, events):
+        self._events = events
+        self._closed = False
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        global _clients
+        if self._closed:
+            return
+        self._closed = True
+        self._events.close()
+        with _clients_lock:
+            _clients -= 1
+            metrics.set_gauge("events.clients", _clients)
+
+
+def subscribe(since, models=None):
+    """stream() for one more client, None once EVENTS_MAX_CLIENTS clients are streaming from this process: each
+    holds a worker thread & a database connection for up to EVENTS_STREAM_SECONDS"""
+    global _clients
+    with _clients_lock:
+        if _clients >= settings.EVENTS_MAX_CLIENTS:
+            metrics.increment("events.refused")
+            return None
+        _clients += 1
+        metrics.set_gauge("events.clients", _clients)
+    return _Subscription(stream(since, models))
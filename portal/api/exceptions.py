@@ -4,4 +4,10 @@ from rest_framework.exceptions import APIException
 class TargetException(APIException):
     status_code = 403
     default_code = "Bad request"
-    default_detail = "Somethingw went wrong"
\ No newline at end of file
+    default_detail = "Somethingw went wrong"
+
+
+class LockTimeoutException(APIException):
+    status_code = 409
+    default_code = "Conflict"
+    default_detail = "Resource is locked by another operation, try again later"
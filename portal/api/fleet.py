@@ -0,0 +1,42 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+
+
+def _interleave_by_volume_group(logical_units):
+    """orders logical units round-robin across volume groups so no worker idles behind a busy group"""
+    groups = {}
+    for logical_unit in logical_units:
+        groups.setdefault((logical_unit.node_id, logical_unit.group), []).append(logical_unit)
+    interleaved = itertools.zip_longest(*groups.values())
+    return [logical_unit for batch in interleaved for logical_unit in batch if logical_unit is not None]
+
+
+def run_on_fleet(logical_units, operation):
+    """runs operation(logical_unit) -> (result, message) on every logical unit, concurrently but with at most
+    FLEET_VOLUME_GROUP_CONCURRENCY operations per volume group; returns per logical unit results & timings"""
+    logical_units = _interleave_by_volume_group(logical_units)
+    if not logical_units:
+        return []
+    semaphores = {}
+    for logical_unit in logical_units:
+        semaphores.setdefault((logical_unit.node_id, logical_unit.group),
+                              threading.BoundedSemaphore(settings.FLEET_VOLUME_GROUP_CONCURRENCY))
+
+    def run(logical_unit):
+        with semaphores[(logical_unit.node_id, logical_unit.group)]:
+            started = time.monotonic()
+            try:
+                result, message = operation(logical_unit)
+            except Exception as e:
+                result, message = False, str(e)
+            finally:
+                connections.close_all()
+            return {"logical_unit": logical_unit.id, "name": logical_unit.name, "result": result, "message": message,
+                    "seconds": round(time.monotonic() - started, 3)}
+
+    with ThreadPoolExecutor(max_workers=min(settings.FLEET_MAX_WORKERS, len(logical_units))) as executor:
+        return list(executor.map(run, logical_units))
@@ -0,0 +1,66 @@
+from django.conf import settings
+from api import metrics
+from api.locks import logical_unit_lock
+from api.models import Image
+from api.streaming import open_image
+from helpers.imagestore.repository import Repository
+
+
+def get_repository(root=None):
+    return Repository(root or settings.IMAGE_REPOSITORY_PATH, settings.IMAGE_CHUNK_SIZE)
+
+
+def register_manifest(manifest, source=None, description=None):
+    """the Image row of a manifest written to the repository, by a dump or by a replicating peer; an existing
+    description is kept unless a new one is given"""
+    defaults = {"size": manifest["size"], "sha256": manifest.get("sha256"), "chunk_count": len(manifest["chunks"]),
+                "new_bytes": manifest.get("new_bytes", 0), "source": source}
+    if description is not None:
+        defaults["description"] = description
+    image, _ = Image.objects.update_or_create(name=manifest["name"], defaults=defaults)
+    return image
+
+
+def dump_to_repository(logical_unit, name, snapshot_name=None, description=None, repository=None):
+    """stores the logical unit (or its named snapshot, otherwise a temporary snapshot for consistency) as image
+    `name`, only chunks the repository lacks taking up space; returns (image, message), image None on failure"""
+    if logical_unit.node is not None:
+        return None, "Images can only be dumped from logical units on this host"
+    path, cleanup = open_image(logical_unit, snapshot_name)
+    try:
+        manifest = (repository or get_repository()).store(path, name, settings.IMAGE_WORKERS)
+    except (IOError, OSError, ValueError) as e:
+        return None, "Failed to dump the disk. Details: %s" % e
+    finally:
+        if cleanup:
+            cleanup()
+    image = register_manifest(manifest, logical_unit.name, description)
+    metrics.increment("images.stored_bytes", manifest["new_bytes"])
+    return image, "Stored %d bytes, %d of them new" % (manifest["size"], manifest["new_bytes"])
+
+
+def restore_from_repository(logical_unit, name, path):
+    """writes image `name` onto the device at path, chunks in parallel; returns (result, message)"""
+    if logical_unit.node is not None:
+        return False, "Images can only be restored to logical units on this host"
+    with logical_unit_lock(logical_unit):
+        try:
+            manifest = get_repository().restore(name, path, settings.IMAGE_WORKERS)
+        except (IOError, OSError, ValueError) as e:
+            return False, "Failed to restore the disk. Details: %s" % e
+    if manifest is None:
+        return False, "Image '%s' not found" % name
+    return True, "Restored %d bytes of image '%s'" % (manifest["size"], name)
+
+
+def remove_image(image):
+    """forgets the image; chunks only it referred to are freed by the next garbage collection"""
+    get_repository().remove_image(image.name)
+    image.delete()
+
+
+def collect_garbage():
+    """(chunks removed, bytes freed)"""
+    removed, freed = get_repository().collect_garbage(settings.IMAGE_GC_GRACE_SECONDS)
+    metrics.increment("images.collected_bytes", freed)
+    return removed, freed
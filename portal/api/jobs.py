@@ -0,0 +1,32 @@
+import json
+import threading
+from django.db import connections
+from django.utils import timezone
+from api.models import Job, JobStatus
+
+
+def start_job(kind, function, *args, **kwargs):
+    """runs function(*args, **kwargs) -> (result, message, data) in a background thread, tracked by a Job row whose
+    id is returned straight away"""
+    job = Job.objects.create(kind=kind)
+
+    def run():
+        job.status = JobStatus.RUNNING.value
+        job.started = timezone.now()
+        job.save(update_fields=["status", "started"])
+        try:
+            result, message, data = function(*args, **kwargs)
+            status = JobStatus.SUCCEEDED.value if result else JobStatus.FAILED.value
+        except Exception as e:
+            status, message, data = JobStatus.FAILED.value, str(e), None
+        try:
+            job.status = status
+            job.message = message
+            job.result = json.dumps(data) if data is not None else None
+            job.finished = timezone.now()
+            job.save(update_fields=["status", "message", "result", "finished"])
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+    return job
@@ -0,0 +1,72 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from api import metrics
+from api.caching import bump
+from api.models import Initiator, LogicalUnit, Target
+from api.shards import get_shards, get_iscsi_target
+from api.views import LogicalUnitViewSet
+from helpers.lvm2.entities import DiskStatus as LogicalUnitStatus
+from helpers.network.probe import probe_addresses
+
+# in use status of a logical unit -> what it returns to once its initiator is gone
+RELEASED_STATUSES = {
+    LogicalUnitStatus.BUSY.value: LogicalUnitStatus.ONLINE.value,
+    LogicalUnitStatus.MOUNTED.value: LogicalUnitStatus.MODIFIED.value,
+}
+
+
+def get_session_addresses(targets):
+    """initiator addresses logged in to each target, one tgtadm show per tgtd (shard of a storage node)"""
+    daemons = {}
+    for target in targets:
+        daemons.setdefault((target.node_id, target.shard if target.shard < len(get_shards()) else 0), target)
+    addresses = {}
+    for target in daemons.values():
+        try:
+            addresses.update(get_iscsi_target(target).list_session_addresses())
+        except Exception as e:
+            print(str(e))
+    return addresses
+
+
+def scan_initiators():
+    """finds which initiators holding busy or mounted logical units are still around, from their iSCSI sessions
+    and else a TCP/ICMP probe, stamps last_seen of those that are and releases the logical units of those gone for
+    longer than LIVENESS_GRACE_SECONDS; returns (alive initiator names, released logical unit count)"""
+    targets = list(Target.objects.select_related("initiator", "node").filter(
+        initiator__isnull=False, logical_units__status__in=list(RELEASED_STATUSES)).distinct())
+    if not targets:
+        return [], 0
+    sessions = get_session_addresses(targets)
+    alive = set()
+    unknown = {}
+    for target in targets:
+        initiator = target.initiator
+        if initiator.ip_address and initiator.ip_address in sessions.get(str(target.id), []):
+            alive.add(initiator.id)
+        elif initiator.ip_address:
+            unknown[initiator.ip_address] = initiator.id
+    probed = probe_addresses(list(unknown), settings.LIVENESS_PORTS, settings.LIVENESS_TIMEOUT,
+                             settings.LIVENESS_ICMP, settings.LIVENESS_CONCURRENCY)
+    alive.update(unknown[address] for address, answered in probed.items() if answered)
+    now = timezone.now()
+    if Initiator.objects.filter(pk__in=alive).update(last_seen=now):
+        bump("initiator")
+    gone = [target.initiator.id for target in targets
+            if target.initiator.ip_address and target.initiator.id not in alive]  # without an address it can't tell
+    released = 0
+    if gone:
+        cutoff = now - timedelta(seconds=settings.LIVENESS_GRACE_SECONDS)
+        # rechecked under each logical unit's lock & when releasing, so a machine that boots meanwhile keeps its disk
+        quiet = ~(Q(target__initiator__last_initiated__gte=cutoff) | Q(target__initiator__last_seen__gte=cutoff))
+        for status, released_status in RELEASED_STATUSES.items():
+            logical_units = list(LogicalUnit.objects.select_related("target").filter(
+                quiet, target__initiator__in=gone, status=status))
+            if logical_units:  # through the transition engine, which detaches mounted ones from tgtd first
+                released += LogicalUnitViewSet.transition(logical_units, released_status, quiet)[1]
+    metrics.set_gauge("liveness.initiators_alive", len(alive))
+    metrics.set_gauge("liveness.initiators_gone", len(gone))
+    metrics.increment("liveness.logical_units_released", released)
+    return sorted(target.initiator.name for target in targets if target.initiator.id in alive), released
@@ -0,0 +1,165 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from api import metrics
+from api.caching import bump
+from api.events import record
+from api.exceptions import LockTimeoutException
+from api.models import ResourceLock, Target, TargetStatus
+
+
+class LockManager(object):
+    """Per resource locks kept in the ResourceLock table, so they hold across threads & worker processes.
+
+    A lock is a row with a unique resource key; acquiring inserts it and releasing deletes it. Locks are re-entrant
+    within a thread. Always acquire a target lock before the lock of any of its logical units to keep ordering sane.
+    While held, a heartbeat thread keeps pushing the expiry of the row out, so a lease only runs out once the
+    process holding the lock is gone, however long the locked operation takes.
+    """
+
+    _poll_interval = 0.01
+    _max_poll_interval = 0.05
+
+    def __init__(self):
+        self._local = threading.local()
+        self._leases = {}  # resource: (owner, lease) of every lock held by this process
+        self._leases_lock = threading.Lock()
+        self._heartbeat = None
+
+    def _held(self):
+        if not hasattr(self._local, "held"):
+            self._local.held = {}
+        return self._local.held
+
+    @staticmethod
+    def _try_insert(resource, owner, lease):
+        try:
+            with transaction.atomic():
+                ResourceLock.objects.create(resource=resource, owner=owner,
+                                            expires_at=timezone.now() + timedelta(seconds=lease))
+            return True
+        except IntegrityError:
+            return False
+
+    def acquire(self, resource, timeout=None, lease=None):
+        held = self._held()
+        if resource in held:
+            owner, count = held[resource]
+            held[resource] = (owner, count + 1)
+            return owner
+        timeout = settings.LOCK_TIMEOUT if timeout is None else timeout
+        lease = settings.LOCK_LEASE if lease is None else lease
+        owner = uuid.uuid4().hex
+        started = time.monotonic()
+        deadline = started + timeout
+        interval = self._poll_interval
+        contended = False
+        while not self._try_insert(resource, owner, lease):
+            if not contended:
+                contended = True
+                metrics.increment("locks.contended")
+            ResourceLock.objects.filter(resource=resource, expires_at__lt=timezone.now()).delete()
+            if time.monotonic() >= deadline:
+                metrics.increment("locks.timeouts")
+                metrics.observe("locks.wait_seconds", time.monotonic() - started)
+                raise LockTimeoutException("Timed out waiting for lock on '%s'" % resource)
+            time.sleep(interval)
+            interval = min(interval * 2, self._max_poll_interval)
+        metrics.increment("locks.acquired")
+        metrics.observe("locks.wait_seconds", time.monotonic() - started)
+        held[resource] = (owner, 1)
+        with self._leases_lock:
+            self._leases[resource] = (owner, lease)
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._renew_leases, daemon=True)
+                self._heartbeat.start()
+        return owner
+
+    def release(self, resource):
+        held = self._held()
+        if resource not in held:
+            return False
+        owner, count = held[resource]
+        if count > 1:
+            held[resource] = (owner, count - 1)
+            return True
+        del held[resource]
+        with self._leases_lock:
+            self._leases.pop(resource, None)
+        ResourceLock.objects.filter(resource=resource, owner=owner).delete()
+        return True
+
+    def _renew_leases(self):
+        """heartbeat: every third of the shortest lease extends the rows of all locks held, exits once none are"""
+        while True:
+            with self._leases_lock:
+                if not self._leases:
+                    self._heartbeat = None
+                    return
+                leases = list(self._leases.items())
+            time.sleep(max(0.01, min(lease for _, (_, lease) in leases) / 3.0))
+            try:
+                for resource, (owner, lease) in leases:
+                    ResourceLock.objects.filter(resource=resource, owner=owner).update(
+                        expires_at=timezone.now() + timedelta(seconds=lease))
+            except Exception as e:
+                print(str(e))
+            finally:
+                connections.close_all()
+
+    def is_held(self, resource):
+        return resource in self._held()
+
+    @contextmanager
+    def lock(self, resource, timeout=None, lease=None):
+        self.acquire(resource, timeout, lease)
+        try:
+            yield
+        finally:
+            self.release(resource)
+
+
+lock_manager = LockManager()
+
+
+def target_resource(target):
+    return "target:%s" % getattr(target, "pk", target)
+
+
+def logical_unit_resource(logical_unit):
+    return "logical_unit:%s" % getattr(logical_unit, "pk", logical_unit)
+
+
+@contextmanager
+def target_lock(target, timeout=None, lease=None):
+    """locks the target & marks it LOCKED for the duration, restoring the previous status afterwards"""
+    resource = target_resource(target)
+    outermost = not lock_manager.is_held(resource)
+    with lock_manager.lock(resource, timeout, lease):
+        previous_status = None
+        if outermost:
+            previous_status = Target.objects.filter(pk=target.pk).values_list("status", flat=True).first()
+            if previous_status == TargetStatus.LOCKED.value:  # left behind by an operation that never finished
+                previous_status = TargetStatus.OFFLINE.value
+            Target.objects.filter(pk=target.pk).update(status=TargetStatus.LOCKED.value)
+            record("target", target.pk, TargetStatus.LOCKED.value, previous_status)
+            bump("target")
+        try:
+            yield
+        finally:
+            # only while still LOCKED: a status set meanwhile (say by a boot) is newer than the one saved
+            if outermost and previous_status is not None and Target.objects.filter(
+                    pk=target.pk, status=TargetStatus.LOCKED.value).update(status=previous_status):
+                record("target", target.pk, previous_status, TargetStatus.LOCKED.value)
+                bump("target")
+
+
+@contextmanager
+def logical_unit_lock(logical_unit, timeout=None, lease=None):
+    with lock_manager.lock(logical_unit_resource(logical_unit), timeout, lease):
+        yield
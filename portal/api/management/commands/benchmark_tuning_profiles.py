@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.tuning import WORKLOADS, benchmark_profile, get_tuning_profile
+
+
+class Command(BaseCommand):
+    help = "Compares the I/O rates of the tuning profiles on a scratch device (an unused logical volume), whose " \
+           "contents the write workloads overwrite"
+
+    def add_arguments(self, parser):
+        parser.add_argument("device", help="scratch block device or file to benchmark")
+        parser.add_argument("--profiles", nargs="*", default=None, help="profiles to compare, all by default")
+        parser.add_argument("--workloads", nargs="*", default=None, choices=list(WORKLOADS))
+        parser.add_argument("--size", type=int, default=1024, help="MiB of the device to use")
+        parser.add_argument("--runtime", type=int, default=30, help="seconds per fio workload")
+
+    def handle(self, *args, **options):
+        profiles = options["profiles"] or list(settings.TUNING_PROFILES)
+        unknown = [name for name in profiles if name not in settings.TUNING_PROFILES]
+        if unknown:
+            raise CommandError("Unknown profiles: %s" % ", ".join(unknown))
+        self.stdout.write("%-10s %-10s %12s %10s" % ("profile", "workload", "MiB/s", "IOPS"))
+        for name in profiles:
+            results = benchmark_profile(options["device"], get_tuning_profile(name), options["workloads"],
+                                        options["size"], options["runtime"])
+            for workload, result in results.items():
+                if "error" in result:
+                    self.stdout.write("%-10s %-10s %s" % (name, workload, result["error"]))
+                else:
+                    self.stdout.write("%-10s %-10s %12.1f %10.0f" % (name, workload,
+                                                                     result["bytes_per_second"] / 1048576.0,
+                                                                     result["iops"]))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.images import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Removes chunks of the image repository no image refers to anymore"
+
+    def handle(self, *args, **options):
+        removed, freed = collect_garbage()
+        self.stdout.write("Removed %d chunks, freeing %d bytes" % (removed, freed))
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from api.snapshot_monitor import sample_snapshots
+
+
+class Command(BaseCommand):
+    help = "Samples COW fill of all snapshots, records fill rates and extends snapshots before they overflow"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=30.0, help="seconds between samples")
+        parser.add_argument("--once", action="store_true", help="take a single sample and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            extended, invalid = sample_snapshots()
+            for name in extended:
+                self.stdout.write("Extended snapshot '%s'" % name)
+            for name in invalid:
+                self.stderr.write("Snapshot '%s' overflowed and is invalid" % name)
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,38 @@
+import time
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from api.fleet import run_on_fleet
+from api.models import LogicalUnit
+from api.prewarm import describe_prewarm, prewarm_logical_unit
+
+
+class Command(BaseCommand):
+    help = "Reads the hot region of logical units into the page cache ahead of a lab session, e.g. from cron"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tag", help="only logical units with this tag")
+        parser.add_argument("--group", help="only logical units in this volume group")
+        parser.add_argument("--target", type=int, action="append", help="only logical units of this target id")
+        parser.add_argument("--at", help="wait until this local time (HH:MM) before prewarming")
+
+    def handle(self, *args, **options):
+        logical_units = LogicalUnit.objects.select_related("node")
+        if options["tag"]:
+            logical_units = logical_units.filter(tags__name=options["tag"])
+        if options["group"]:
+            logical_units = logical_units.filter(group=options["group"])
+        if options["target"]:
+            logical_units = logical_units.filter(target__in=options["target"])
+        if options["at"]:
+            try:
+                at = datetime.strptime(options["at"], "%H:%M").time()
+            except ValueError:
+                raise CommandError("--at takes a time as HH:MM")
+            now = datetime.now()
+            start = datetime.combine(now.date(), at)
+            if start < now:
+                start += timedelta(days=1)
+            time.sleep((start - now).total_seconds())
+        for result in run_on_fleet(list(logical_units.distinct()), lambda logical_unit: (
+                True, describe_prewarm(prewarm_logical_unit(logical_unit)))):
+            self.stdout.write("%s: %s (%ss)" % (result["name"], result["message"], result["seconds"]))
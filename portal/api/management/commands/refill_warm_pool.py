@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from api.warm_pool import refill
+
+
+class Command(BaseCommand):
+    help = "Pre-creates the logical volumes of the warm pool configured in WARM_POOL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=60.0, help="seconds between refills")
+        parser.add_argument("--once", action="store_true", help="refill once and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            created = refill()
+            if created:
+                self.stdout.write("Created %d pool volume(s)" % created)
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
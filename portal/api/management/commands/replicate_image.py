@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.images import dump_to_repository, get_repository
+from api.locks import logical_unit_lock
+from api.models import LogicalUnit
+from helpers.imagestore.replication import ReplicationException, replicate
+
+
+class Command(BaseCommand):
+    help = "Copies an image (or a logical unit, dumped as that image first) to a peer's image repository, sending " \
+           "only the chunks the peer lacks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("image", help="name of the image")
+        parser.add_argument("peer", help="host[:port] of a peer running serve_replication")
+        parser.add_argument("--logical-unit", default=None, help="dump this logical unit as the image first")
+        parser.add_argument("--workers", type=int, default=settings.REPLICATION_WORKERS,
+                            help="chunks sent concurrently")
+        parser.add_argument("--bandwidth", type=float, default=settings.REPLICATION_BYTES_PER_SECOND,
+                            help="cap on bytes sent per second, all workers together")
+        parser.add_argument("--token", default=settings.REPLICATION_TOKEN)
+        parser.add_argument("--repository", default=None, help="image repository directory to send from")
+
+    def handle(self, *args, **options):
+        repository = get_repository(options["repository"])
+        if options["logical_unit"]:
+            logical_unit = LogicalUnit.objects.get(name=options["logical_unit"])
+            with logical_unit_lock(logical_unit):
+                image, message = dump_to_repository(logical_unit, options["image"], repository=repository)
+            if not image:
+                raise CommandError(message)
+            self.stdout.write(message)
+        host, _, port = options["peer"].partition(":")
+        try:
+            stats = replicate(repository, options["image"], host, int(port or settings.REPLICATION_PORT),
+                              options["token"], options["workers"], options["bandwidth"])
+        except (OSError, ReplicationException) as e:
+            raise CommandError("Replication of '%s' failed: %s" % (options["image"], e))
+        if stats["up_to_date"]:
+            self.stdout.write("Image '%s' is already up to date on %s" % (options["image"], options["peer"]))
+        else:
+            self.stdout.write("Sent %d of %d chunks (%d bytes) of '%s' to %s in %.1f seconds" % (
+                stats["sent_chunks"], stats["chunks"], stats["sent_bytes"], options["image"], options["peer"],
+                stats["seconds"]))
@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from api.locks import target_lock
+from api.models import Target
+from api.shards import get_iscsi_target
+from api.views import LogicalUnitViewSet
+from helpers.lvm2.entities import DiskStatus as LogicalUnitStatus
+
+
+def restore_target(target):
+    """re-creates the target, its binding and its online/busy logical units in tgtd; returns (attached, failed)"""
+    attached, failed = [], []
+    with target_lock(target):
+        iscsi_target = get_iscsi_target(target)
+        if not iscsi_target.exists() and not iscsi_target.add():
+            return attached, [logical_unit.name for logical_unit in target.logical_units.all()]
+        iscsi_target.bind_to_initiator()
+        active_logical_units = iscsi_target.list_active_logical_units()
+        logical_units = target.logical_units.filter(
+            status__in=[LogicalUnitStatus.ONLINE.value, LogicalUnitStatus.BUSY.value])
+        for logical_unit in logical_units:
+            if str(logical_unit.id) in active_logical_units or LogicalUnitViewSet.attach_to_target(logical_unit):
+                attached.append(logical_unit.name)
+            else:
+                failed.append(logical_unit.name)
+    return attached, failed
+
+
+def _restore_target(target):
+    try:
+        return restore_target(target)
+    except Exception as e:
+        print(str(e))
+        return [], [logical_unit.name for logical_unit in target.logical_units.all()]
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Rebuilds all targets, initiator bindings and online/busy logical units in tgtd after it was restarted"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16, help="number of targets restored in parallel")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        targets = list(Target.objects.all())
+        failures = 0
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as executor:
+            for target, (attached, failed) in zip(targets, executor.map(_restore_target, targets)):
+                failures += len(failed)
+                self.stdout.write("%s: attached [%s]%s" % (target.name, ", ".join(attached),
+                                                           " failed [%s]" % ", ".join(failed) if failed else ""))
+        self.stdout.write("Restored %d target(s) in %.2f seconds, %d logical unit(s) failed" %
+                          (len(targets), time.monotonic() - started, failures))
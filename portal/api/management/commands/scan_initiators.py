@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from api.liveness import scan_initiators
+
+
+class Command(BaseCommand):
+    help = "Probes initiators holding busy or mounted logical units and releases those of machines that are gone"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=30.0, help="seconds between scans")
+        parser.add_argument("--once", action="store_true", help="scan once and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            alive, released = scan_initiators()
+            if released:
+                self.stdout.write("Released %d logical units, %d initiators alive" % (released, len(alive)))
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
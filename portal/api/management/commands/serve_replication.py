@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from api.images import register_manifest
+from helpers.imagestore.replication import serve
+
+
+def on_manifest(manifest):
+    try:
+        register_manifest(manifest, "replication")
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Receives images replicated by other portal nodes into the image repository"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="address to listen on, 0.0.0.0 for all")
+        parser.add_argument("--port", type=int, default=settings.REPLICATION_PORT)
+        parser.add_argument("--token", default=settings.REPLICATION_TOKEN, help="shared secret senders must present")
+        parser.add_argument("--repository", default=settings.IMAGE_REPOSITORY_PATH, help="image repository directory")
+        parser.add_argument("--insecure", action="store_true", help="accept images from anyone, without a token")
+
+    def handle(self, *args, **options):
+        if not options["token"] and not options["insecure"]:
+            raise CommandError("Set REPLICATION_TOKEN or pass --token, or --insecure to accept images from anyone")
+        self.stdout.write("Receiving images into '%s' on port %d" % (options["repository"], options["port"]))
+        serve(options["repository"], options["host"], options["port"], options["token"], settings.IMAGE_CHUNK_SIZE,
+              on_manifest, options["insecure"])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.shards import get_shards, get_daemon
+
+
+class Command(BaseCommand):
+    help = "Starts every tgtd instance configured in TGTD_SHARDS that is not already running"
+
+    def handle(self, *args, **options):
+        for shard in range(len(get_shards())):
+            daemon = get_daemon(shard)
+            running = daemon.start()
+            self.stdout.write("shard %d (control port %d, portal %s): %s" % (
+                shard, daemon.get_control_port(), daemon.get_portal(), "running" if running else "failed to start"))
@@ -0,0 +1,45 @@
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_collectors = []
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, value):
+    """records a sample as <name>.count, <name>.sum & <name>.max"""
+    with _lock:
+        _counters[name + ".count"] = _counters.get(name + ".count", 0) + 1
+        _counters[name + ".sum"] = _counters.get(name + ".sum", 0) + value
+        if value > _gauges.get(name + ".max", 0):
+            _gauges[name + ".max"] = value
+
+
+def register_collector(collector):
+    """collector is a callable returning a dict of metric names & values, evaluated on every snapshot"""
+    with _lock:
+        if collector not in _collectors:
+            _collectors.append(collector)
+
+
+def snapshot():
+    with _lock:
+        values = dict(_counters)
+        values.update(_gauges)
+        collectors = list(_collectors)
+    for collector in collectors:
+        try:
+            values.update(collector())
+        except Exception as e:
+            print(str(e))
+    return values
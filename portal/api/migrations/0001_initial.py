@@ -0,0 +1,219 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+                ('changed', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('status', models.CharField(max_length=1)),
+                ('previous_status', models.CharField(blank=True, max_length=1, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Image',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, max_length=64, null=True)),
+                ('chunk_count', models.PositiveIntegerField(default=0)),
+                ('new_bytes', models.BigIntegerField(default=0)),
+                ('source', models.CharField(blank=True, max_length=100, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Initiator',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mac_address', models.CharField(max_length=17, unique=True)),
+                ('name', models.CharField(max_length=20, unique=True)),
+                ('mode', models.CharField(choices=[('A', 'AUTOMATIC'), ('M', 'MANUAL')], default='A', max_length=1)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True, unpack_ipv4=True)),
+                ('pdu_device_port', models.PositiveSmallIntegerField(default=0)),
+                ('kvm_device_port', models.PositiveSmallIntegerField(default=0)),
+                ('last_initiated', models.DateTimeField(null=True)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=30)),
+                ('status', models.CharField(choices=[('F', 'FAILED'), ('P', 'PENDING'), ('R', 'RUNNING'), ('S', 'SUCCEEDED')], default='P', max_length=1)),
+                ('message', models.TextField(blank=True, null=True)),
+                ('result', models.TextField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='KVM',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('ip_address', models.GenericIPAddressField(unique=True, unpack_ipv4=True)),
+                ('mac_address', models.CharField(blank=True, max_length=17, null=True, unique=True)),
+                ('total_ports', models.PositiveSmallIntegerField(default=0)),
+                ('model', models.CharField(blank=True, max_length=100, null=True)),
+                ('serial', models.CharField(blank=True, max_length=100, null=True)),
+                ('username', models.CharField(blank=True, max_length=100, null=True)),
+                ('password', models.CharField(blank=True, max_length=100, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LogicalUnit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('vendor_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('product_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('product_rev', models.CharField(blank=True, max_length=50, null=True)),
+                ('group', models.CharField(max_length=20)),
+                ('size_in_gb', models.FloatField(default=20.0)),
+                ('use', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('2', 'BUSY'), ('3', 'MODIFIED'), ('4', 'MOUNTED'), ('0', 'OFFLINE'), ('1', 'ONLINE')], default='0', max_length=1)),
+                ('boot_count', models.PositiveSmallIntegerField(default=0)),
+                ('tuning_profile', models.CharField(default='default', max_length=20)),
+                ('cache_mode', models.CharField(blank=True, choices=[('writethrough', 'writethrough'), ('writeback', 'writeback')], max_length=12, null=True)),
+                ('cache_size_in_gb', models.FloatField(blank=True, null=True)),
+                ('placement', models.CharField(choices=[('linear', 'linear'), ('pinned', 'pinned'), ('striped', 'striped')], default='linear', max_length=10)),
+                ('stripes', models.PositiveSmallIntegerField(default=1)),
+                ('stripe_size_in_kb', models.PositiveIntegerField(blank=True, null=True)),
+                ('prewarm_size_in_gb', models.FloatField(blank=True, null=True)),
+                ('hot_ranges', models.TextField(blank=True, null=True)),
+                ('uploaded_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('last_attached', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PDU',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('ip_address', models.GenericIPAddressField(unique=True, unpack_ipv4=True)),
+                ('mac_address', models.CharField(blank=True, max_length=17, null=True, unique=True)),
+                ('total_outlets', models.PositiveSmallIntegerField(default=0)),
+                ('driver', models.CharField(choices=[('http', 'http'), ('snmp', 'snmp')], default='http', max_length=10)),
+                ('port', models.PositiveIntegerField(blank=True, null=True)),
+                ('model', models.CharField(blank=True, max_length=100, null=True)),
+                ('serial', models.CharField(blank=True, max_length=100, null=True)),
+                ('username', models.CharField(blank=True, max_length=100, null=True)),
+                ('password', models.CharField(blank=True, max_length=100, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResourceLock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=100, unique=True)),
+                ('owner', models.CharField(max_length=32)),
+                ('acquired_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StorageNode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('agent_url', models.URLField(unique=True)),
+                ('iscsi_address', models.GenericIPAddressField(unpack_ipv4=True)),
+                ('nic_speed_mbps', models.PositiveIntegerField(default=1000)),
+                ('active', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Target',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('boot', models.BooleanField(default=False)),
+                ('active', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('2', 'LOCKED'), ('0', 'OFFLINE'), ('1', 'ONLINE')], default='0', max_length=1)),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('portal', models.GenericIPAddressField(blank=True, null=True, unpack_ipv4=True)),
+                ('initiator', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='target', to='api.Initiator')),
+                ('node', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='targets', to='api.StorageNode')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Snapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('size_in_gb', models.FloatField(default=5.0)),
+                ('active', models.BooleanField(default=False)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('used_percent', models.FloatField(blank=True, null=True)),
+                ('peak_used_in_gb', models.FloatField(default=0.0)),
+                ('fill_rate_in_gb_per_hour', models.FloatField(blank=True, null=True)),
+                ('last_sampled', models.DateTimeField(blank=True, null=True)),
+                ('logical_unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='api.LogicalUnit')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='logicalunit',
+            name='node',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='logical_units', to='api.StorageNode'),
+        ),
+        migrations.AddField(
+            model_name='logicalunit',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='logical_units', to='api.Tag'),
+        ),
+        migrations.AddField(
+            model_name='logicalunit',
+            name='target',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logical_units', to='api.Target'),
+        ),
+        migrations.AddField(
+            model_name='initiator',
+            name='kvm_device',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='port_endpoint', to='api.KVM'),
+        ),
+        migrations.AddField(
+            model_name='initiator',
+            name='pdu_device',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outlet_endpoint', to='api.PDU'),
+        ),
+        migrations.AddField(
+            model_name='initiator',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='initiators', to='api.Tag'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 import inspect
+import re
 from enum import Enum, unique
 from django.db import models
 from helpers.lvm2.entities import VolumeGroup
@@ -10,6 +11,8 @@ class PDU(models.Model):
     ip_address = models.GenericIPAddressField(protocol="both", unpack_ipv4=True, blank=False, null=False, unique=True)
     mac_address = models.CharField(max_length=17, null=True, blank=True, unique=True)
     total_outlets = models.PositiveSmallIntegerField(default=0)
+    driver = models.CharField(max_length=10, choices=(("http", "http"), ("snmp", "snmp")), default="http")
+    port = models.PositiveIntegerField(null=True, blank=True)
     model = models.CharField(max_length=100, null=True, blank=True)
     serial = models.CharField(max_length=100, null=True, blank=True)
     username = models.CharField(max_length=100, null=True, blank=True)
@@ -33,6 +36,25 @@ class KVM(models.Model):
         return self.name + " [has IP '" + self.ip_address + "']"
 
 
+def normalize_mac_address(mac_address):
+    """lowercase colon separated form of a MAC address written with colons, dashes, dots or nothing in between,
+    None if it is not one"""
+    digits = re.sub(r"[^0-9a-fA-F]", "", mac_address or "")
+    if len(digits) != 12:
+        return None
+    return ":".join(digits[i:i+2] for i in range(0, 12, 2)).lower()
+
+
+def mac_address_variants(mac_address):
+    """the forms a MAC address may have been stored in before addresses were normalized on save"""
+    mac_address = normalize_mac_address(mac_address)
+    if not mac_address:
+        return []
+    digits = mac_address.replace(":", "")
+    forms = [mac_address, mac_address.replace(":", "-"), digits]
+    return forms + [form.upper() for form in forms]
+
+
 @unique
 class InitiatorMode(Enum):
     AUTOMATIC = "A"
@@ -59,11 +81,36 @@ class Initiator(models.Model):
                                    related_name="port_endpoint")
     kvm_device_port = models.PositiveSmallIntegerField(default=0)
     last_initiated = models.DateTimeField(null=True, blank=False)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    tags = models.ManyToManyField("Tag", blank=True, related_name="initiators")
+
+    def save(self, *args, **kwargs):
+        self.mac_address = normalize_mac_address(self.mac_address) or self.mac_address
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name + " [has MAC address '" + self.mac_address + "']"
 
 
+class Tag(models.Model):
+    name = models.CharField(max_length=50, null=False, blank=False, unique=True)
+    description = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return self.name
+
+
+class StorageNode(models.Model):
+    name = models.CharField(max_length=50, null=False, blank=False, unique=True)
+    agent_url = models.URLField(max_length=200, null=False, blank=False, unique=True)
+    iscsi_address = models.GenericIPAddressField(protocol="both", unpack_ipv4=True, blank=False, null=False)
+    nic_speed_mbps = models.PositiveIntegerField(default=1000)
+    active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name + " [has agent '" + self.agent_url + "']"
+
+
 @unique
 class TargetStatus(Enum):
     OFFLINE = "0"
@@ -84,6 +131,9 @@ class Target(models.Model):
     active = models.BooleanField(default=False)
     status = models.CharField(max_length=1, choices=TargetStatus.choices(), default=str(TargetStatus.OFFLINE.value))
     initiator = models.OneToOneField(Initiator, on_delete=models.SET_NULL, null=True, blank=False, related_name="target")
+    shard = models.PositiveSmallIntegerField(default=0)
+    node = models.ForeignKey(StorageNode, on_delete=models.PROTECT, null=True, blank=True, related_name="targets")
+    portal = models.GenericIPAddressField(protocol="both", unpack_ipv4=True, blank=True, null=True)
 
     def __str__(self):
         if self.initiator:
@@ -103,8 +153,22 @@ class LogicalUnit(models.Model):
     use = models.BooleanField(default=True, null=False, blank=False)
     status = models.CharField(max_length=1, choices=LogicalUnitStatus.choices(), default=LogicalUnitStatus.OFFLINE.value)
     boot_count = models.PositiveSmallIntegerField(default=0, blank=False, null=False)
+    tuning_profile = models.CharField(max_length=20, default="default", null=False, blank=False)
+    cache_mode = models.CharField(max_length=12, choices=(("writethrough", "writethrough"),
+                                                          ("writeback", "writeback")), null=True, blank=True)
+    cache_size_in_gb = models.FloatField(null=True, blank=True)
+    placement = models.CharField(max_length=10, choices=(("linear", "linear"), ("pinned", "pinned"),
+                                                         ("striped", "striped")), default="linear")
+    stripes = models.PositiveSmallIntegerField(default=1)
+    stripe_size_in_kb = models.PositiveIntegerField(null=True, blank=True)
+    prewarm_size_in_gb = models.FloatField(null=True, blank=True)
+    hot_ranges = models.TextField(null=True, blank=True)  # JSON [[offset, length], ...] in bytes, read at boot
+    uploaded_bytes = models.BigIntegerField(null=True, blank=True)  # bytes durably written by an unfinished upload
     last_attached = models.DateTimeField(null=True)
     target = models.ForeignKey(Target, on_delete=models.SET_NULL, null=True, blank=False, related_name="logical_units")
+    node = models.ForeignKey(StorageNode, on_delete=models.PROTECT, null=True, blank=True,
+                             related_name="logical_units")
+    tags = models.ManyToManyField(Tag, blank=True, related_name="logical_units")
 
     def __str__(self):
         return self.name
@@ -115,8 +179,87 @@ class Snapshot(models.Model):
     size_in_gb = models.FloatField(default=5.0)
     active = models.BooleanField(default=False)
     description = models.TextField(blank=True, null=True)
+    used_percent = models.FloatField(null=True, blank=True)
+    peak_used_in_gb = models.FloatField(default=0.0)
+    fill_rate_in_gb_per_hour = models.FloatField(null=True, blank=True)
+    last_sampled = models.DateTimeField(null=True, blank=True)
     logical_unit = models.ForeignKey(LogicalUnit, on_delete=models.CASCADE, null=False, blank=False,
                                      related_name="snapshots")
 
     def __str__(self):
         return self.name + " [is snapshot of '" + self.logical_unit.name + "']"
+
+
+class ResourceLock(models.Model):
+    resource = models.CharField(max_length=100, null=False, blank=False, unique=True)
+    owner = models.CharField(max_length=32, null=False, blank=False)
+    acquired_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=False, blank=False)
+
+    def __str__(self):
+        return self.resource + " [is held by '" + self.owner + "']"
+
+
+@unique
+class JobStatus(Enum):
+    PENDING = "P"
+    RUNNING = "R"
+    SUCCEEDED = "S"
+    FAILED = "F"
+
+    @classmethod
+    def choices(cls):
+        members = inspect.getmembers(cls, lambda member: not (inspect.isroutine(member)))
+        properties = [member for member in members if member[0][:2] != '__' and member[0] not in ['name', 'value']]
+        choices = tuple([(str(property[1].value), property[0]) for property in properties])
+        return choices
+
+
+class Job(models.Model):
+    kind = models.CharField(max_length=30, null=False, blank=False)
+    status = models.CharField(max_length=1, choices=JobStatus.choices(), default=JobStatus.PENDING.value)
+    message = models.TextField(blank=True, null=True)
+    result = models.TextField(blank=True, null=True)  # JSON
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.kind + " [job " + str(self.id) + " is '" + JobStatus(self.status).name + "']"
+
+
+class Image(models.Model):
+    """a disk image in the content addressed repository at IMAGE_REPOSITORY_PATH, which holds its manifest & chunks"""
+    name = models.CharField(max_length=100, null=False, blank=False, unique=True)
+    description = models.TextField(null=True, blank=True)
+    size = models.BigIntegerField(default=0)  # bytes
+    sha256 = models.CharField(max_length=64, null=True, blank=True)
+    chunk_count = models.PositiveIntegerField(default=0)
+    new_bytes = models.BigIntegerField(default=0)  # bytes of chunks no other image had when this one was stored
+    source = models.CharField(max_length=100, null=True, blank=True)  # logical unit it was dumped from
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name + " [image of " + str(self.size) + " bytes]"
+
+
+class ChangeEvent(models.Model):
+    """a status change of a logical unit, target or job; the id is the sequence number clients resume from"""
+    model = models.CharField(max_length=20, null=False, blank=False)
+    object_id = models.PositiveIntegerField()
+    status = models.CharField(max_length=1, null=False, blank=False)
+    previous_status = models.CharField(max_length=1, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "%s %s: %s -> %s" % (self.model, self.object_id, self.previous_status, self.status)
+
+
+class ChangeCounter(models.Model):
+    """bumped whenever rows of a model (or storage state, as "storage") change; read endpoints derive ETags from it"""
+    name = models.CharField(max_length=30, null=False, blank=False, unique=True)
+    version = models.BigIntegerField(default=0)
+    changed = models.DateTimeField(null=False, blank=False)
+
+    def __str__(self):
+        return "%s [is at version %d]" % (self.name, self.version)
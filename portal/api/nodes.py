@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db.models import Count
+from api.models import StorageNode, LogicalUnit
+from helpers.agent import stats
+from helpers.agent.client import AgentClient, RemoteEntity
+from helpers.lvm2.entities import VolumeGroup
+from helpers.lvm2.entities import DiskStatus as LogicalUnitStatus
+
+_clients = {}
+_stats = {}  # node id (None for this server): (time fetched, stats)
+_stats_lock = threading.Lock()
+
+# logical units in these states are attached to tgtd & may carry initiator traffic
+ATTACHED_STATUSES = [LogicalUnitStatus.ONLINE.value, LogicalUnitStatus.BUSY.value, LogicalUnitStatus.MOUNTED.value]
+
+
+def get_client(node):
+    if node.agent_url not in _clients:
+        _clients[node.agent_url] = AgentClient(node.agent_url, settings.STORAGE_AGENT_TOKEN)
+    return _clients[node.agent_url]
+
+
+def get_volume_group(group, node=None):
+    """the volume group on the given storage node, None meaning this portal server"""
+    if node is None:
+        return VolumeGroup(group)
+    return RemoteEntity(get_client(node), "VolumeGroup", group)
+
+
+def get_node_stats(node=None):
+    """stats of a storage node, reused for NODE_STATS_CACHE_SECONDS as collecting them takes a sampling interval"""
+    key = node.id if node else None
+    with _stats_lock:
+        cached = _stats.get(key)
+    if cached and time.monotonic() - cached[0] < settings.NODE_STATS_CACHE_SECONDS:
+        return cached[1]
+    node_stats = stats.collect() if node is None else get_client(node).stats()
+    with _stats_lock:
+        _stats[key] = (time.monotonic(), node_stats)
+    return node_stats
+
+
+def _score(node, node_stats, group, size_in_gb, attached):
+    free = (node_stats.get("volume_groups") or {}).get(group)
+    if free is None or free < size_in_gb:
+        return None
+    nic_speed = (node.nic_speed_mbps if node else settings.LOCAL_NIC_SPEED_MBPS) * 1000 * 1000 / 8
+    nic_load = sum((node_stats.get("nic_bytes_per_second") or {}).values()) / max(nic_speed, 1)
+    return attached * settings.PLACEMENT_LUN_WEIGHT + nic_load * settings.PLACEMENT_NIC_WEIGHT - free / 1024.0
+
+
+def schedule_node(group, size_in_gb):
+    """picks the storage node (None for this server) for a new logical unit from free space in its volume group,
+    logical units currently attached there & NIC load; returns (found, node)"""
+    nodes = [None] if settings.PLACEMENT_INCLUDE_LOCAL else []
+    nodes.extend(StorageNode.objects.filter(active=True))
+    if not nodes:
+        return False, None
+    if len(nodes) == 1:  # nothing to choose from, lvcreate tells whether it fits
+        return True, nodes[0]
+    attached = dict((row["node"], row["count"]) for row in LogicalUnit.objects.filter(
+        status__in=ATTACHED_STATUSES).values("node").annotate(count=Count("id")))
+
+    def fetch(node):
+        try:
+            return get_node_stats(node)
+        except Exception as e:
+            print(str(e))
+            return {}
+
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        node_stats = list(executor.map(fetch, nodes))
+    scored = []
+    for node, single_stats in zip(nodes, node_stats):
+        score = _score(node, single_stats, group, size_in_gb, attached.get(node.id if node else None, 0))
+        if score is not None:
+            scored.append((score, node.id if node else 0, node))
+    if not scored:
+        return False, None
+    return True, min(scored, key=lambda item: item[:2])[2]
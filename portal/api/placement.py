@@ -0,0 +1,44 @@
+from django.conf import settings
+from api.nodes import get_node_stats, get_volume_group
+
+PLACEMENTS = ("linear", "pinned", "striped")
+
+
+def _load(physical_volume):
+    """bytes per second a PV is busy with, each I/O costing a seek worth of extra bytes on spinning disks"""
+    return (physical_volume.get("bytes_per_second") or 0.0) + \
+        (physical_volume.get("iops") or 0.0) * settings.PLACEMENT_IO_COST_BYTES
+
+
+def choose_physical_volumes(group, size_in_gb, count=1, node=None):
+    """the `count` least loaded PVs of the volume group each with room for its share of the LV, most free space
+    breaking ties; None when too few PVs have room"""
+    physical_volumes = (get_node_stats(node).get("physical_volumes") or {}).get(group) or {}
+    share = size_in_gb / count
+    candidates = sorted((_load(physical_volume), -physical_volume["free"], path)
+                        for path, physical_volume in physical_volumes.items() if physical_volume["free"] >= share)
+    if len(candidates) < count:
+        return None
+    return [path for (_, _, path) in candidates[:count]]
+
+
+def create_placed_logical_volume(group, lv_name, size, unit="GiB", placement="linear", stripes=1,
+                                 stripe_size_in_kb=None, node=None):
+    """creates the LV laid out as asked: linear leaves allocation to lvm2, pinned puts it on the least loaded PV and
+    striped spreads it over the `stripes` least loaded PVs; returns (result, message)"""
+    volume_group = get_volume_group(group, node)
+    if placement == "linear":
+        if volume_group.create_logical_volume(lv_name, size, unit):
+            return True, "Created"
+        return False, "Logical volume could not be created"
+    count = stripes if placement == "striped" else 1
+    if count < 2 and placement == "striped":
+        return False, "Striping needs at least 2 stripes"
+    size_in_gb = size / 1024.0 if unit == "MiB" else size
+    physical_volumes = choose_physical_volumes(group, size_in_gb, count, node)
+    if not physical_volumes:
+        return False, "Not enough physical volumes with %s GiB free in volume group" % round(size_in_gb / count, 2)
+    if volume_group.create_logical_volume(lv_name, size, unit, count if count > 1 else None, stripe_size_in_kb,
+                                          physical_volumes):
+        return True, "Created on %s" % ", ".join(physical_volumes)
+    return False, "Logical volume could not be created on %s" % ", ".join(physical_volumes)
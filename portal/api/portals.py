@@ -0,0 +1,34 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from api.models import Target
+from api.shards import get_shards, get_iscsi_target
+
+
+def get_portals(target):
+    """addresses (one per NIC) the initiator of this target may connect to"""
+    if target.node_id:
+        return [target.node.iscsi_address]
+    shards = get_shards()
+    config = shards[target.shard] if target.shard < len(shards) else shards[0]
+    if config.get("portals"):
+        return list(config["portals"])
+    return [settings.ISCSI_PORTAL_ADDRESS] if settings.ISCSI_PORTAL_ADDRESS else []
+
+
+def choose_portal(target):
+    """the least loaded portal by iSCSI session count; targets handed a portal moments ago that have not logged in yet
+    count as one session so a boot storm does not pile onto the same NIC"""
+    portals = get_portals(target)
+    if len(portals) <= 1:
+        return portals[0] if portals else None
+    sessions = get_iscsi_target(target).count_sessions()
+    pending_since = timezone.now() - timedelta(seconds=settings.PORTAL_PENDING_SECONDS)
+    load = dict((portal, 0) for portal in portals)
+    others = Target.objects.filter(node=None, shard=target.shard, portal__in=portals).exclude(pk=target.pk)
+    for other_id, portal, last_initiated in others.values_list("id", "portal", "initiator__last_initiated"):
+        count = sessions.get(str(other_id), 0)
+        if not count and last_initiated and last_initiated >= pending_since:
+            count = 1
+        load[portal] += count
+    return min(portals, key=lambda portal: (load[portal], portals.index(portal)))
@@ -0,0 +1,113 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+from api import metrics
+from helpers.power.drivers import PowerException, get_driver
+
+ACTIONS = ("on", "off", "cycle")
+
+_drivers = {}
+_drivers_lock = threading.Lock()
+
+
+def get_pdu_driver(pdu):
+    """driver of the PDU, kept across requests so its pooled connections are reused; rebuilt when the PDU changes"""
+    key = (pdu.driver, pdu.ip_address, pdu.port, pdu.username, pdu.password)
+    with _drivers_lock:
+        cached = _drivers.get(pdu.id)
+        if cached is None or cached[0] != key:
+            if cached is not None:
+                cached[1].close()
+            cached = (key, get_driver(pdu.driver, pdu.ip_address, pdu.port, pdu.username, pdu.password))
+            _drivers[pdu.id] = cached
+        return cached[1]
+
+
+class Stagger(object):
+    """hands out power-on slots at no more than `rate` per second, so a lab doesn't draw its inrush current and
+    hit the boot portal all at once"""
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def power_initiators(initiators, action, rate=None, off_seconds=None):
+    """switches the PDU outlets of the initiators on, off or off & on again, concurrently with at most
+    POWER_PDU_CONCURRENCY requests per PDU and power-ons staggered to `rate` per second; returns per initiator
+    results & timings"""
+    if action not in ACTIONS:
+        raise PowerException("Action must be one of %s" % ", ".join(ACTIONS))
+    if not initiators:
+        return []
+    stagger = Stagger(settings.BOOTS_PER_SECOND if rate is None else rate)
+    off_seconds = settings.POWER_CYCLE_OFF_SECONDS if off_seconds is None else off_seconds
+    semaphores = {}
+    for initiator in initiators:
+        if initiator.pdu_device_id:
+            semaphores.setdefault(initiator.pdu_device_id, threading.BoundedSemaphore(settings.POWER_PDU_CONCURRENCY))
+
+    def switch(initiator, state):
+        driver = get_pdu_driver(initiator.pdu_device)
+        with semaphores[initiator.pdu_device_id]:
+            if state == "on":
+                result = driver.power_on(initiator.pdu_device_port)
+            else:
+                result = driver.power_off(initiator.pdu_device_port)
+        metrics.increment("power.%s" % state if result else "power.failures")
+        return result
+
+    def run(initiator):
+        started = time.monotonic()
+        try:
+            if not initiator.pdu_device_id or not initiator.pdu_device_port:
+                result, message = False, "No PDU outlet configured"
+            elif action != "on" and not switch(initiator, "off"):
+                result, message = False, "PDU refused to power off"
+            else:
+                if action == "cycle":
+                    time.sleep(off_seconds)
+                if action != "off":
+                    stagger.wait()
+                    result = switch(initiator, "on")
+                    message = "Powered on" if result else "PDU refused to power on"
+                else:
+                    result, message = True, "Powered off"
+        except PowerException as e:
+            metrics.increment("power.failures")
+            result, message = False, str(e)
+        finally:
+            connections.close_all()
+        return {"initiator": initiator.id, "name": initiator.name, "result": result, "message": message,
+                "seconds": round(time.monotonic() - started, 3)}
+
+    with ThreadPoolExecutor(max_workers=min(settings.POWER_MAX_WORKERS, len(initiators))) as executor:
+        return list(executor.map(run, initiators))
+
+
+def get_outlet_states(pdu, outlets):
+    """{outlet: True (on), False (off) or None (unknown)} read concurrently"""
+    driver = get_pdu_driver(pdu)
+
+    def state(outlet):
+        try:
+            return driver.get_state(outlet)
+        except PowerException as e:
+            print(str(e))
+            return None
+
+    if not outlets:
+        return {}
+    with ThreadPoolExecutor(max_workers=settings.POWER_PDU_CONCURRENCY) as executor:
+        return dict(zip(outlets, executor.map(state, outlets)))
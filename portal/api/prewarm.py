@@ -0,0 +1,56 @@
+import json
+import time
+from django.conf import settings
+from api import metrics
+from api.locks import logical_unit_lock
+from api.nodes import get_client
+from helpers.agent.client import RemoteEntity
+from helpers.lvm2.entities import LogicalVolume
+
+GIB = 1024 * 1024 * 1024
+
+
+def served_volume(logical_unit):
+    """the device initiators read: the active snapshot when there is one (its page cache is separate from that of
+    the origin), otherwise the logical volume itself"""
+    snapshot = logical_unit.snapshots.filter(active=True).first()
+    path = "/dev/%s/%s" % (logical_unit.group, snapshot.name if snapshot else logical_unit.name)
+    if logical_unit.node is None:
+        return LogicalVolume(path)
+    return RemoteEntity(get_client(logical_unit.node), "LogicalVolume", path)
+
+
+def get_hot_ranges(logical_unit):
+    """byte ranges recorded after a previous boot, else the first PREWARM_DEFAULT_GB (or the LU's own size)"""
+    if logical_unit.hot_ranges:
+        return json.loads(logical_unit.hot_ranges)
+    size_in_gb = logical_unit.prewarm_size_in_gb or settings.PREWARM_DEFAULT_GB
+    return [[0, int(size_in_gb * GIB)]]
+
+
+def record_hot_ranges(logical_unit):
+    """remembers what is cached right after a boot, i.e. what the OS read, as the region to prewarm next time"""
+    ranges = served_volume(logical_unit).get_resident_ranges()
+    logical_unit.hot_ranges = json.dumps(ranges)
+    logical_unit.save(update_fields=["hot_ranges"])
+    return True, "Recorded %d bytes in %d ranges" % (sum(length for _, length in ranges), len(ranges))
+
+
+def prewarm_logical_unit(logical_unit):
+    """reads the hot region into the page cache, under the logical unit lock so a revert cannot swap the device
+    underneath; returns bytes read, bytes of the region resident afterwards & bytes wanted"""
+    started = time.monotonic()
+    with logical_unit_lock(logical_unit):
+        ranges = get_hot_ranges(logical_unit)
+        volume = served_volume(logical_unit)
+        read = volume.prewarm(ranges, settings.PREWARM_WORKERS)
+        resident = volume.get_resident_bytes(ranges)
+    seconds = time.monotonic() - started
+    metrics.increment("prewarm.bytes_read", read)
+    metrics.observe("prewarm.seconds", seconds)
+    return {"bytes_read": read, "bytes_resident": resident, "bytes_wanted": sum(length for _, length in ranges),
+            "seconds": round(seconds, 3)}
+
+
+def describe_prewarm(stats):
+    return "Read %(bytes_read)d bytes, %(bytes_resident)d of %(bytes_wanted)d bytes resident" % stats
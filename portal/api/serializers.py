@@ -1,5 +1,18 @@
+from django.conf import settings
 from rest_framework import serializers
-from api.models import PDU, KVM, Initiator, Target, LogicalUnit, Snapshot
+from rest_framework.validators import UniqueValidator
+from api.models import PDU, KVM, Initiator, Tag, StorageNode, Target, LogicalUnit, Snapshot, Job, Image, \
+    normalize_mac_address
+
+
+class MACAddressField(serializers.CharField):
+    """accepts colons, dashes, dots or no separators and stores the normalized form, before the unique check runs"""
+
+    def to_internal_value(self, data):
+        mac_address = normalize_mac_address(super().to_internal_value(data))
+        if not mac_address:
+            raise serializers.ValidationError("Enter a valid MAC address")
+        return mac_address
 
 
 class PDUSerializer(serializers.HyperlinkedModelSerializer):
@@ -20,12 +33,31 @@ class KVMSerializer(serializers.HyperlinkedModelSerializer):
 
 class InitiatorSerializer(serializers.HyperlinkedModelSerializer):
     target = serializers.HyperlinkedRelatedField(many=False, read_only=True, view_name="target-detail")
+    mac_address = MACAddressField(max_length=17, validators=[UniqueValidator(queryset=Initiator.objects.all())])
 
     class Meta:
         model = Initiator
         fields = '__all__'
 
 
+class TagSerializer(serializers.HyperlinkedModelSerializer):
+    logical_units = serializers.HyperlinkedRelatedField(many=True, read_only=True, view_name="logicalunit-detail")
+    initiators = serializers.HyperlinkedRelatedField(many=True, read_only=True, view_name="initiator-detail")
+
+    class Meta:
+        model = Tag
+        fields = '__all__'
+
+
+class StorageNodeSerializer(serializers.HyperlinkedModelSerializer):
+    targets = serializers.HyperlinkedRelatedField(many=True, read_only=True, view_name="target-detail")
+    logical_units = serializers.HyperlinkedRelatedField(many=True, read_only=True, view_name="logicalunit-detail")
+
+    class Meta:
+        model = StorageNode
+        fields = '__all__'
+
+
 class TargetSerializer(serializers.HyperlinkedModelSerializer):
     logical_units = serializers.HyperlinkedRelatedField(many=True, read_only=True, view_name="logicalunit-detail")
 
@@ -41,8 +73,25 @@ class LogicalUnitSerializer(serializers.HyperlinkedModelSerializer):
         model = LogicalUnit
         fields = '__all__'
 
+    def validate_tuning_profile(self, value):
+        if value not in settings.TUNING_PROFILES:
+            raise serializers.ValidationError("No tuning profile found with that name")
+        return value
+
 
 class SnapshotSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Snapshot
         fields = '__all__'
+
+
+class JobSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = Job
+        fields = '__all__'
+
+
+class ImageSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = Image
+        fields = '__all__'
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db.models import Count
+from api.models import Target
+from api.nodes import get_client
+from helpers.agent.client import RemoteEntity
+from helpers.tgtadm.iscsi_target import ISCSITarget
+from helpers.tgtadm.tgtd import TGTDaemon
+
+
+def get_shards():
+    return settings.TGTD_SHARDS
+
+
+def get_daemon(shard):
+    config = get_shards()[shard]
+    return TGTDaemon(config["control_port"], config.get("portal"))
+
+
+def choose_shard():
+    """places a new target on the shard serving the fewest logical units, then the fewest targets"""
+    load = dict((shard, (0, 0)) for shard in range(len(get_shards())))
+    for row in Target.objects.values("shard").annotate(targets=Count("id", distinct=True),
+                                                       logical_units=Count("logical_units", distinct=True)):
+        if row["shard"] in load:
+            load[row["shard"]] = (row["logical_units"], row["targets"])
+    return min(load, key=lambda shard: (load[shard], shard))
+
+
+def get_iscsi_target(target):
+    shards = get_shards()
+    shard = target.shard if target.shard < len(shards) else 0
+    control_port = shards[shard]["control_port"]
+    if target.node_id:
+        return RemoteEntity(get_client(target.node), "ISCSITarget", target.id, target.name, control_port)
+    return ISCSITarget(target.id, target.name, control_port)
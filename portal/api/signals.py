@@ -0,0 +1,47 @@
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+from api.caching import bump
+from api.events import record
+from api.models import PDU, KVM, Initiator, Tag, StorageNode, Target, LogicalUnit, Snapshot, Job, Image
+from helpers import listeners
+
+TRACKED_MODELS = {LogicalUnit: "logical_unit", Target: "target", Job: "job"}
+
+# models read endpoints are served from, their change counters are named after model._meta.model_name
+COUNTED_MODELS = (PDU, KVM, Initiator, Tag, StorageNode, Target, LogicalUnit, Snapshot, Job, Image)
+
+
+@receiver(post_init)
+def remember_status(sender, instance, **kwargs):
+    if sender in TRACKED_MODELS:
+        instance._saved_status = instance.__dict__.get("status")  # never loads a deferred field
+
+
+@receiver(post_save)
+def record_status_change(sender, instance, created, update_fields=None, **kwargs):
+    if sender not in TRACKED_MODELS or (update_fields and "status" not in update_fields):
+        return
+    previous_status = None if created else getattr(instance, "_saved_status", None)
+    if created or instance.status != previous_status:
+        record(TRACKED_MODELS[sender], instance.pk, instance.status, previous_status)
+    instance._saved_status = instance.status
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def count_change(sender, **kwargs):
+    if sender in COUNTED_MODELS:
+        bump(sender._meta.model_name)
+
+
+@receiver(m2m_changed)
+def count_relation_change(sender, instance, action, model, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump(type(instance)._meta.model_name, model._meta.model_name)
+
+
+def count_storage_change(source, action):
+    bump("storage")
+
+
+listeners.add_listener(count_storage_change)
@@ -0,0 +1,103 @@
+import math
+from django.conf import settings
+from django.utils import timezone
+from api import metrics
+from api.exceptions import LockTimeoutException
+from api.locks import logical_unit_lock
+from api.models import Snapshot
+from api.nodes import get_client
+from helpers.agent.client import RemoteEntity
+from helpers.lvm2.entities import VolumeGroup, Snapshot as SnapshotVolume
+
+# weight of the newest sample in the exponentially smoothed fill rate
+FILL_RATE_SMOOTHING = 0.3
+
+
+def _report(node, groups):
+    if node is None:
+        return VolumeGroup.report_snapshots(groups)
+    return RemoteEntity(get_client(node), "VolumeGroup", groups[0]).report_snapshots(groups)
+
+
+def _snapshot_volume(snapshot):
+    path = "/dev/%s/%s" % (snapshot.logical_unit.group, snapshot.name)
+    if snapshot.logical_unit.node is None:
+        return SnapshotVolume(path)
+    return RemoteEntity(get_client(snapshot.logical_unit.node), "Snapshot", path)
+
+
+def extension_size(snapshot, used_in_gb):
+    """GiB to add when the snapshot crosses the fill threshold or would fill up within the horizon, else 0"""
+    size = snapshot.size_in_gb
+    rate = snapshot.fill_rate_in_gb_per_hour or 0.0
+    horizon = settings.SNAPSHOT_EXTEND_HORIZON_HOURS
+    over_threshold = used_in_gb >= size * settings.SNAPSHOT_EXTEND_THRESHOLD_PERCENT / 100.0
+    filling_fast = rate > 0 and (size - used_in_gb) / rate < horizon
+    if not (over_threshold or filling_fast):
+        return 0.0
+    return max(settings.SNAPSHOT_EXTEND_MIN_GB, math.ceil(rate * horizon * 2))  # twice the expected writes
+
+
+def sample_snapshots():
+    """samples COW fill of every snapshot (one lvs call per storage node), records fill rates and extends
+    snapshots about to overflow; returns the names of the extended snapshots & of those that overflowed"""
+    snapshots = list(Snapshot.objects.select_related("logical_unit", "logical_unit__node"))
+    by_node = {}
+    for snapshot in snapshots:
+        by_node.setdefault(snapshot.logical_unit.node, set()).add(snapshot.logical_unit.group)
+    report = {}
+    for node, groups in by_node.items():
+        try:
+            report[node.id if node else None] = _report(node, sorted(groups))
+        except Exception as e:
+            print(str(e))
+    now = timezone.now()
+    extended = []
+    invalid = []
+    for snapshot in snapshots:
+        node = snapshot.logical_unit.node
+        row = report.get(node.id if node else None, {}).get(snapshot.logical_unit.group + "/" + snapshot.name)
+        if not row or row["data_percent"] is None:
+            continue
+        if row["invalid"]:
+            metrics.increment("snapshots.invalid")
+            invalid.append(snapshot.name)
+        used_in_gb = row["size"] * row["data_percent"] / 100.0
+        if snapshot.last_sampled and snapshot.used_percent is not None:
+            hours = (now - snapshot.last_sampled).total_seconds() / 3600.0
+            previous_used_in_gb = snapshot.size_in_gb * snapshot.used_percent / 100.0
+            if hours > 0 and used_in_gb >= previous_used_in_gb:  # a drop means the snapshot was reverted
+                rate = (used_in_gb - previous_used_in_gb) / hours
+                if snapshot.fill_rate_in_gb_per_hour is None:
+                    snapshot.fill_rate_in_gb_per_hour = rate
+                else:
+                    snapshot.fill_rate_in_gb_per_hour = FILL_RATE_SMOOTHING * rate + \
+                        (1 - FILL_RATE_SMOOTHING) * snapshot.fill_rate_in_gb_per_hour
+        snapshot.size_in_gb = row["size"]
+        snapshot.used_percent = row["data_percent"]
+        snapshot.peak_used_in_gb = max(snapshot.peak_used_in_gb, used_in_gb)
+        snapshot.last_sampled = now
+        size = extension_size(snapshot, used_in_gb) if not row["invalid"] else 0.0
+        if size:
+            try:
+                with logical_unit_lock(snapshot.logical_unit, timeout=1):
+                    if _snapshot_volume(snapshot).extend(size):
+                        snapshot.size_in_gb += size
+                        snapshot.used_percent = used_in_gb * 100.0 / snapshot.size_in_gb
+                        extended.append(snapshot.name)
+                        metrics.increment("snapshots.extended")
+            except LockTimeoutException:
+                pass  # busy with a revert or similar, try again on the next sample
+        snapshot.save(update_fields=["size_in_gb", "used_percent", "peak_used_in_gb", "fill_rate_in_gb_per_hour",
+                                     "last_sampled"])
+    return extended, invalid
+
+
+def suggest_snapshot_size():
+    """default COW size for new snapshots: the 90th percentile of observed peak usage plus headroom"""
+    peaks = sorted(Snapshot.objects.filter(last_sampled__isnull=False, peak_used_in_gb__gt=0)
+                   .values_list("peak_used_in_gb", flat=True))
+    if not peaks:
+        return settings.SNAPSHOT_DEFAULT_SIZE_GB
+    peak = peaks[min(len(peaks) - 1, int(math.ceil(len(peaks) * 0.9)) - 1)]
+    return max(settings.SNAPSHOT_EXTEND_MIN_GB, math.ceil(peak * settings.SNAPSHOT_SIZE_HEADROOM * 2) / 2.0)
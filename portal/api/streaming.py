@@ -0,0 +1,202 @@
+import hashlib
+import os
+import queue
+import re
+import threading
+import uuid
+from django.conf import settings
+from django.db import connections
+from api import metrics
+from api.locks import logical_unit_lock
+from api.snapshot_monitor import suggest_snapshot_size
+from helpers.lvm2.entities import LogicalVolume
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """(start, end) with end exclusive of a single range 'Range' header, None for no, multiple or invalid ranges
+    (answered with the whole image, as RFC 7233 has it); raises RangeNotSatisfiable for valid ranges outside the
+    image"""
+    match = _RANGE.match((header or "").replace(" ", ""))
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1) and match.group(2) and int(match.group(2)) < int(match.group(1)):
+        return None  # last byte before the first: invalid, so ignored
+    if not match.group(1):  # suffix range, the last N bytes
+        length = int(match.group(2))
+        if not length:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size
+    start = int(match.group(1))
+    end = int(match.group(2)) + 1 if match.group(2) else size
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size)
+
+
+def get_size(path):
+    """size in bytes of a block device or file, st_size is 0 for block devices"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+
+
+class RangeFile(object):
+    """file-like view of bytes [start, end) of a device for FileResponse.
+
+    Exposes fileno() with the descriptor positioned at start, so WSGI servers whose wsgi.file_wrapper uses
+    sendfile() (gunicorn) send it zero-copy; otherwise it is read with pread() in FileResponse.block_size pieces.
+    on_close() runs once when the response is closed, finished or not.
+    """
+
+    def __init__(self, path, start, end, on_close=None):
+        self._fd = os.open(path, os.O_RDONLY)
+        os.lseek(self._fd, start, os.SEEK_SET)
+        self._start = start
+        self._position = start
+        self._end = end
+        self._on_close = on_close
+        self._sendfile = False
+
+    def fileno(self):
+        self._sendfile = True  # only a file_wrapper about to sendfile() asks, it then sends the whole range
+        return self._fd
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        remaining = self._end - self._position
+        size = remaining if size is None or size < 0 else min(size, remaining)
+        if size <= 0:
+            return b""
+        data = os.pread(self._fd, size, self._position)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+        sent = self._position - self._start
+        metrics.increment("images.downloaded_bytes", self._end - self._start if self._sendfile and not sent else sent)
+        if self._on_close:
+            try:
+                self._on_close()
+            except Exception as e:
+                print(str(e))
+
+
+def open_image(logical_unit, snapshot_name=None):
+    """(device path, cleanup) to read a consistent image of the logical unit from: the named snapshot as is, otherwise
+    a temporary snapshot of the logical volume which cleanup() removes; cleanup is None for a named snapshot"""
+    origin = LogicalVolume("/dev/%s/%s" % (logical_unit.group, logical_unit.name))
+    if snapshot_name:
+        return "/dev/%s/%s" % (logical_unit.group, snapshot_name), None
+    name = "%s_download_%s" % (logical_unit.name, uuid.uuid4().hex[:8])
+    with logical_unit_lock(logical_unit):
+        if not origin.create_snapshot(name, settings.DOWNLOAD_SNAPSHOT_SIZE_GB or suggest_snapshot_size()):
+            raise IOError("Could not create a temporary snapshot of '%s'" % logical_unit.name)
+    metrics.increment("images.download_snapshots")
+    return "/dev/%s/%s" % (logical_unit.group, name), lambda: origin.remove_snapshot(name)
+
+
+def get_upload_stream(request):
+    """(stream, length) of a request body: Django's own, bounded by Content-Length, or for Transfer-Encoding: chunked
+    the server's de-chunked input (Django reads those bodies as empty) with length None; None when neither applies"""
+    if "chunked" in request.META.get("HTTP_TRANSFER_ENCODING", "").lower():
+        if request.META.get("wsgi.input_terminated"):
+            return request.META["wsgi.input"], None
+        return None
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return None
+    return (request, length) if length else None
+
+
+def write_stream(stream, path, offset, length=None, progress=None):
+    """copies stream (length bytes, or until it ends) into the device from offset: this thread reads while a writer
+    thread pwrite()s, with at most UPLOAD_QUEUE_BLOCKS blocks in flight so a fast client cannot fill memory and a
+    slow disk does not stall the reads; every UPLOAD_SYNC_BYTES & at the end the device is synced and progress(end)
+    told how far it now durably goes. Returns that end offset"""
+    blocks = queue.Queue(settings.UPLOAD_QUEUE_BLOCKS)
+    failures = []
+    end = [offset]
+    fd = os.open(path, os.O_WRONLY)
+
+    def write():
+        position = synced = offset
+        try:
+            while True:
+                block = blocks.get()
+                if block is None:
+                    break
+                view = memoryview(block)
+                while view:
+                    written = os.pwrite(fd, view, position)
+                    view = view[written:]
+                    position += written
+                if position - synced >= settings.UPLOAD_SYNC_BYTES:
+                    os.fdatasync(fd)
+                    synced = end[0] = position
+                    if progress:
+                        progress(position)
+            os.fdatasync(fd)
+            end[0] = position
+            if progress:
+                progress(position)
+        except Exception as e:
+            failures.append(e)
+            while blocks.get() is not None:  # unblock the reader, it stops on seeing the failure
+                pass
+        finally:
+            connections.close_all()
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    remaining = length
+    try:
+        while not failures and remaining != 0:
+            block = stream.read(settings.IMAGE_STREAM_BLOCK_SIZE if remaining is None
+                                else min(settings.IMAGE_STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            blocks.put(block)
+            if remaining is not None:
+                remaining -= len(block)
+    finally:
+        blocks.put(None)
+        writer.join()
+        os.close(fd)
+    metrics.increment("images.uploaded_bytes", end[0] - offset)
+    if failures:
+        raise failures[0]
+    return end[0]
+
+
+def read_back_digest(path, length):
+    """SHA-256 of the first length bytes as read back from the disk rather than the page cache, None if the device
+    is shorter"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, length, os.POSIX_FADV_DONTNEED)
+        digest = hashlib.sha256()
+        position = 0
+        while position < length:
+            block = os.pread(fd, min(settings.IMAGE_STREAM_BLOCK_SIZE, length - position), position)
+            if not block:
+                return None
+            digest.update(block)
+            position += len(block)
+        return digest.hexdigest()
+    finally:
+        os.close(fd)
@@ -0,0 +1,58 @@
+import threading
+from django.conf import settings
+from django.db import connections
+from api import metrics
+from helpers.telemetry.block_stats import BlockDeviceSampler
+
+WINDOWS = (1, 10, 60)
+
+_sampler = None
+_lock = threading.Lock()
+
+
+def logical_unit_devices():
+    """{logical unit id: device path served to its initiator} for the logical units stored on this server"""
+    from api.models import LogicalUnit, Snapshot
+    try:
+        devices = dict((logical_unit_id, "/dev/%s/%s" % (group, name)) for logical_unit_id, group, name in
+                       LogicalUnit.objects.filter(node=None).values_list("id", "group", "name"))
+        for logical_unit_id, group, name in Snapshot.objects.filter(
+                active=True, logical_unit__node=None).values_list("logical_unit_id", "logical_unit__group", "name"):
+            devices[logical_unit_id] = "/dev/%s/%s" % (group, name)
+        return devices
+    finally:
+        connections.close_all()
+
+
+def get_sampler():
+    return _sampler
+
+
+def start():
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = BlockDeviceSampler(logical_unit_devices, settings.IO_TELEMETRY_INTERVAL,
+                                          settings.IO_TELEMETRY_CAPACITY, settings.IO_TELEMETRY_REFRESH_INTERVAL)
+            _sampler.start()
+            metrics.register_collector(collect_metrics)
+    return _sampler
+
+
+def get_io_stats(logical_unit_id):
+    if _sampler is None:
+        return None
+    return dict(("%ds" % window, _sampler.rates(logical_unit_id, window)) for window in WINDOWS)
+
+
+def collect_metrics():
+    values = {}
+    if _sampler is None:
+        return values
+    for logical_unit_id in _sampler.keys():
+        rates = _sampler.rates(logical_unit_id, settings.IO_TELEMETRY_METRICS_WINDOW)
+        if rates:
+            for name, value in rates.items():
+                if name != "seconds":
+                    values["io.logical_unit.%s.%s" % (logical_unit_id, name)] = round(value, 3)
+    return values
@@ -1,3 +1,1064 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import http_date
+from api import events, metrics
+from api.exceptions import LockTimeoutException
+from api.liveness import scan_initiators
+from api.locks import LockManager
+from api.caching import bump
+from api.models import Initiator, LogicalUnit, ResourceLock, Snapshot, StorageNode, Tag, Target
+from api.placement import choose_physical_volumes, create_placed_logical_volume
+from api.portals import choose_portal
+from api.shards import choose_shard, get_iscsi_target
+from api.snapshot_monitor import extension_size, sample_snapshots, suggest_snapshot_size
+from api.streaming import RangeFile, RangeNotSatisfiable, parse_range, write_stream
+from api.transitions import BUSY, MODIFIED, MOUNTED, OFFLINE, ONLINE, transition_logical_units
+from api.views import LogicalUnitViewSet, TargetViewSet
+from api.warm_pool import claim_logical_volume, refill, size_class
+from helpers.agent import server as agent_server
+from helpers.agent.client import AgentClient, AgentException
+from helpers.imagestore.replication import ReplicationException, make_server, replicate
+from helpers.imagestore.repository import Repository
+from helpers.lvm2.entities import LogicalVolume, VolumeGroup
+from helpers.lvm2.helper import Helper
+from helpers.power import simulator
+from helpers.power.drivers import HTTPDriver, PowerException
+from helpers.tgtadm.iscsi_target import ISCSITarget
 
-# Create your tests here.
+CHUNK_SIZE = 4096
+
+
+def write_image(path, chunks, tail=b""):
+    """a file of CHUNK_SIZE chunks each filled with its byte value (0 giving an all-zero chunk), then tail"""
+    with open(path, "wb") as f:
+        for value in chunks:
+            f.write(bytes([value]) * CHUNK_SIZE)
+        f.write(tail)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class LockManagerTests(TransactionTestCase):
+    """transactional, since the lease heartbeat runs on a thread of its own and only sees committed rows"""
+
+    def setUp(self):
+        self.manager = LockManager()
+
+    def test_acquire_and_release(self):
+        owner = self.manager.acquire("target:1", timeout=1)
+        self.assertTrue(ResourceLock.objects.filter(resource="target:1", owner=owner).exists())
+        self.assertTrue(self.manager.release("target:1"))
+        self.assertFalse(ResourceLock.objects.filter(resource="target:1").exists())
+        self.assertFalse(self.manager.release("target:1"))
+
+    def test_reentrant_within_a_thread(self):
+        owner = self.manager.acquire("target:1", timeout=1)
+        self.assertEqual(self.manager.acquire("target:1", timeout=0), owner)
+        self.manager.release("target:1")
+        self.assertTrue(ResourceLock.objects.filter(resource="target:1").exists())
+        self.manager.release("target:1")
+        self.assertFalse(ResourceLock.objects.filter(resource="target:1").exists())
+
+    def test_times_out_while_held_elsewhere(self):
+        ResourceLock.objects.create(resource="target:1", owner="elsewhere",
+                                    expires_at=timezone.now() + timedelta(minutes=5))
+        with self.assertRaises(LockTimeoutException):
+            self.manager.acquire("target:1", timeout=0.1)
+        self.assertEqual(ResourceLock.objects.get(resource="target:1").owner, "elsewhere")
+
+    def test_takes_over_an_expired_lock(self):
+        ResourceLock.objects.create(resource="target:1", owner="crashed",
+                                    expires_at=timezone.now() - timedelta(seconds=1))
+        owner = self.manager.acquire("target:1", timeout=1)
+        self.assertEqual(ResourceLock.objects.get(resource="target:1").owner, owner)
+        self.manager.release("target:1")
+
+    def test_heartbeat_renews_the_lease(self):
+        self.manager.acquire("target:1", timeout=1, lease=0.3)
+        try:
+            time.sleep(0.6)
+            self.assertGreater(ResourceLock.objects.get(resource="target:1").expires_at, timezone.now())
+        finally:
+            self.manager.release("target:1")
+
+
+class TransitionTests(TransactionTestCase):
+    """transactional, since side effects run on fleet worker threads"""
+
+    def setUp(self):
+        self.calls = []
+        self.failing = set()
+        self.target = Target.objects.create(name="iqn.2018-01.test:target")
+
+    def side_effect(self, name):
+        def run(logical_unit):
+            self.calls.append((name, logical_unit.name))
+            return name not in self.failing
+        return run
+
+    def transition(self, logical_unit, status, condition=None):
+        side_effects = {"attach": self.side_effect("attach"), "detach": self.side_effect("detach")}
+        results, updated = transition_logical_units([logical_unit], status, side_effects, condition)
+        logical_unit.refresh_from_db()
+        return results[0], updated
+
+    def logical_unit(self, status=OFFLINE, target=True):
+        return LogicalUnit.objects.create(name="lu%d" % LogicalUnit.objects.count(), group="vg0", status=status,
+                                          target=self.target if target else None)
+
+    def test_attach(self):
+        logical_unit = self.logical_unit()
+        result, updated = self.transition(logical_unit, ONLINE)
+        self.assertEqual((result["result"], result["message"], updated), (True, "Attached", 1))
+        self.assertEqual(logical_unit.status, ONLINE)
+        self.assertEqual(self.calls, [("detach", logical_unit.name), ("attach", logical_unit.name)])
+
+    def test_already_in_that_state(self):
+        logical_unit = self.logical_unit(ONLINE)
+        result, updated = self.transition(logical_unit, ONLINE)
+        self.assertEqual((result["result"], updated), (True, 0))
+        self.assertEqual(self.calls, [])
+
+    def test_transition_not_allowed(self):
+        logical_unit = self.logical_unit(OFFLINE)
+        result, updated = self.transition(logical_unit, MOUNTED)
+        self.assertFalse(result["result"])
+        self.assertIn("not allowed", result["message"])
+        self.assertEqual((logical_unit.status, updated, self.calls), (OFFLINE, 0, []))
+
+    def test_attach_without_target(self):
+        logical_unit = self.logical_unit(target=False)
+        result, _ = self.transition(logical_unit, ONLINE)
+        self.assertEqual((result["result"], result["message"]), (False, "Logical unit has no target to attach to"))
+        self.assertEqual(self.calls, [])
+
+    def test_failed_side_effect_keeps_the_status(self):
+        self.failing.add("detach")
+        logical_unit = self.logical_unit(ONLINE)
+        result, updated = self.transition(logical_unit, OFFLINE)
+        self.assertEqual((result["result"], result["message"], updated), (False, "Unable to detach logical unit", 0))
+        self.assertEqual(logical_unit.status, ONLINE)
+
+    def test_transition_without_side_effect(self):
+        logical_unit = self.logical_unit(BUSY)
+        result, updated = self.transition(logical_unit, ONLINE)
+        self.assertEqual((result["result"], result["message"], updated), (True, "Updated", 1))
+        self.assertEqual(self.calls, [])
+
+    def test_changed_meanwhile(self):
+        logical_unit = self.logical_unit(ONLINE)
+        LogicalUnit.objects.filter(pk=logical_unit.pk).update(status=MOUNTED)
+        logical_unit.status = ONLINE  # the caller's stale copy
+        result, updated = self.transition(logical_unit, OFFLINE)
+        self.assertEqual((result["result"], result["message"], updated),
+                         (False, "Logical unit changed state meanwhile", 0))
+        self.assertEqual((logical_unit.status, self.calls), (MOUNTED, []))
+
+    def test_condition_no_longer_holds(self):
+        logical_unit = self.logical_unit(ONLINE)
+        result, updated = self.transition(logical_unit, OFFLINE, ~Q(pk=logical_unit.pk))
+        self.assertEqual((result["result"], updated), (False, 0))
+        self.assertEqual((logical_unit.status, self.calls), (ONLINE, []))
+
+
+class StreamingTests(SimpleTestCase):
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-99", 1000), (0, 100))
+        self.assertEqual(parse_range("bytes=900-", 1000), (900, 1000))
+        self.assertEqual(parse_range("bytes=-100", 1000), (900, 1000))
+        self.assertEqual(parse_range("bytes=-5000", 1000), (0, 1000))
+        self.assertEqual(parse_range("bytes=990-5000", 1000), (990, 1000))
+
+    def test_parse_range_ignores_invalid_ranges(self):
+        for header in (None, "", "bytes=5-2", "bytes=0-1,5-6", "items=0-1", "bytes=-", "bytes=a-b"):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_parse_range_not_satisfiable(self):
+        for header in ("bytes=1000-", "bytes=2000-3000", "bytes=-0"):
+            with self.assertRaises(RangeNotSatisfiable):
+                parse_range(header, 1000)
+
+    def test_range_file(self):
+        closed = []
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(bytes(range(256)) * 4)
+            f.flush()
+            before = metrics.snapshot().get("images.downloaded_bytes", 0)
+            range_file = RangeFile(f.name, 10, 110, lambda: closed.append(True))
+            self.assertEqual(range_file.read(60), bytes(range(10, 70)))
+            self.assertEqual(range_file.read(), bytes(range(70, 110)))
+            self.assertEqual(range_file.read(), b"")
+            range_file.close()
+            range_file.close()
+        self.assertEqual(closed, [True])
+        self.assertEqual(metrics.snapshot()["images.downloaded_bytes"] - before, 100)
+
+    def test_range_file_counts_the_range_sent_with_sendfile(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(bytes(1000))
+            f.flush()
+            before = metrics.snapshot().get("images.downloaded_bytes", 0)
+            range_file = RangeFile(f.name, 500, 1000)
+            self.assertEqual(os.lseek(range_file.fileno(), 0, os.SEEK_CUR), 500)
+            range_file.close()
+        self.assertEqual(metrics.snapshot()["images.downloaded_bytes"] - before, 500)
+
+
+class BootScriptTests(TestCase):
+    def setUp(self):
+        self.initiator = Initiator.objects.create(name="machine", mac_address="52-54-00-AB-CD-EF")
+        self.target = Target.objects.create(name="iqn.2018-01.test:machine", initiator=self.initiator,
+                                            portal="10.0.0.5")
+        self.logical_unit = LogicalUnit.objects.create(name="lu0", group="vg0", target=self.target)
+        self.iscsi_target = mock.Mock(**{"get_name.return_value": self.target.name})
+
+    def boot(self, mac_address, handshake=None):
+        handshake = handshake or (self.logical_unit, self.iscsi_target, None)
+        with mock.patch.object(TargetViewSet, "boot_handshake", return_value=handshake):
+            response = self.client.get("/boot/%s" % mac_address)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode("utf-8").splitlines()
+
+    def test_sanboot_uri(self):
+        # iscsi:<server>:<protocol>:<port>:<LUN>:<targetname>, the LUN in hex
+        self.assertEqual(self.boot("52:54:00:ab:cd:ef"), [
+            "#!ipxe", "sanboot iscsi:10.0.0.5:::%x:iqn.2018-01.test:machine" % self.logical_unit.id])
+
+    def test_mac_address_is_normalized(self):
+        self.assertEqual(Initiator.objects.get(pk=self.initiator.pk).mac_address, "52:54:00:ab:cd:ef")
+        self.assertEqual(self.boot("5254.00AB.CDEF")[1].split(":")[0], "sanboot iscsi")
+
+    def test_finds_mac_addresses_stored_before_normalization(self):
+        Initiator.objects.filter(pk=self.initiator.pk).update(mac_address="52-54-00-AB-CD-EF")
+        self.assertTrue(self.boot("52:54:00:ab:cd:ef")[1].startswith("sanboot "))
+
+    def test_unknown_and_invalid_mac_addresses(self):
+        self.assertEqual(self.boot("52:54:00:00:00:01")[1], "echo No target configured for 52:54:00:00:00:01")
+        self.assertEqual(self.boot("not-a-mac")[1], "echo Invalid MAC address")
+
+    def test_failed_handshake(self):
+        lines = self.boot("52:54:00:ab:cd:ef", (None, self.iscsi_target, "No logical unit found for booting"))
+        self.assertEqual(lines[1:], ["echo No logical unit found for booting", "exit 1"])
+
+    def test_initiator_api_rejects_the_same_mac_address_in_another_format(self):
+        response = self.client.post("/api/initiators/", {"name": "other", "mac_address": "525400ABCDEF"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/api/initiators/", {"name": "other", "mac_address": "52-54-00-00-00-02"})
+        self.assertEqual((response.status_code, response.json()["mac_address"]), (201, "52:54:00:00:00:02"))
+
+
+class FakeTGTD(object):
+    """answers the tgtadm commands ISCSITarget runs from targets, logical units & connections kept in memory"""
+
+    def __init__(self):
+        self.targets = {}  # tid: {"name": iqn, "luns": {lun: backing store}, "connections": {(ip, sid, cid)}}
+        self.lock = threading.Lock()
+
+    def execute(self, iscsi_target, args, mode="target"):
+        options = dict(zip(args[::2], args[1::2]))
+        op, tid = options.get("--op"), options.get("--tid")
+        with self.lock:
+            target = self.targets.get(tid)
+            if mode == "target" and op == "new":
+                self.targets[tid] = {"name": options["--targetname"], "luns": {}, "connections": set()}
+                return None
+            if mode == "target" and op == "show" and tid is None:
+                return "".join("Target %s: %s\n" % (tid, target["name"]) +
+                               "".join("    LUN: %s\n        Backing store path: %s\n" % lun
+                                       for lun in sorted(target["luns"].items()))
+                               for tid, target in sorted(self.targets.items())) or None
+            if target is None:
+                return "tgtadm: can't find the target"
+            if mode == "target" and op == "show":
+                return "Target %s: %s\n" % (tid, target["name"])
+            if mode == "target" and op == "delete":
+                del self.targets[tid]
+            elif mode == "logicalunit" and op == "new":
+                target["luns"][options["--lun"]] = options["--backing-store"]
+            elif mode == "logicalunit" and op == "delete":
+                target["luns"].pop(options["--lun"], None)
+            elif mode == "conn" and op == "show":
+                return "".join("Session: %s\n    Connection: %s\n        IP Address: %s\n" % (sid, cid, ip)
+                               for ip, sid, cid in sorted(target["connections"])) or None
+            elif mode == "conn" and op == "delete":
+                target["connections"] = set(connection for connection in target["connections"]
+                                            if connection[1:] != (options["--sid"], options["--cid"]))
+            return None
+
+
+@override_settings(TGTD_SHARDS=[{"control_port": 0, "portal": "0.0.0.0:3260"},
+                                {"control_port": 1, "portal": "0.0.0.0:3261"},
+                                {"control_port": 2, "portal": "0.0.0.0:3262"}])
+class ShardTests(TestCase):
+    def target(self, shard, logical_units=0):
+        target = Target.objects.create(name="target%d" % Target.objects.count(), shard=shard)
+        for _ in range(logical_units):
+            LogicalUnit.objects.create(name="lu%d" % LogicalUnit.objects.count(), group="vg0", target=target)
+        return target
+
+    def test_prefers_the_shard_with_fewest_logical_units_then_targets(self):
+        self.assertEqual(choose_shard(), 0)
+        self.target(0, logical_units=2)
+        self.target(1, logical_units=1)
+        self.assertEqual(choose_shard(), 2)
+        self.target(2, logical_units=1)
+        self.target(2)
+        self.assertEqual(choose_shard(), 1)
+
+    def test_create_places_targets_on_shards(self):
+        self.target(0, logical_units=1)
+        response = self.client.post("/api/targets/", {"name": "placed"})
+        self.assertEqual((response.status_code, Target.objects.get(name="placed").shard), (201, 1))
+        response = self.client.post("/api/targets/", {"name": "pinned", "shard": 0})
+        self.assertEqual((response.status_code, Target.objects.get(name="pinned").shard), (201, 0))
+        self.assertEqual(self.client.post("/api/targets/", {"name": "nowhere", "shard": 3}).status_code, 400)
+
+    def test_iscsi_target_talks_to_its_shard(self):
+        self.assertEqual(get_iscsi_target(self.target(2)).get_control_port(), 2)
+        with self.settings(TGTD_SHARDS=[{"control_port": 0, "portal": "0.0.0.0:3260"}]):
+            self.assertEqual(get_iscsi_target(Target.objects.get(shard=2)).get_control_port(), 0)
+
+
+@override_settings(TGTD_SHARDS=[{"control_port": 0, "portal": "0.0.0.0:3260", "portals": ["10.0.0.1", "10.0.0.2"]}])
+class PortalTests(TestCase):
+    def setUp(self):
+        self.sessions = {}
+        patch = mock.patch("api.portals.get_iscsi_target")
+        patch.start().return_value.count_sessions.side_effect = lambda: self.sessions
+        self.addCleanup(patch.stop)
+        self.target = Target.objects.create(name="booting")
+
+    def other(self, portal, sessions=0, last_initiated=None):
+        initiator = Initiator.objects.create(name="m%d" % Initiator.objects.count(), last_initiated=last_initiated,
+                                             mac_address="52:54:00:00:00:%02x" % Initiator.objects.count())
+        target = Target.objects.create(name="target%d" % Target.objects.count(), portal=portal, initiator=initiator)
+        self.sessions[str(target.pk)] = sessions
+        return target
+
+    def test_least_sessions_first(self):
+        self.assertEqual(choose_portal(self.target), "10.0.0.1")
+        self.other("10.0.0.1", sessions=2)
+        self.other("10.0.0.2", sessions=1)
+        self.assertEqual(choose_portal(self.target), "10.0.0.2")
+
+    def test_recently_handed_out_portals_count_as_a_session(self):
+        self.other("10.0.0.1", sessions=1)
+        self.other("10.0.0.2", last_initiated=timezone.now())
+        self.other("10.0.0.2", last_initiated=timezone.now() - timedelta(hours=1))  # never logged in, not pending
+        self.assertEqual(choose_portal(self.target), "10.0.0.1")
+        self.other("10.0.0.1", sessions=1)
+        self.assertEqual(choose_portal(self.target), "10.0.0.2")
+
+    def test_single_portal(self):
+        with self.settings(TGTD_SHARDS=[{"control_port": 0, "portal": "0.0.0.0:3260", "portals": []}],
+                           ISCSI_PORTAL_ADDRESS="10.0.0.9"):
+            self.assertEqual(choose_portal(self.target), "10.0.0.9")
+        node = StorageNode.objects.create(name="node", agent_url="http://127.0.0.1:9100", iscsi_address="10.0.1.1")
+        self.assertEqual(choose_portal(Target.objects.create(name="remote", node=node)), "10.0.1.1")
+
+
+@override_settings(SNAPSHOT_EXTEND_THRESHOLD_PERCENT=80.0, SNAPSHOT_EXTEND_HORIZON_HOURS=0.5,
+                   SNAPSHOT_EXTEND_MIN_GB=1.0, SNAPSHOT_DEFAULT_SIZE_GB=5.0, SNAPSHOT_SIZE_HEADROOM=1.25)
+class SnapshotMonitorTests(TestCase):
+    def setUp(self):
+        self.logical_unit = LogicalUnit.objects.create(name="lu0", group="vg0")
+        self.rows = {}
+        self.volume = mock.Mock(**{"extend.return_value": True})
+        for name, value in (("_report", lambda node, groups: self.rows), ("_snapshot_volume", self.volume_of)):
+            patch = mock.patch("api.snapshot_monitor.%s" % name, side_effect=value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def volume_of(self, snapshot):
+        return self.volume
+
+    def snapshot(self, name="snap", **fields):
+        return Snapshot.objects.create(name=name, logical_unit=self.logical_unit, **fields)
+
+    def test_extension_size(self):
+        snapshot = Snapshot(size_in_gb=10.0)
+        self.assertEqual(extension_size(snapshot, 7.0), 0.0)
+        self.assertEqual(extension_size(snapshot, 8.0), 1.0)  # over the threshold without a known rate
+        snapshot.fill_rate_in_gb_per_hour = 12.0
+        self.assertEqual(extension_size(snapshot, 5.0), 12)  # full in 25 minutes: twice the writes of the horizon
+        snapshot.fill_rate_in_gb_per_hour = 6.0
+        self.assertEqual(extension_size(snapshot, 5.0), 0.0)  # full in 50 minutes, beyond the horizon
+
+    def test_sample_measures_growth_and_extends(self):
+        snapshot = self.snapshot(size_in_gb=10.0, used_percent=50.0, last_sampled=timezone.now() - timedelta(hours=1))
+        self.rows["vg0/snap"] = {"size": 10.0, "data_percent": 90.0, "invalid": False}
+        self.assertEqual(sample_snapshots(), (["snap"], []))
+        snapshot.refresh_from_db()
+        self.assertAlmostEqual(snapshot.fill_rate_in_gb_per_hour, 4.0, places=2)
+        self.volume.extend.assert_called_once_with(4)
+        self.assertEqual((snapshot.size_in_gb, snapshot.peak_used_in_gb), (14.0, 9.0))
+        self.assertAlmostEqual(snapshot.used_percent, 9.0 * 100 / 14)
+
+    def test_sample_smooths_the_fill_rate(self):
+        snapshot = self.snapshot(size_in_gb=10.0, used_percent=10.0, fill_rate_in_gb_per_hour=2.0,
+                                 last_sampled=timezone.now() - timedelta(hours=1))
+        self.rows["vg0/snap"] = {"size": 10.0, "data_percent": 50.0, "invalid": False}
+        self.assertEqual(sample_snapshots(), ([], []))
+        snapshot.refresh_from_db()
+        self.assertAlmostEqual(snapshot.fill_rate_in_gb_per_hour, 0.3 * 4.0 + 0.7 * 2.0, places=2)
+
+    def test_sample_ignores_drops_and_reports_invalid_snapshots(self):
+        reverted = self.snapshot("reverted", size_in_gb=10.0, used_percent=50.0, fill_rate_in_gb_per_hour=1.0,
+                                 last_sampled=timezone.now() - timedelta(hours=1))
+        self.snapshot("overflowed", size_in_gb=10.0)
+        self.rows["vg0/reverted"] = {"size": 10.0, "data_percent": 10.0, "invalid": False}
+        self.rows["vg0/overflowed"] = {"size": 10.0, "data_percent": 100.0, "invalid": True}
+        self.assertEqual(sample_snapshots(), ([], ["overflowed"]))
+        reverted.refresh_from_db()
+        self.assertEqual(reverted.fill_rate_in_gb_per_hour, 1.0)
+        self.volume.extend.assert_not_called()
+
+    def test_suggest_snapshot_size(self):
+        self.assertEqual(suggest_snapshot_size(), 5.0)
+        for peak in range(1, 11):
+            self.snapshot("snap%d" % peak, peak_used_in_gb=float(peak), last_sampled=timezone.now())
+        self.assertEqual(suggest_snapshot_size(), 11.5)  # the 90th percentile peak (9) with headroom, to 0.5 GiB
+
+
+class FakeVolumeGroup(object):
+    """the logical volume names of a volume group, without lvm"""
+
+    def __init__(self, *names):
+        self.names = list(names)
+
+    def get_logical_volume_names(self):
+        return list(self.names)
+
+    def rename_logical_volume(self, name, new_name):
+        self.names[self.names.index(name)] = new_name
+        return True
+
+    def create_logical_volume(self, name, size_in_gb):
+        self.names.append(name)
+        return True
+
+
+@override_settings(WARM_POOL={"vg0": {20: 2, 0.5: 1}})
+class WarmPoolTests(TransactionTestCase):
+    """transactional, since the pool lock heartbeat runs on a thread of its own"""
+
+    def setUp(self):
+        self.volume_group = FakeVolumeGroup("warmpool_20g_aaaaaaaa", "warmpool_0p5g_bbbbbbbb", "lu0")
+        for name, value in (("get_volume_group", mock.Mock(return_value=self.volume_group)),
+                            ("refill_in_background", mock.Mock())):
+            patch = mock.patch("api.warm_pool.%s" % name, value)
+            setattr(self, name, patch.start())
+            self.addCleanup(patch.stop)
+
+    def test_size_class(self):
+        self.assertEqual((size_class(20), size_class("20.0"), size_class(0.5)), ("20g", "20g", "0p5g"))
+
+    def test_claim_renames_a_pool_volume_and_refills(self):
+        self.assertTrue(claim_logical_volume("vg0", 20, "lu1"))
+        self.assertEqual(self.volume_group.names, ["lu1", "warmpool_0p5g_bbbbbbbb", "lu0"])
+        self.refill_in_background.assert_called_once_with()
+        self.assertFalse(claim_logical_volume("vg0", 20, "lu2"))  # the pool is empty until refilled
+        self.assertEqual(self.refill_in_background.call_count, 1)
+
+    def test_claim_outside_the_pool(self):
+        self.assertFalse(claim_logical_volume("vg0", 20, "lu1", node="node1"))  # pools are on this server only
+        self.assertFalse(claim_logical_volume("vg0", 10, "lu1"))
+        self.assertFalse(claim_logical_volume("vg1", 20, "lu1"))
+        self.get_volume_group.assert_not_called()
+        self.refill_in_background.assert_not_called()
+
+    def test_refill_tops_up_every_size_class(self):
+        self.assertEqual(refill(), 1)
+        self.assertEqual(len([name for name in self.volume_group.names if name.startswith("warmpool_20g_")]), 2)
+        self.assertEqual(refill(), 0)
+
+
+class CacheStatusTests(SimpleTestCase):
+    def status(self, output):
+        with mock.patch.object(Helper, "execute", return_value=output):
+            return LogicalVolume("/dev/vg0/lu0").get_cache_status()
+
+    def test_hit_ratios(self):
+        status = self.status("  writethrough|300|100|0|0|0|120|1024\n")
+        self.assertEqual(status["cache_mode"], "writethrough")
+        self.assertEqual((status["cache_used_blocks"], status["cache_total_blocks"]), (120, 1024))
+        self.assertEqual(status["read_hit_ratio"], 0.75)
+        self.assertIsNone(status["write_hit_ratio"])  # no writes yet
+
+    def test_uncached(self):
+        self.assertIsNone(self.status("  |||||||\n"))
+        self.assertIsNone(self.status(None))
+
+
+@skipUnless(os.geteuid() == 0 and all(shutil.which(tool) for tool in ("losetup", "pvcreate", "lvcreate")),
+                     "needs root, losetup & lvm2")
+class CacheLoopDeviceTests(SimpleTestCase):
+    """attaches & detaches a cache on a volume group of two loop devices, a slow and a fast one"""
+
+    group = "portaltestvg"
+
+    def setUp(self):
+        self.devices = []
+        for size in (256, 64):
+            image = tempfile.NamedTemporaryFile(suffix=".img", delete=False)
+            image.truncate(size * 1024 * 1024)
+            image.close()
+            self.addCleanup(os.remove, image.name)
+            device = subprocess.check_output(["losetup", "--find", "--show", image.name]).decode().strip()
+            self.addCleanup(subprocess.call, ["losetup", "--detach", device])
+            self.devices.append(device)
+        subprocess.check_call(["pvcreate", "-q"] + self.devices)
+        self.addCleanup(subprocess.call, ["pvremove", "-q", "-y"] + self.devices)
+        subprocess.check_call(["vgcreate", "-q", self.group] + self.devices)
+        self.addCleanup(subprocess.call, ["vgremove", "-q", "-f", self.group])
+        self.volume_group = VolumeGroup(self.group)
+
+    def test_attach_and_detach(self):
+        (slow, fast) = self.devices
+        self.assertTrue(self.volume_group.create_logical_volume("lu0", 128, "MiB", physical_volume_paths=[slow]))
+        self.assertTrue(self.volume_group.create_cache_pool("lu0_cache", 32, fast, "MiB"))
+        logical_volume = LogicalVolume("/dev/%s/lu0" % self.group)
+        self.assertTrue(logical_volume.attach_cache("lu0_cache"))
+        status = logical_volume.get_cache_status()
+        self.assertEqual(status["cache_mode"], "writethrough")
+        self.assertGreater(status["cache_total_blocks"], 0)
+        self.assertTrue(logical_volume.detach_cache())
+        self.assertIsNone(logical_volume.get_cache_status())
+        self.assertNotIn("lu0_cache", self.volume_group.get_logical_volume_names())  # removed along with the cache
+
+
+@override_settings(PLACEMENT_IO_COST_BYTES=64 * 1024)
+class PlacementTests(SimpleTestCase):
+    def setUp(self):
+        self.physical_volumes = {
+            "/dev/sda": {"free": 100.0, "bytes_per_second": 50e6, "iops": 0.0},
+            "/dev/sdb": {"free": 40.0, "bytes_per_second": 1e6, "iops": 500.0},  # few bytes but seeking: ~33.8e6
+            "/dev/sdc": {"free": 200.0, "bytes_per_second": 0.0, "iops": 0.0},
+            "/dev/sdd": {"free": 5.0, "bytes_per_second": 0.0, "iops": 0.0},
+        }
+        self.volume_group = mock.Mock(**{"create_logical_volume.return_value": True})
+        stats = {"physical_volumes": {"vg0": self.physical_volumes}}
+        for name, value in (("get_node_stats", mock.Mock(return_value=stats)),
+                            ("get_volume_group", mock.Mock(return_value=self.volume_group))):
+            patch = mock.patch("api.placement.%s" % name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_least_loaded_with_room_first(self):
+        self.assertEqual(choose_physical_volumes("vg0", 10), ["/dev/sdc"])
+        self.assertEqual(choose_physical_volumes("vg0", 30, 3), ["/dev/sdc", "/dev/sdb", "/dev/sda"])
+        self.assertEqual(choose_physical_volumes("vg0", 100, 2), ["/dev/sdc", "/dev/sda"])  # 50 GiB each: sdb too full
+        self.assertIsNone(choose_physical_volumes("vg0", 250, 2))
+        self.assertIsNone(choose_physical_volumes("vg1", 1))
+
+    def test_most_free_breaks_ties(self):
+        self.physical_volumes["/dev/sdd"]["free"] = 300.0
+        self.assertEqual(choose_physical_volumes("vg0", 10), ["/dev/sdd"])
+
+    def test_linear_leaves_allocation_to_lvm(self):
+        self.assertEqual(create_placed_logical_volume("vg0", "lu0", 10), (True, "Created"))
+        self.volume_group.create_logical_volume.assert_called_once_with("lu0", 10, "GiB")
+
+    def test_pinned(self):
+        self.assertEqual(create_placed_logical_volume("vg0", "lu0", 10, placement="pinned"),
+                         (True, "Created on /dev/sdc"))
+        self.volume_group.create_logical_volume.assert_called_once_with("lu0", 10, "GiB", None, None, ["/dev/sdc"])
+
+    def test_striped(self):
+        self.assertEqual(create_placed_logical_volume("vg0", "lu0", 2048, "MiB", "striped", 2, 64),
+                         (True, "Created on /dev/sdc, /dev/sdd"))
+        self.volume_group.create_logical_volume.assert_called_once_with("lu0", 2048, "MiB", 2, 64,
+                                                                        ["/dev/sdc", "/dev/sdd"])
+        self.assertEqual(create_placed_logical_volume("vg0", "lu1", 10, placement="striped"),
+                         (False, "Striping needs at least 2 stripes"))
+        self.assertFalse(create_placed_logical_volume("vg0", "lu1", 500, placement="striped", stripes=2)[0])
+        self.assertEqual(self.volume_group.create_logical_volume.call_count, 1)
+
+    def test_layout(self):
+        output = "  striped|2|64.00|2097152.00|/dev/sdc(0),/dev/sdd(12)\n"
+        with mock.patch.object(Helper, "execute", return_value=output):
+            self.assertEqual(LogicalVolume("/dev/vg0/lu0").get_layout(), [{
+                "type": "striped", "stripes": 2, "stripe_size_in_kb": 64.0, "size_in_gb": 2.0,
+                "physical_volumes": [{"path": "/dev/sdc", "start_extent": 0}, {"path": "/dev/sdd", "start_extent": 12}]
+            }])
+
+
+@override_settings(LIVENESS_GRACE_SECONDS=300)
+class LivenessTests(TransactionTestCase):
+    """transactional, since releases run through the transition engine's worker threads"""
+
+    def setUp(self):
+        self.sessions = {}
+        self.answering = set()
+        for name, value in (("get_session_addresses", lambda targets: self.sessions),
+                            ("probe_addresses", lambda addresses, *args: {address: address in self.answering
+                                                                          for address in addresses})):
+            patch = mock.patch("api.liveness.%s" % name, side_effect=value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        for name in ("attach_to_target", "detach_from_target"):
+            patch = mock.patch.object(LogicalUnitViewSet, name, return_value=True)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def machine(self, number, statuses=(BUSY,), ip_address=True, last_initiated=timedelta(hours=1)):
+        """an initiator that booted `last_initiated` ago off a target holding logical units in `statuses`"""
+        initiator = Initiator.objects.create(
+            name="pc%d" % number, mac_address="00:00:00:00:00:%02x" % number,
+            ip_address="10.0.0.%d" % number if ip_address else None, last_initiated=timezone.now() - last_initiated)
+        target = Target.objects.create(name="iqn.2018-01.test:pc%d" % number, initiator=initiator)
+        logical_units = [LogicalUnit.objects.create(name="pc%d_%d" % (number, index), group="vg0", status=status,
+                                                    target=target) for index, status in enumerate(statuses)]
+        return initiator, target, logical_units
+
+    def statuses(self, logical_units):
+        return [LogicalUnit.objects.get(pk=logical_unit.pk).status for logical_unit in logical_units]
+
+    def test_releases_after_the_grace_period(self):
+        (_, _, gone) = self.machine(1, (BUSY, MOUNTED))
+        (_, _, rebooting) = self.machine(2, last_initiated=timedelta(minutes=1))
+        (_, _, unknown) = self.machine(3, ip_address=False)
+        self.assertEqual(scan_initiators(), ([], 2))
+        self.assertEqual(self.statuses(gone), [ONLINE, MODIFIED])
+        self.assertEqual(self.statuses(rebooting + unknown), [BUSY, BUSY])
+        LogicalUnitViewSet.detach_from_target.assert_called_once_with(mock.ANY)  # only the mounted one
+
+    def test_alive_by_session_or_probe(self):
+        (by_session, target, in_session) = self.machine(1)
+        (by_probe, _, probed) = self.machine(2)
+        self.sessions[str(target.id)] = ["10.0.0.1"]
+        self.answering.add("10.0.0.2")
+        self.assertEqual(scan_initiators(), (["pc1", "pc2"], 0))
+        self.assertEqual(self.statuses(in_session + probed), [BUSY, BUSY])
+        for initiator in (by_session, by_probe):
+            initiator.refresh_from_db()
+            self.assertIsNotNone(initiator.last_seen)
+
+    def test_last_seen_counts_towards_the_grace_period(self):
+        (initiator, _, logical_units) = self.machine(1)
+        Initiator.objects.filter(pk=initiator.pk).update(last_seen=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(scan_initiators(), ([], 0))
+        self.assertEqual(self.statuses(logical_units), [BUSY])
+
+
+class ISCSITargetBatchTests(SimpleTestCase):
+    def setUp(self):
+        self.tgtd = FakeTGTD()
+        patch = mock.patch.object(ISCSITarget, "_execute", autospec=True, side_effect=self.tgtd.execute)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.iscsi_targets = [ISCSITarget(tid, "target%d" % tid) for tid in (1, 2)]
+        for iscsi_target in self.iscsi_targets:
+            iscsi_target.add()
+
+    def test_detach_all_logical_units_detaches_by_lun_number(self):
+        iscsi_target = self.iscsi_targets[0]
+        for lun in (3, 4):
+            iscsi_target.attach_logical_unit("/dev/vg0/lu%d" % lun, lun)
+        self.assertEqual(iscsi_target.detach_all_logical_units(), {"3": True, "4": True})
+        self.assertEqual(iscsi_target.list_active_logical_units(), {})
+        self.assertEqual(self.iscsi_targets[1].detach_all_logical_units(), {})
+
+    def test_close_all_connections_of_many_targets(self):
+        self.tgtd.targets["1"]["connections"] = {("10.0.0.1", "1", "0"), ("10.0.0.1", "1", "1")}
+        self.tgtd.targets["2"]["connections"] = {("10.0.0.2", "4", "0")}
+        self.assertEqual(ISCSITarget.close_all_connections_of(self.iscsi_targets), {
+            "1": {("10.0.0.1", "1", "0"): True, ("10.0.0.1", "1", "1"): True},
+            "2": {("10.0.0.2", "4", "0"): True}})
+        self.assertEqual([target["connections"] for target in self.tgtd.targets.values()], [set(), set()])
+
+    def test_run_batch_reports_failures_per_item(self):
+        def divide(value):
+            return 10 // value
+
+        with mock.patch("builtins.print"):  # run_batch reports the failure
+            results = ISCSITarget.run_batch([("a", divide, (2,)), ("b", divide, (0,))])
+        self.assertEqual(results, {"a": 5, "b": False})
+
+
+@override_settings(STORAGE_AGENT_TOKEN="secret")
+class StorageAgentTests(TransactionTestCase):
+    """two agents on this host, each a storage node, driven through the portal API; tgtadm & lvm are faked below
+    the helpers, everything from the portal views to the helper methods run by the agents is real"""
+
+    def setUp(self):
+        self.tgtd = FakeTGTD()
+        patches = [
+            mock.patch.object(ISCSITarget, "_execute", autospec=True, side_effect=self.tgtd.execute),
+            mock.patch.object(VolumeGroup, "get_logical_volumes", autospec=True, side_effect=lambda group, name=None:
+                              [LogicalVolume("/dev/%s/%s" % (group.get_name(), name))]),
+            mock.patch.object(LogicalVolume, "get_path", autospec=True, side_effect=lambda volume: volume._device_path),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.requests = []
+        self.nodes = []
+        for index in range(2):
+            server = agent_server.make_server("127.0.0.1", 0, "secret")
+            server.RequestHandlerClass = self.counting(server.RequestHandlerClass, index)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+            self.requests.append(0)
+            self.nodes.append(StorageNode.objects.create(
+                name="node%d" % index, agent_url="http://127.0.0.1:%d" % server.server_address[1],
+                iscsi_address="127.0.0.%d" % (index + 1)))
+
+    def counting(self, handler, index):
+        test = self
+
+        class CountingHandler(handler):
+            def do_POST(self):
+                test.requests[index] += 1
+                super().do_POST()
+
+        return CountingHandler
+
+    def test_create_attach_and_close_connections(self):
+        targets = []
+        for index, node in enumerate(self.nodes):
+            response = self.client.post("/api/targets/", {"name": "target%d" % index,
+                                                          "node": "http://testserver/api/storage_nodes/%d/" % node.pk})
+            self.assertEqual(response.status_code, 201)
+            targets.append(Target.objects.get(name="target%d" % index))
+        logical_units = [LogicalUnit.objects.create(name="lu%d" % index, group="vg0", node=node, target=target)
+                         for index, (node, target) in enumerate(zip(self.nodes, targets))]
+
+        response = self.client.post("/api/logical_units/transition_many/", {
+            "logical_units": [logical_unit.pk for logical_unit in logical_units], "status": "ONLINE"},
+            content_type="application/json").json()
+        self.assertEqual((response["result"], response["updated"]), (True, 2))
+        for logical_unit in logical_units:
+            self.assertEqual(self.tgtd.targets[str(logical_unit.target_id)]["luns"],
+                             {str(logical_unit.pk): "/dev/vg0/%s" % logical_unit.name})
+
+        for index, target in enumerate(targets):
+            self.tgtd.targets[str(target.pk)]["connections"] = {("10.0.0.%d" % index, "1", "0")}
+        response = self.client.post("/api/targets/close_connections/", {}, content_type="application/json").json()
+        self.assertEqual(response, {"result": True, "targets": dict(
+            (str(target.pk), {"10.0.0.%d/1/0" % index: True}) for index, target in enumerate(targets))})
+        self.assertEqual([self.tgtd.targets[str(target.pk)]["connections"] for target in targets], [set(), set()])
+        self.assertTrue(all(self.requests))
+
+    def test_refuses_calls_off_the_allow_list(self):
+        client = AgentClient(self.nodes[0].agent_url, "secret")
+        with self.assertRaises(AgentException):
+            client.call("ISCSITarget", [1, "target", 0], "_execute", ["--op", "show"])
+        with self.assertRaises(AgentException):
+            AgentClient(self.nodes[0].agent_url, "wrong").call("ISCSITarget", [1, "target", 0], "exists")
+
+
+@override_settings(EVENTS_STREAM_SECONDS=0.2, EVENTS_POLL_INTERVAL=0.05)
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.events = [events.record("logical_unit", 1, "1", "0"), events.record("target", 2, "2", "0"),
+                       events.record("logical_unit", 3, "0", "1")]
+
+    def read(self, path, **headers):
+        response = self.client.get(path, **headers)
+        self.assertEqual(response.status_code, 200)
+        body = b"".join(response.streaming_content).decode("utf-8")
+        response.close()
+        return [int(line[4:]) for line in body.splitlines() if line.startswith("id: ")], body
+
+    def test_replays_after_since(self):
+        ids, _ = self.read("/api/events/?since=%d" % self.events[0].id)
+        self.assertEqual(ids, [event.id for event in self.events[1:]])
+
+    def test_replays_after_last_event_id(self):
+        ids, _ = self.read("/api/events/?since=0", HTTP_LAST_EVENT_ID=str(self.events[1].id))
+        self.assertEqual(ids, [self.events[2].id])
+
+    def test_without_since_only_new_events(self):
+        self.assertEqual(self.read("/api/events/")[0], [])
+
+    def test_models_filter(self):
+        ids, _ = self.read("/api/events/?since=0&models=logical_unit")
+        self.assertEqual(ids, [self.events[0].id, self.events[2].id])
+
+    def test_reset_once_events_were_pruned(self):
+        events.ChangeEvent.objects.filter(pk=self.events[0].pk).delete()
+        ids, body = self.read("/api/events/?since=%d" % (self.events[0].id - 1))
+        self.assertTrue(body.startswith("event: reset\n"))
+        self.assertEqual(ids, [event.id for event in self.events[1:]])
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get("/api/events/?since=abc").status_code, 400)
+
+    @override_settings(EVENTS_MAX_CLIENTS=1)
+    def test_caps_clients_per_process(self):
+        first = self.client.get("/api/events/")
+        self.assertEqual(first.status_code, 200)
+        refused = self.client.get("/api/events/")
+        self.assertEqual((refused.status_code, refused["Retry-After"]), (503, "1"))
+        first.close()  # never read, the slot is freed all the same
+        self.assertEqual(self.read("/api/events/")[0], [])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Tag.objects.create(name="lab")
+
+    def test_not_modified_and_cached(self):
+        response = self.client.get("/api/tags/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Cache", response)
+        cached = self.client.get("/api/tags/")
+        self.assertEqual((cached["X-Cache"], cached.content), ("HIT", response.content))
+        self.assertEqual(self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get("/api/tags/", HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertEqual(self.client.get("/api/tags/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code,
+                         304)
+        self.assertEqual(self.client.get("/api/tags/", HTTP_IF_MODIFIED_SINCE=http_date(0)).status_code, 200)
+
+    def test_invalidated_by_saves(self):
+        etag = self.client.get("/api/tags/")["ETag"]
+        self.assertEqual(self.client.post("/api/tags/", {"name": "classroom"}).status_code, 201)
+        response = self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Cache", response)
+        self.assertIn(b"classroom", response.content)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_invalidated_by_bulk_updates(self):
+        etag = self.client.get("/api/tags/")["ETag"]
+        Tag.objects.update(description="bulk")  # no signals, the caller bumps
+        self.assertEqual(self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        bump("tag")
+        response = self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"bulk", response.content)
+
+    def test_invalidated_by_storage_changes(self):
+        etag = self.client.get("/api/targets/")["ETag"]
+        with mock.patch("subprocess.check_output", return_value=b'  Logical volume "lu0" created.\n'):
+            self.assertTrue(VolumeGroup("vg0").create_logical_volume("lu0", 1))
+        self.assertEqual(self.client.get("/api/targets/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_varies_by_path(self):
+        self.assertNotEqual(self.client.get("/api/tags/")["ETag"], self.client.get("/api/targets/")["ETag"])
+
+
+class UploadTests(TransactionTestCase):
+    """transactional, since upload progress is saved from the writer thread"""
+
+    def setUp(self):
+        self.image = os.urandom(10 * CHUNK_SIZE + 100)
+        self.sha256 = hashlib.sha256(self.image).hexdigest()
+        volume = tempfile.NamedTemporaryFile(delete=False)
+        volume.truncate(16 * CHUNK_SIZE)
+        volume.close()
+        self.path = volume.name
+        self.addCleanup(os.remove, self.path)
+        self.logical_unit = LogicalUnit.objects.create(name="lu0", group="vg0", status=OFFLINE)
+        self.url = "/api/logical_units/%d/upload/" % self.logical_unit.pk
+        patch = mock.patch.object(LogicalUnitViewSet, "get_logical_volume",
+                                  return_value=mock.Mock(**{"get_path.return_value": self.path}))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def put(self, data, **params):
+        query = "&".join("%s=%s" % item for item in sorted(params.items()))
+        response = self.client.put(self.url + "?" + query, data, content_type="application/octet-stream")
+        return response.status_code, response.json()
+
+    def offset(self):
+        return self.client.get(self.url).json()["offset"]
+
+    def test_upload(self):
+        (status_code, body) = self.put(self.image, sha256=self.sha256)
+        self.assertEqual((status_code, body["result"], body["offset"]), (200, True, len(self.image)))
+        self.assertEqual(read(self.path)[:len(self.image)], self.image)
+        self.assertEqual(self.offset(), 0)  # nothing left to resume
+
+    def test_resume(self):
+        middle = 4 * CHUNK_SIZE
+        (status_code, body) = self.put(self.image[:middle])
+        self.assertEqual((status_code, body["message"], body["offset"]), (200, "Written, more to come", middle))
+        self.assertEqual(self.offset(), middle)
+        (status_code, body) = self.put(self.image[middle + 1:], offset=middle + 1)  # past what was written
+        self.assertEqual((status_code, body["offset"]), (409, middle))
+        (status_code, body) = self.put(self.image[middle:], offset=middle, sha256=self.sha256)
+        self.assertEqual((status_code, body["result"], body["sha256"]), (200, True, self.sha256))
+        self.assertEqual(read(self.path)[:len(self.image)], self.image)
+
+    def test_checksum_mismatch(self):
+        (status_code, body) = self.put(self.image, sha256="0" * 64)
+        self.assertEqual((status_code, body["result"], body["offset"], body["sha256"]), (417, False, 0, self.sha256))
+        self.assertEqual(self.offset(), 0)
+
+    def test_early_end(self):
+        sent = 3 * CHUNK_SIZE + 7
+        with mock.patch("api.views.get_upload_stream", return_value=(io.BytesIO(self.image[:sent]), len(self.image))):
+            (status_code, body) = self.put(self.image, sha256=self.sha256)
+        self.assertEqual((status_code, body["result"], body["offset"], body["message"]),
+                         (200, False, sent, "Upload ended early, resume it"))
+        self.assertEqual(self.offset(), sent)
+
+    def test_refused(self):
+        self.assertEqual(self.put(os.urandom(17 * CHUNK_SIZE))[0], 400)  # larger than the volume
+        LogicalUnit.objects.filter(pk=self.logical_unit.pk).update(status=BUSY)
+        self.assertEqual(self.put(self.image)[0], 400)
+        self.assertEqual(self.offset(), 0)
+
+    @override_settings(IMAGE_STREAM_BLOCK_SIZE=CHUNK_SIZE, UPLOAD_SYNC_BYTES=4 * CHUNK_SIZE)
+    def test_progress_is_reported_as_synced(self):
+        progress = []
+        self.assertEqual(write_stream(io.BytesIO(self.image), self.path, CHUNK_SIZE, progress=progress.append),
+                         CHUNK_SIZE + len(self.image))
+        self.assertEqual(progress, [5 * CHUNK_SIZE, 9 * CHUNK_SIZE, CHUNK_SIZE + len(self.image)])
+        self.assertEqual(read(self.path)[CHUNK_SIZE:CHUNK_SIZE + len(self.image)], self.image)
+
+
+class ImageDownloadTests(TestCase):
+    def test_range_requests_must_name_a_snapshot(self):
+        logical_unit = LogicalUnit.objects.create(name="lu0", group="vg0")
+        response = self.client.get("/api/logical_units/%d/image/" % logical_unit.pk, HTTP_RANGE="bytes=0-99")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("must name a snapshot", response.json()["detail"])
+
+
+class RepositoryTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.repository = Repository(os.path.join(self.directory.name, "repository"), CHUNK_SIZE)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_store_and_restore(self):
+        write_image(self.path("source"), [1, 2, 0, 1], tail=b"end")
+        manifest = self.repository.store(self.path("source"), "image", workers=2)
+        self.assertEqual(manifest["size"], 4 * CHUNK_SIZE + 3)
+        self.assertIsNone(manifest["chunks"][2])
+        self.assertEqual(manifest["chunks"][0], manifest["chunks"][3])
+        self.assertEqual(manifest["new_chunks"], 3)  # 1, 2 & the tail; the zero chunk & the repeat are not stored
+        self.repository.restore("image", self.path("restored"), workers=2, skip_zero=True)
+        self.assertEqual(read(self.path("restored")), read(self.path("source")))
+        self.assertEqual(self.repository.verify("image"), [])
+
+    def test_store_counts_repeated_chunks_once(self):
+        write_image(self.path("source"), [7] * 64)
+        for attempt in range(5):
+            manifest = self.repository.store(self.path("source"), "image%d" % attempt, workers=8)
+            self.assertEqual(manifest["new_chunks"], 1 if attempt == 0 else 0)
+        self.assertEqual(os.listdir(os.path.join(self.repository.get_root(), "tmp")), [])
+
+    def test_store_deduplicates_across_images(self):
+        write_image(self.path("a"), [1, 2, 3])
+        write_image(self.path("b"), [1, 2, 4])
+        self.repository.store(self.path("a"), "a")
+        manifest = self.repository.store(self.path("b"), "b")
+        self.assertEqual((manifest["new_chunks"], manifest["new_bytes"]), (1, CHUNK_SIZE))
+        self.assertEqual(self.repository.get_usage()["chunks"], 4)
+
+    def test_collect_garbage_keeps_referenced_chunks(self):
+        write_image(self.path("a"), [1, 2, 3])
+        write_image(self.path("b"), [1, 2, 4])
+        self.repository.store(self.path("a"), "a")
+        self.repository.store(self.path("b"), "b")
+        self.repository.remove_image("a")
+        self.assertEqual(self.repository.collect_garbage(grace_seconds=3600), (0, 0))  # too recent yet
+        past = time.time() - 7200
+        for directory, _, names in os.walk(os.path.join(self.repository.get_root(), "chunks")):
+            for name in names:
+                os.utime(os.path.join(directory, name), (past, past))
+        self.assertEqual(self.repository.collect_garbage(grace_seconds=3600), (1, CHUNK_SIZE))
+        self.assertEqual(self.repository.verify("b"), [])
+
+    def test_rejects_invalid_digests(self):
+        for digest in ("../../etc/passwd", "A" * 64, "0" * 63):
+            with self.assertRaises(ValueError):
+                self.repository.has_chunk(digest)
+
+
+class ReplicationTests(SimpleTestCase):
+    token = "secret"
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = Repository(os.path.join(self.directory.name, "source"), CHUNK_SIZE)
+        self.server = make_server(os.path.join(self.directory.name, "peer"), "127.0.0.1", 0, self.token, CHUNK_SIZE)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.peer = Repository(os.path.join(self.directory.name, "peer"), CHUNK_SIZE)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def store(self, name, chunks):
+        path = os.path.join(self.directory.name, name)
+        write_image(path, chunks)
+        self.source.store(path, name)
+        return path
+
+    def replicate(self, name, token=token):
+        return replicate(self.source, name, "127.0.0.1", self.port, token, workers=2)
+
+    def test_sends_only_the_delta(self):
+        self.store("a", [1, 2, 3, 0])
+        stats = self.replicate("a")
+        self.assertEqual((stats["sent_chunks"], stats["up_to_date"]), (3, False))
+        path = self.store("b", [1, 2, 4, 0])
+        stats = self.replicate("b")
+        self.assertEqual((stats["sent_chunks"], stats["sent_bytes"]), (1, CHUNK_SIZE))
+        restored = os.path.join(self.directory.name, "restored")
+        self.peer.restore("b", restored)
+        self.assertEqual(read(restored), read(path))
+        self.assertTrue(self.replicate("b")["up_to_date"])
+
+    def test_refuses_a_wrong_token(self):
+        self.store("a", [1])
+        with self.assertRaises(ReplicationException):
+            self.replicate("a", token="wrong")
+        self.assertIsNone(self.peer.read_manifest("a"))
+
+    def test_requires_a_token_unless_insecure(self):
+        with self.assertRaises(ReplicationException):
+            make_server(self.peer.get_root(), "127.0.0.1", 0)
+
+
+class HTTPDriverTests(SimpleTestCase):
+    def setUp(self):
+        self.server, self.pdu = simulator.serve(port=0, outlets=4)
+        self.driver = HTTPDriver("127.0.0.1", self.server.server_address[1])
+
+    def tearDown(self):
+        self.driver.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_switches_outlets(self):
+        self.assertTrue(self.driver.power_on(2))
+        self.assertTrue(self.driver.get_state(2))
+        self.assertFalse(self.driver.get_state(1))
+        self.assertTrue(self.driver.power_off(2))
+        self.assertFalse(self.driver.get_state(2))
+        self.assertEqual([(outlet, state) for _, outlet, state in self.pdu.events], [(2, "on"), (2, "off")])
+
+    def test_unknown_outlet(self):
+        self.assertFalse(self.driver.power_on(99))
+        with self.assertRaises(PowerException):
+            self.driver.get_state(99)
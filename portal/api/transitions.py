@@ -0,0 +1,86 @@
+from django.db import transaction
+from api.caching import bump
+from api.events import record_many
+from api.fleet import run_on_fleet
+from api.locks import logical_unit_lock
+from api.models import LogicalUnit
+from helpers.lvm2.entities import DiskStatus as LogicalUnitStatus
+
+OFFLINE = LogicalUnitStatus.OFFLINE.value
+ONLINE = LogicalUnitStatus.ONLINE.value
+BUSY = LogicalUnitStatus.BUSY.value
+MODIFIED = LogicalUnitStatus.MODIFIED.value
+MOUNTED = LogicalUnitStatus.MOUNTED.value
+
+# (from, to) -> tgtd side effect; BUSY & MOUNTED are only entered by the boot & map handshakes
+TRANSITIONS = {
+    (OFFLINE, ONLINE): "attach",
+    (MODIFIED, ONLINE): "attach",
+    (ONLINE, OFFLINE): "detach",
+    (BUSY, OFFLINE): "detach",
+    (MODIFIED, OFFLINE): "detach",
+    (MOUNTED, OFFLINE): "detach",
+    (MOUNTED, MODIFIED): "detach",
+    (BUSY, ONLINE): None,
+}
+
+
+def parse_status(value):
+    """a DiskStatus from its value ("1") or name ("ONLINE"), None when neither"""
+    for status in LogicalUnitStatus:
+        if str(value) == status.value or str(value).upper() == status.name:
+            return status.value
+    return None
+
+
+def transition_logical_units(logical_units, status, side_effects, condition=None):
+    """moves logical units to `status`: validates each against TRANSITIONS, runs the tgtd side effects
+    (side_effects["attach"|"detach"](logical_unit) -> bool) concurrently under each logical unit's lock, then
+    writes all new statuses in one transaction; returns per logical unit results. A condition (Q on LogicalUnit)
+    must still hold when the side effect runs and when the status is written, or the logical unit is left alone"""
+    still = LogicalUnit.objects.filter(condition) if condition is not None else LogicalUnit.objects.all()
+    results = dict((logical_unit.id, {"logical_unit": logical_unit.id, "name": logical_unit.name,
+                                      "from": logical_unit.status, "to": status, "result": False, "message": None,
+                                      "seconds": 0.0}) for logical_unit in logical_units)
+    candidates = []
+    for logical_unit in logical_units:
+        if logical_unit.status == status:
+            results[logical_unit.id].update(result=True, message="Already in that state")
+        elif (logical_unit.status, status) not in TRANSITIONS:
+            results[logical_unit.id]["message"] = "Transition %s -> %s is not allowed" % (
+                LogicalUnitStatus(logical_unit.status).name, LogicalUnitStatus(status).name)
+        elif TRANSITIONS[(logical_unit.status, status)] == "attach" and not logical_unit.target_id:
+            results[logical_unit.id]["message"] = "Logical unit has no target to attach to"
+        else:
+            candidates.append(logical_unit)
+
+    def apply_side_effect(logical_unit):
+        with logical_unit_lock(logical_unit):
+            current = still.filter(pk=logical_unit.pk).values_list("status", flat=True).first()
+            if current != logical_unit.status:
+                return False, "Logical unit changed state meanwhile"
+            side_effect = TRANSITIONS[(logical_unit.status, status)]
+            if side_effect == "attach":
+                side_effects["detach"](logical_unit)  # if already attached, detach it
+            if side_effect and not side_effects[side_effect](logical_unit):
+                return False, "Unable to %s logical unit" % side_effect
+            return True, "%sed" % side_effect.capitalize() if side_effect else "Updated"
+
+    applied = {}
+    for outcome in run_on_fleet(candidates, apply_side_effect):
+        results[outcome["logical_unit"]].update(result=outcome["result"], message=outcome["message"],
+                                                seconds=outcome["seconds"])
+        if outcome["result"]:
+            applied.setdefault(results[outcome["logical_unit"]]["from"], []).append(outcome["logical_unit"])
+    updated = 0
+    with transaction.atomic():
+        for previous_status, ids in applied.items():
+            rows = list(still.select_for_update().filter(pk__in=ids, status=previous_status)
+                        .values_list("id", flat=True))
+            updated += LogicalUnit.objects.filter(pk__in=rows).update(status=status)
+            record_many("logical_unit", rows, status, previous_status)
+            for logical_unit_id in set(ids) - set(rows):
+                results[logical_unit_id].update(result=False, message="Logical unit changed state meanwhile")
+        if updated:
+            bump("logicalunit")
+    return [results[logical_unit.id] for logical_unit in logical_units], updated
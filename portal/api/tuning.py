@@ -0,0 +1,68 @@
+import json
+import shutil
+import subprocess
+import time
+from django.conf import settings
+
+
+def get_tuning_profile(name):
+    """backing store settings applied when a logical unit is attached: bstype (rdwr/aio), bsoflags (direct/sync),
+    write_cache & readonly; unknown names fall back to tgtd defaults"""
+    return settings.TUNING_PROFILES.get(name) or settings.TUNING_PROFILES.get("default") or {}
+
+
+# workload name: (fio rw, block size); dd only runs the sequential ones
+WORKLOADS = {
+    "seqread": ("read", "1m"),
+    "seqwrite": ("write", "1m"),
+    "randread": ("randread", "4k"),
+    "randwrite": ("randwrite", "4k"),
+}
+
+
+def _fio(device, profile, rw, block_size, size_in_mb, runtime):
+    direct = profile.get("bsoflags") == "direct"
+    aio = profile.get("bstype") == "aio"
+    output = subprocess.check_output([
+        "fio", "--name=bench", "--filename=" + device, "--rw=" + rw, "--bs=" + block_size,
+        "--size=%dm" % size_in_mb, "--runtime=%d" % runtime, "--time_based", "--output-format=json",
+        "--ioengine=" + ("libaio" if aio else "psync"), "--iodepth=%d" % (32 if aio else 1),
+        "--direct=%d" % direct, "--sync=%d" % (profile.get("bsoflags") == "sync")])
+    job = json.loads(output.decode("utf-8"))["jobs"][0]
+    side = job["write" if "write" in rw else "read"]
+    return {"bytes_per_second": side["bw_bytes"], "iops": side["iops"]}
+
+
+def _dd(device, profile, rw, block_size, size_in_mb):
+    flag = {"direct": "direct", "sync": "sync"}.get(profile.get("bsoflags"))
+    count = size_in_mb  # 1 MiB blocks
+    if rw == "write":
+        command = ["dd", "if=/dev/zero", "of=" + device, "bs=1M", "count=%d" % count, "conv=notrunc,fdatasync"]
+        command += ["oflag=" + flag] if flag else []
+    else:
+        command = ["dd", "if=" + device, "of=/dev/null", "bs=1M", "count=%d" % count]
+        command += ["iflag=direct"] if flag == "direct" else []
+    started = time.monotonic()
+    subprocess.check_output(command, stderr=subprocess.STDOUT)
+    seconds = max(time.monotonic() - started, 1e-6)
+    return {"bytes_per_second": count * 1024 * 1024 / seconds, "iops": count / seconds}
+
+
+def benchmark_profile(device, profile, workloads=None, size_in_mb=1024, runtime=30):
+    """I/O rates of the device when accessed the way tgtd's backing store does under the profile (bstype aio or
+    rdwr, bsoflags direct or sync): fio when installed, else sequential dd passes. Write workloads overwrite the
+    device. Returns {workload: {bytes_per_second, iops} or {error}}"""
+    use_fio = shutil.which("fio") is not None
+    results = {}
+    for workload in workloads or list(WORKLOADS):
+        rw, block_size = WORKLOADS[workload]
+        if not use_fio and rw.startswith("rand"):
+            continue
+        try:
+            if use_fio:
+                results[workload] = _fio(device, profile, rw, block_size, size_in_mb, runtime)
+            else:
+                results[workload] = _dd(device, profile, rw, block_size, size_in_mb)
+        except (subprocess.CalledProcessError, OSError, ValueError, KeyError) as e:
+            results[workload] = {"error": str(e)}
+    return results
@@ -1,20 +1,44 @@
-from rest_framework import viewsets, status
+import time
+import uuid
+from rest_framework import mixins, viewsets, status
 from rest_framework.response import Response
 from rest_framework.exceptions import ParseError
-from rest_framework.decorators import detail_route
-from django.http import JsonResponse
+from rest_framework.decorators import detail_route, list_route
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse
 from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
 from django.urls import resolve
 from urllib.parse import urlparse
-from api.models import PDU, KVM, Initiator, Target, LogicalUnit, Snapshot
-from api.serializers import PDUSerializer, KVMSerializer, InitiatorSerializer, TargetSerializer, LogicalUnitSerializer,\
-    SnapshotSerializer
-from helpers.lvm2.entities import VolumeGroup
+from api import events, metrics
+from api.caching import ConditionalGetMixin, bump
+from api.fleet import run_on_fleet
+from api.images import collect_garbage, dump_to_repository, get_repository, remove_image, \
+    restore_from_repository
+from api.locks import target_lock, logical_unit_lock
+from api.nodes import get_node_stats, get_volume_group, schedule_node
+from api.placement import PLACEMENTS, create_placed_logical_volume
+from api.prewarm import describe_prewarm, get_hot_ranges, prewarm_logical_unit, record_hot_ranges, served_volume
+from api.jobs import start_job
+from api.portals import choose_portal
+from api.power import ACTIONS as POWER_ACTIONS, get_outlet_states, power_initiators
+from api.snapshot_monitor import suggest_snapshot_size
+from api.streaming import RangeFile, RangeNotSatisfiable, get_size, get_upload_stream, open_image, parse_range, \
+    read_back_digest, write_stream
+from api.telemetry import get_io_stats
+from api.transitions import parse_status, transition_logical_units
+from api.tuning import get_tuning_profile
+from api.wake import wake_initiators
+from api.warm_pool import claim_logical_volume, discard_in_background
+from api.shards import choose_shard, get_shards, get_iscsi_target
+from api.models import PDU, KVM, Initiator, Tag, StorageNode, Target, LogicalUnit, Snapshot, Job, Image, \
+    mac_address_variants, normalize_mac_address
+from api.serializers import PDUSerializer, KVMSerializer, InitiatorSerializer, TagSerializer, StorageNodeSerializer,\
+    TargetSerializer, LogicalUnitSerializer, SnapshotSerializer, JobSerializer, ImageSerializer
+from helpers.agent.client import AgentException
 from helpers.lvm2.entities import DiskStatus as LogicalUnitStatus
 from helpers.tgtadm.iscsi_target import ISCSITarget
 from helpers.tgtadm.iscsi_initiator import ISCSIInitiator
-from datetime import datetime
 
 
 def url_resolver(url):
@@ -22,54 +46,168 @@ def url_resolver(url):
     return resolved_kwargs['pk']
 
 
-class PDUViewSet(viewsets.ModelViewSet):
+class PDUViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = PDU.objects.all()
     serializer_class = PDUSerializer
+    cache_models = ("pdu", "initiator")
+
+    @detail_route()
+    def outlets(self, request, pk):
+        pdu = PDU.objects.get(pk=pk)
+        names = dict(pdu.outlet_endpoint.values_list("pdu_device_port", "name"))
+        states = get_outlet_states(pdu, list(range(1, pdu.total_outlets + 1)))
+        return JsonResponse({"result": True, "outlets": [
+            {"outlet": outlet, "initiator": names.get(outlet), "on": on} for outlet, on in sorted(states.items())]})
 
 
-class KVMViewSet(viewsets.ModelViewSet):
+class KVMViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = KVM.objects.all()
     serializer_class = KVMSerializer
+    cache_models = ("kvm", "initiator")
 
 
-class InitiatorViewSet(viewsets.ModelViewSet):
+class InitiatorViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Initiator.objects.all()
     serializer_class = InitiatorSerializer
+    cache_models = ("initiator", "target")
+
+    @staticmethod
+    def get_power_action(data):
+        action = data.__getitem__('action') if data.__contains__('action') else None
+        if action not in POWER_ACTIONS:
+            raise ParseError("'action' must be one of %s" % ", ".join(POWER_ACTIONS))
+        return action
+
+    @detail_route(methods=["GET", "POST"])
+    def power(self, request, pk):
+        """GET reads the state of the initiator's PDU outlet, POST switches it with {"action": "on|off|cycle"}"""
+        initiator = Initiator.objects.select_related("pdu_device").get(pk=pk)
+        if not initiator.pdu_device or not initiator.pdu_device_port:
+            raise ParseError("No PDU outlet configured for this initiator")
+        if request.method == "GET":
+            state = get_outlet_states(initiator.pdu_device, [initiator.pdu_device_port])[initiator.pdu_device_port]
+            return JsonResponse({"result": state is not None, "on": state})
+        result = power_initiators([initiator], self.get_power_action(request.data), rate=0)[0]
+        return JsonResponse({"result": result["result"], "message": result["message"]})
+
+    @staticmethod
+    def select_initiators(data):
+        """initiators matching all given selectors: initiators, targets (ids or URLs), pdu & tag"""
+        def to_pk(value):
+            return url_resolver(value) if "/" in str(value) else int(value)
+
+        initiators = Initiator.objects.select_related("pdu_device")
+        selected = False
+        if data.__contains__('initiators') and data.__getitem__('initiators'):
+            initiators = initiators.filter(pk__in=[to_pk(pk) for pk in data.__getitem__('initiators')])
+            selected = True
+        if data.__contains__('targets') and data.__getitem__('targets'):
+            initiators = initiators.filter(target__in=[to_pk(pk) for pk in data.__getitem__('targets')])
+            selected = True
+        if data.__contains__('pdu') and data.__getitem__('pdu'):
+            initiators = initiators.filter(pdu_device=to_pk(data.__getitem__('pdu')))
+            selected = True
+        if data.__contains__('tag') and data.__getitem__('tag'):
+            initiators = initiators.filter(tags__name=data.__getitem__('tag'))
+            selected = True
+        if not selected:
+            raise ParseError("One of 'initiators', 'targets', 'pdu' or 'tag' is required")
+        return list(initiators.distinct().order_by("pdu_device", "pdu_device_port"))
+
+    @list_route(methods=["POST"])
+    def power_many(self, request):
+        """switches the outlets of many initiators at once; power-ons are staggered to BOOTS_PER_SECOND unless a
+        'rate' is given"""
+        started = time.monotonic()
+        action = self.get_power_action(request.data)
+        initiators = self.select_initiators(request.data)
+        rate = float(request.data.__getitem__('rate')) if request.data.__contains__('rate') else None
+        results = power_initiators(initiators, action, rate)
+        return JsonResponse({"result": all(result["result"] for result in results), "results": results,
+                             "seconds": round(time.monotonic() - started, 3)})
+
+    @list_route(methods=["POST"])
+    def wake(self, request):
+        """wakes the selected initiators with Wake-on-LAN paced to BOOTS_PER_SECOND (or 'rate') in a background job
+        that checks each one asks for its boot disk within 'deadline' seconds and wakes stragglers again up to
+        'retries' times, power cycling those left over if 'power_fallback' is set"""
+        initiators = [initiator for initiator in self.select_initiators(request.data) if initiator.mac_address]
+        if not initiators:
+            raise ParseError("No initiators selected")
+        rate = float(request.data.__getitem__('rate')) if request.data.__contains__('rate') else None
+        deadline = float(request.data.__getitem__('deadline')) if request.data.__contains__('deadline') else None
+        retries = int(request.data.__getitem__('retries')) if request.data.__contains__('retries') else None
+        power_fallback = str(request.data.__getitem__('power_fallback')).lower() == "true" \
+            if request.data.__contains__('power_fallback') else False
+        job = start_job("wake", wake_initiators, initiators, rate, deadline, retries, power_fallback)
+        return Response(JobSerializer(instance=job, context={'request': request}).data,
+                        status=status.HTTP_202_ACCEPTED)
+
+
+class TagViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Tag.objects.all()
+    serializer_class = TagSerializer
+    cache_models = ("tag", "logicalunit", "initiator")
+
+
+class JobViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    cache_models = ("job",)
+
+
+class StorageNodeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = StorageNode.objects.all()
+    serializer_class = StorageNodeSerializer
+    cache_models = ("storagenode", "target", "logicalunit")
+
+    @detail_route()
+    def stats(self, request, pk):
+        node = StorageNode.objects.get(pk=pk)
+        try:
+            return JsonResponse({"result": True, "stats": get_node_stats(node)})
+        except AgentException as e:
+            return JsonResponse({"result": False, "message": str(e)})
 
 
-class TargetViewSet(viewsets.ModelViewSet):
+class TargetViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Target.objects.all()
     serializer_class = TargetSerializer
+    cache_models = ("target", "logicalunit", "storage")
+
+    def perform_create(self, serializer):
+        if self.request.data.__contains__('shard') and self.request.data.__getitem__('shard') not in (None, ""):
+            if int(self.request.data.__getitem__('shard')) >= len(get_shards()):
+                raise ParseError("No tgtd shard configured with that number")
+            serializer.save()
+        else:
+            serializer.save(shard=choose_shard())
 
     def get_queryset(self):
         mac_address = self.request.query_params.get("mac_address", None)
         if mac_address:
-            self.queryset = self.queryset.filter(initiator__mac_address=mac_address)
+            self.queryset = self.queryset.filter(initiator__mac_address__in=mac_address_variants(mac_address) or
+                                                 [mac_address])
         return self.queryset
 
     @staticmethod
     def attach_all_usable_logical_units(target):
-        logical_units = target.logical_units.filter(status=LogicalUnitStatus.OFFLINE.value, use=True)
-        for logical_unit in logical_units:
-            LogicalUnitViewSet.detach_from_target(logical_unit)  # if already attached, detach it
-            LogicalUnitViewSet.attach_to_target(logical_unit)
-            logical_unit.status = LogicalUnitStatus.ONLINE.value
-            logical_unit.save()
+        logical_units = list(target.logical_units.filter(status=LogicalUnitStatus.OFFLINE.value, use=True))
+        return LogicalUnitViewSet.transition(logical_units, LogicalUnitStatus.ONLINE.value)
 
     @staticmethod
     def detach_all_active_logical_units(iscsi_target):
-        active_logical_units = iscsi_target.list_active_logical_units()
-        for lun_id in active_logical_units:
-            iscsi_target.detach_logical_unit(lun_id)
+        return iscsi_target.detach_all_logical_units()
 
     @staticmethod
     def get_boot_logical_unit(target):
         get_next_disk = False
         logical_unit = target.logical_units.filter(status=LogicalUnitStatus.BUSY.value).first()
         if logical_unit and logical_unit.boot_count <= 0 and logical_unit.snapshots.filter(active=True):
-            logical_unit.status = LogicalUnitStatus.MODIFIED.value
-            logical_unit.save()
-            LogicalUnitViewSet.detach_from_target(logical_unit)
+            with logical_unit_lock(logical_unit):
+                logical_unit.status = LogicalUnitStatus.MODIFIED.value
+                logical_unit.save()
+                LogicalUnitViewSet.detach_from_target(logical_unit)
             get_next_disk = True
         if not logical_unit or get_next_disk:
             logical_unit = target.logical_units.filter(status=LogicalUnitStatus.ONLINE.value, last_attached=None
@@ -82,62 +220,94 @@ class TargetViewSet(viewsets.ModelViewSet):
                     pass
         return logical_unit if logical_unit else None
 
+    @staticmethod
+    def boot_handshake(target):
+        """prepares the target for its initiator to boot; returns (logical_unit, iscsi_target, error message)"""
+        with target_lock(target):
+            iscsi_target = get_iscsi_target(target)
+            if not iscsi_target.exists():
+                iscsi_target.add()
+            iscsi_target.bind_to_initiator()  # opposite: iscsi_target.unbind_from_initiator()
+            TargetViewSet.detach_all_active_logical_units(iscsi_target)
+            iscsi_target.close_initiator_connections(ISCSIInitiator(target.initiator.ip_address))
+            logical_unit = TargetViewSet.get_boot_logical_unit(target)
+            if not logical_unit:
+                return None, iscsi_target, "No logical unit found for booting"
+            with logical_unit_lock(logical_unit):
+                logical_unit.refresh_from_db()
+                if logical_unit.status not in [LogicalUnitStatus.ONLINE.value, LogicalUnitStatus.BUSY.value]:
+                    return None, iscsi_target, "Logical unit changed state while booting"
+                check_passed = LogicalUnitViewSet.attach_to_target(logical_unit)
+                if not check_passed:
+                    return None, iscsi_target, "Unable to attach logical unit to target"
+                logical_unit.status = LogicalUnitStatus.BUSY.value
+                logical_unit.last_attached = timezone.now()
+                if logical_unit.boot_count > 0:
+                    logical_unit.boot_count -= 1
+                logical_unit.save()
+            target.portal = choose_portal(target)
+            target.save(update_fields=["portal"])
+            target.initiator.last_initiated = timezone.now()
+            target.initiator.save()
+        return logical_unit, iscsi_target, None
+
     @detail_route()
     def get_boot_disk_info(self, request, pk):
         target = Target.objects.get(pk=pk)
-        iscsi_target = ISCSITarget(pk, target.name)
-        if not iscsi_target.exists():
-            iscsi_target.add()
-        iscsi_target.bind_to_initiator()  # opposite: iscsi_target.unbind_from_initiator()
-        self.detach_all_active_logical_units(iscsi_target)
-        iscsi_target.close_initiator_connections(ISCSIInitiator(target.initiator.ip_address))
-        logical_unit = self.get_boot_logical_unit(target)
+        logical_unit, iscsi_target, message = self.boot_handshake(target)
         if not logical_unit:
-            return JsonResponse({'result': False, 'message': "No logical unit found for booting"})
-        check_passed = LogicalUnitViewSet.attach_to_target(logical_unit)
-        if not check_passed:
-            return JsonResponse({'result': False, 'message': "Unable to attach logical unit to target"})
-        logical_unit.status = LogicalUnitStatus.BUSY.value
-        logical_unit.last_attached = timezone.now()
-        if logical_unit.boot_count > 0:
-            logical_unit.boot_count -= 1
-        logical_unit.save()
-        target.initiator.last_initiated = datetime.now()
-        target.initiator.save()
+            return JsonResponse({'result': False, 'message': message})
         return JsonResponse({'result': True, "lun": "{0:x}".format(logical_unit.id), "iqn": iscsi_target.get_name(),
-                             'message': "use lun id and iqn to form iSCSI URL"})
+                             "portal": target.portal, 'message': "use portal, lun id and iqn to form iSCSI URL"})
 
     @detail_route()
     def get_map_disk_info(self, request, pk):
         target = Target.objects.get(pk=pk)
-        iscsi_target = ISCSITarget(pk, target.name)
-        if not iscsi_target.exists() and iscsi_target.add():
-            pass
-        iscsi_target.bind_to_initiator()  # opposite: iscsi_target.unbind_from_initiator()
-        logical_unit = target.logical_units.filter(status=LogicalUnitStatus.MODIFIED.value).first()
-        if not logical_unit:
-            return JsonResponse({'result': False, 'message': "No logical unit found for mapping"})
-        device_path = LogicalUnitViewSet.get_device_path(logical_unit)
-        if device_path:
-            lun_id = iscsi_target.get_logical_unit_number(device_path)
-            if lun_id and str(lun_id) == str(logical_unit.id):
-                logical_unit.status = LogicalUnitStatus.MOUNTED.value
-                logical_unit.save()
-                return JsonResponse({'result': True, "lun": "{0:x}".format(logical_unit.id), "iqn": iscsi_target.get_name(),
-                                     'message': "use lun id and iqn to form iSCSI URL"})
-            return JsonResponse({'result': False, 'message': "No target online or online with different id"})
+        with target_lock(target):
+            iscsi_target = get_iscsi_target(target)
+            if not iscsi_target.exists() and iscsi_target.add():
+                pass
+            iscsi_target.bind_to_initiator()  # opposite: iscsi_target.unbind_from_initiator()
+            logical_unit = target.logical_units.filter(status=LogicalUnitStatus.MODIFIED.value).first()
+            if not logical_unit:
+                return JsonResponse({'result': False, 'message': "No logical unit found for mapping"})
+            with logical_unit_lock(logical_unit):
+                device_path = LogicalUnitViewSet.get_device_path(logical_unit)
+                if device_path:
+                    lun_id = iscsi_target.get_logical_unit_number(device_path)
+                    if lun_id and str(lun_id) == str(logical_unit.id):
+                        logical_unit.status = LogicalUnitStatus.MOUNTED.value
+                        logical_unit.save()
+                        return JsonResponse({'result': True, "lun": "{0:x}".format(logical_unit.id),
+                                             "iqn": iscsi_target.get_name(),
+                                             'message': "use lun id and iqn to form iSCSI URL"})
+                    return JsonResponse({'result': False, 'message': "No target online or online with different id"})
         return JsonResponse({'result': False, 'message': "No logical volume path was discovered"})
 
+    @list_route(methods=["POST"])
+    def close_connections(self, request):
+        """closes all iSCSI connections of the given target ids (or of every target) in one batch"""
+        targets = Target.objects.all()
+        if request.data.__contains__('targets') and request.data.__getitem__('targets'):
+            targets = targets.filter(pk__in=request.data.__getitem__('targets'))
+        iscsi_targets = [get_iscsi_target(target) for target in targets]
+        results = ISCSITarget.close_all_connections_of(iscsi_targets)
+        return JsonResponse({"result": all(all(closed.values()) for closed in results.values()),
+                             "targets": dict((target_id, dict(("%s/%s/%s" % connection, result)
+                                                              for connection, result in closed.items()))
+                                             for target_id, closed in results.items())})
+
     def destroy(self, request, pk):
         target = Target.objects.get(pk=pk)
         if not target:
             raise ParseError("Target not found")
-        iscsi_target = ISCSITarget(pk, target.name)
-        if iscsi_target.exists():
-            iscsi_target.close_all_connections()
-            iscsi_target.detach_all_logical_units()
-            iscsi_target.remove()
-        target.delete()
+        with target_lock(target):
+            iscsi_target = get_iscsi_target(target)
+            if iscsi_target.exists():
+                iscsi_target.close_all_connections()
+                iscsi_target.detach_all_logical_units()
+                iscsi_target.remove()
+            target.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     """
@@ -153,9 +323,10 @@ class TargetViewSet(viewsets.ModelViewSet):
     """
 
 
-class LogicalUnitViewSet(viewsets.ModelViewSet):
+class LogicalUnitViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = LogicalUnit.objects.all()
     serializer_class = LogicalUnitSerializer
+    cache_models = ("logicalunit", "snapshot", "storage")
 
     @staticmethod
     def map_status(status):
@@ -182,7 +353,7 @@ class LogicalUnitViewSet(viewsets.ModelViewSet):
 
     @staticmethod
     def get_device_path(logical_unit):
-        volume_group = VolumeGroup(logical_unit.group)
+        volume_group = get_volume_group(logical_unit.group, logical_unit.node)
         if not volume_group:
             return None
         logical_volumes = volume_group.get_logical_volumes(logical_unit.name)
@@ -197,7 +368,7 @@ class LogicalUnitViewSet(viewsets.ModelViewSet):
 
     @staticmethod
     def get_logical_volume(logical_unit):
-        virtual_group = VolumeGroup(logical_unit.group)
+        virtual_group = get_volume_group(logical_unit.group, logical_unit.node)
         if not virtual_group:
             return None
         logical_volumes = virtual_group.get_logical_volumes(logical_unit.name)
@@ -213,19 +384,49 @@ class LogicalUnitViewSet(viewsets.ModelViewSet):
 
     @staticmethod
     def attach_to_target(logical_unit):
-        iscsi_target = ISCSITarget(logical_unit.target.id, logical_unit.target.name)
+        iscsi_target = get_iscsi_target(logical_unit.target)
         if not iscsi_target.exists():
             iscsi_target.add()
         device_path = LogicalUnitViewSet.get_device_path(logical_unit)
-        if device_path and iscsi_target.attach_logical_unit(device_path, logical_unit.id):
+        profile = get_tuning_profile(logical_unit.tuning_profile)
+        if device_path and iscsi_target.attach_logical_unit(device_path, logical_unit.id, profile.get("bstype"),
+                                                            profile.get("bsoflags")):
+            if not iscsi_target.tune_logical_unit(logical_unit.id, profile.get("readonly", False),
+                                                  profile.get("write_cache", True)):
+                return False
+            if not (logical_unit.vendor_id or logical_unit.product_id or logical_unit.product_rev):
+                return True
             return iscsi_target.update_logical_unit_params(logical_unit.id, vendor_id=logical_unit.vendor_id,
                                                            product_id=logical_unit.product_id,
                                                            product_rev=logical_unit.product_rev)
         return False
 
+    @staticmethod
+    def transition(logical_units, status, condition=None):
+        """moves logical units to status, returns (per logical unit results, number updated)"""
+        return transition_logical_units(logical_units, status, {"attach": LogicalUnitViewSet.attach_to_target,
+                                                                "detach": LogicalUnitViewSet.detach_from_target},
+                                        condition)
+
+    @list_route(methods=["POST"])
+    def transition_many(self, request):
+        """moves the selected logical units ('logical_units', 'targets', 'group' and/or 'tag') to 'status' (value or
+        name), attaching or detaching them in tgtd concurrently and saving all statuses in one transaction"""
+        started = time.monotonic()
+        new_status = parse_status(request.data.__getitem__('status')) if request.data.__contains__('status') else None
+        if new_status is None:
+            raise ParseError("'status' must be one of %s" % ", ".join(
+                "%s (%s)" % (value, name) for value, name in sorted(LogicalUnitStatus.choices())))
+        logical_units = FleetViewSet.select_logical_units(request.data)
+        results, updated = self.transition(logical_units, new_status)
+        return JsonResponse({"result": all(result["result"] for result in results), "updated": updated,
+                             "results": results, "seconds": round(time.monotonic() - started, 3)})
+
     @staticmethod
     def detach_from_target(logical_unit):
-        iscsi_target = ISCSITarget(logical_unit.target.id, logical_unit.target.name)
+        if not logical_unit.target:
+            return True
+        iscsi_target = get_iscsi_target(logical_unit.target)
         if not iscsi_target.exists():
             return True
         return iscsi_target.detach_logical_unit(logical_unit.id)
@@ -238,90 +439,352 @@ class LogicalUnitViewSet(viewsets.ModelViewSet):
             return JsonResponse({"result": True, "device_path": device_path})
         return JsonResponse({"result": False, "device_path": None, "message": "No device found"})
 
+    @detail_route(methods=["PATCH"])
+    def cache(self, request, pk):
+        """turns the SSD cache of the logical volume (the golden base when snapshots sit on top) on or off"""
+        logical_unit = LogicalUnit.objects.get(pk=pk)
+        enable = str(request.data.__getitem__('enable')).lower() == "true" if request.data.__contains__('enable') \
+            else True
+        with logical_unit_lock(logical_unit):
+            logical_volume = self.get_logical_volume(logical_unit)
+            if not logical_volume:
+                raise ParseError("Logical volume not found")
+            if not enable:
+                if logical_unit.cache_mode and not logical_volume.detach_cache():
+                    return JsonResponse({"result": False, "message": "Could not remove the cache"})
+                logical_unit.cache_mode = None
+                logical_unit.cache_size_in_gb = None
+                logical_unit.save()
+                return JsonResponse({"result": True, "message": "Cache removed"})
+            if logical_unit.cache_mode:
+                return JsonResponse({"result": False, "message": "Logical unit is already cached"})
+            mode = request.data.__getitem__('mode') if request.data.__contains__('mode') else "writethrough"
+            if mode not in ("writethrough", "writeback"):
+                raise ParseError("'mode' must be 'writethrough' or 'writeback'")
+            size = float(request.data.__getitem__('size_in_gb')) if request.data.__contains__('size_in_gb') \
+                else settings.CACHE_DEFAULT_SIZE_GB
+            physical_volume = settings.CACHE_PHYSICAL_VOLUMES.get(logical_unit.group)
+            if not physical_volume:
+                raise ParseError("No fast physical volume configured for volume group '%s'" % logical_unit.group)
+            pool_name = "%s_cache" % logical_unit.name
+            volume_group = get_volume_group(logical_unit.group, logical_unit.node)
+            if not volume_group.create_cache_pool(pool_name, size, physical_volume):
+                return JsonResponse({"result": False, "message": "Could not create the cache pool"})
+            if not logical_volume.attach_cache(pool_name, mode):
+                volume_group.remove_logical_volume(pool_name)
+                return JsonResponse({"result": False, "message": "Could not attach the cache"})
+            logical_unit.cache_mode = mode
+            logical_unit.cache_size_in_gb = size
+            logical_unit.save()
+            return JsonResponse({"result": True, "message": "Cache attached in %s mode" % mode})
+
+    @detail_route()
+    def layout(self, request, pk):
+        """how the logical volume is laid out over physical volumes, with their current free space & I/O load"""
+        logical_unit = LogicalUnit.objects.get(pk=pk)
+        logical_volume = self.get_logical_volume(logical_unit)
+        if not logical_volume:
+            raise ParseError("Logical volume not found")
+        physical_volumes = (get_node_stats(logical_unit.node).get("physical_volumes") or {}).get(logical_unit.group)
+        return JsonResponse({"result": True, "placement": logical_unit.placement, "stripes": logical_unit.stripes,
+                             "segments": logical_volume.get_layout(), "physical_volumes": physical_volumes or {}})
+
+    @detail_route(methods=["POST"])
+    def prewarm(self, request, pk):
+        """reads the hot region of the logical unit into the page cache ahead of a boot wave"""
+        logical_unit = LogicalUnit.objects.get(pk=pk)
+        stats = prewarm_logical_unit(logical_unit)
+        return JsonResponse(dict(stats, result=True, message=describe_prewarm(stats)))
+
+    @detail_route(methods=["GET", "POST"])
+    def hot_region(self, request, pk):
+        """GET reports how much of the hot region is cached, POST records what is cached now (right after a boot)
+        as the hot region, or resets it to the first N GiB with {"reset": true}"""
+        logical_unit = LogicalUnit.objects.get(pk=pk)
+        if request.method == "POST":
+            if request.data.__contains__('reset') and str(request.data.__getitem__('reset')).lower() == "true":
+                logical_unit.hot_ranges = None
+                logical_unit.save(update_fields=["hot_ranges"])
+                return JsonResponse({"result": True, "message": "Hot region reset"})
+            result, message = record_hot_ranges(logical_unit)
+            return JsonResponse({"result": result, "message": message})
+        ranges = get_hot_ranges(logical_unit)
+        return JsonResponse({"result": True, "recorded": bool(logical_unit.hot_ranges), "ranges": len(ranges),
+                             "bytes_wanted": sum(length for _, length in ranges),
+                             "bytes_resident": served_volume(logical_unit).get_resident_bytes(ranges)})
+
+    @detail_route()
+    def cache_stats(self, request, pk):
+        logical_unit = LogicalUnit.objects.get(pk=pk)
+        logical_volume = self.get_logical_volume(logical_unit)
+        if not logical_volume:
+            raise ParseError("Logical volume not found")
+        cache_status = logical_volume.get_cache_status()
+        if not cache_status:
+            return JsonResponse({"result": False, "message": "Logical unit is not cached"})
+        return JsonResponse({"result": True, "cache": cache_status})
+
+    @detail_route()
+    def io_stats(self, request, pk):
+        logical_unit = LogicalUnit.objects.get(pk=pk)
+        io_stats = get_io_stats(logical_unit.id)
+        if io_stats is None:
+            return JsonResponse({"result": False, "message": "I/O telemetry is not enabled"})
+        return JsonResponse({"result": True, "io_stats": io_stats})
+
     @detail_route(methods=["PATCH"])
     def recreate(self, request, pk):
         logical_unit = LogicalUnit.objects.get(pk=pk)
-        if not logical_unit:
-            return ParseError("No logical unit")
-        virtual_group = VolumeGroup(logical_unit.group)
-        if not virtual_group:
-            return ParseError("No volume group")
-        logical_volumes = virtual_group.get_logical_volumes(logical_unit.name)
-        logical_volume = logical_volumes[0] if logical_volumes else None
-        if logical_volume:
-            (size, unit) = logical_volume.get_size()
-            self.detach_from_target(logical_unit)
-            if virtual_group.remove_logical_volume(logical_unit.name) and virtual_group.create_logical_volume(logical_unit.name, size, unit):
-                return Response("Created...")
-        return ParseError("error: unable to recreate...")
+        with logical_unit_lock(logical_unit):
+            if not logical_unit:
+                raise ParseError("No logical unit")
+            virtual_group = get_volume_group(logical_unit.group, logical_unit.node)
+            if not virtual_group:
+                raise ParseError("No volume group")
+            logical_volumes = virtual_group.get_logical_volumes(logical_unit.name)
+            logical_volume = logical_volumes[0] if logical_volumes else None
+            if logical_volume:
+                (size, unit) = logical_volume.get_size()
+                self.detach_from_target(logical_unit)
+                discarded_name = "%s_discarded_%s" % (logical_unit.name, uuid.uuid4().hex[:8])
+                if not virtual_group.rename_logical_volume(logical_unit.name, discarded_name):
+                    raise ParseError("error: unable to recreate...")
+                if (unit == "GiB" and logical_unit.placement == "linear" and
+                        claim_logical_volume(logical_unit.group, size, logical_unit.name, logical_unit.node)) or \
+                        create_placed_logical_volume(logical_unit.group, logical_unit.name, size, unit,
+                                                     logical_unit.placement, logical_unit.stripes,
+                                                     logical_unit.stripe_size_in_kb, logical_unit.node)[0]:
+                    discard_in_background(virtual_group, discarded_name)
+                    return Response("Created...")
+                virtual_group.rename_logical_volume(discarded_name, logical_unit.name)
+            raise ParseError("error: unable to recreate...")
+
+    @staticmethod
+    def revert_logical_unit(logical_unit, snapshot_name=None):
+        """discards changes made on top of the snapshot (the active one by default); returns (result, message)"""
+        with logical_unit_lock(logical_unit):
+            logical_unit.refresh_from_db()
+            if logical_unit.status in [LogicalUnitStatus.BUSY.value, LogicalUnitStatus.MOUNTED.value]:
+                return False, "Disk is busy or mounted, turn machine off and turn disk offline"
+            if snapshot_name:
+                snapshot = logical_unit.snapshots.filter(name=snapshot_name).first()
+            else:
+                snapshot = logical_unit.snapshots.filter(active=True).first()
+                snapshot_name = snapshot.name if snapshot else None
+            if not snapshot_name:
+                return False, "Could not find any active snapshot to revert to"
+            logical_volume = LogicalUnitViewSet.get_logical_volume(logical_unit)
+            if not logical_volume:
+                return False, "Logical volume not found"
+            size = snapshot.size_in_gb if snapshot else None  # known sizes spare the lvdisplay lookups
+            if LogicalUnitViewSet.detach_from_target(logical_unit) and \
+                    logical_volume.revert_to_snapshot(snapshot_name, size):
+                logical_unit.status = LogicalUnitStatus.ONLINE.value
+                logical_unit.save()
+                return True, "Successfully reverted to snapshot '%s'" % snapshot_name
+            return False, "Could not revert to snapshot '%s'" % snapshot_name
 
     @detail_route(methods=["PATCH"])
     def revert(self, request, pk):
         logical_unit = LogicalUnit.objects.get(pk=pk)
-        if logical_unit.status in [LogicalUnitStatus.BUSY.value, LogicalUnitStatus.MOUNTED.value]:
-            return JsonResponse(
-                {"result": False, "message": "Disk is busy or mounted, turn machine off and turn disk offline"}
-            )
+        snapshot_name = None
         if request.data.__contains__('snapshot') and request.data.__getitem__('snapshot'):
             snapshot_name = request.data.__getitem__('snapshot')
-        else:
-            snapshot = self.get_active_snapshots(pk)
-            snapshot_name = snapshot.name if snapshot else None
-        if not snapshot_name:
-            return JsonResponse({"result": False, "message": "Could not find any active snapshot to revert to"})
-        logical_volume = self.get_logical_volume(logical_unit)
-        if not logical_volume:
-            return JsonResponse({"result": False, "message": "Logical volume not found"})
-        if LogicalUnitViewSet.detach_from_target(logical_unit) and logical_volume.revert_to_snapshot(snapshot_name):
-            logical_unit.status = LogicalUnitStatus.ONLINE.value
-            logical_unit.save()
-            return JsonResponse({"result": True, "message": "Successfully reverted to snapshot '%s'" % snapshot_name})
-        return JsonResponse({"result": False, "message": "Could not revert to snapshot '%s'" % snapshot_name})
+        result, message = self.revert_logical_unit(logical_unit, snapshot_name)
+        return JsonResponse({"result": result, "message": message})
 
     @detail_route(methods=["PATCH"])
     def dump(self, request, pk):
         logical_unit = LogicalUnit.objects.get(pk=pk)
+        with logical_unit_lock(logical_unit):
+            logical_volume = self.get_logical_volume(logical_unit)
+            if not logical_volume:
+                raise ParseError("Logical volume not found")
+            if request.data.__contains__('image') and request.data.__getitem__('image'):
+                image, message = dump_to_repository(logical_unit, request.data.__getitem__('image'))
+                return Response(message, status=status.HTTP_200_OK if image else status.HTTP_417_EXPECTATION_FAILED)
+            if not request.data.__contains__('local_file') or not request.data.__getitem__('local_file'):
+                return Response("No valid 'local_file' or 'image' key found", status=status.HTTP_400_BAD_REQUEST)
+            if logical_unit.node is not None:  # the agent does not take paths of its own file system
+                raise ParseError("'local_file' is only supported for logical units on this host, use 'image'")
+            output = logical_volume.dump_to_image(request.data.__getitem__('local_file'))
+            if output:
+                message = "Successfully dumped the disk. Details: %s" % output
+                status_code = status.HTTP_200_OK
+            else:
+                message = "Failed to dump the disk. Details: %s" % output
+                status_code = status.HTTP_417_EXPECTATION_FAILED
+            return Response(message, status=status_code)
+
+    @detail_route()
+    def image(self, request, pk):
+        """streams the disk image as the response body, honouring a single byte 'Range' so backup tools can pull
+        ranges in parallel; reads ?snapshot=<name> when given, otherwise a temporary snapshot removed once the
+        response is closed. Range requests must name a snapshot, each would read its own point in time otherwise"""
+        logical_unit = LogicalUnit.objects.get(pk=pk)
+        if logical_unit.node is not None:
+            raise ParseError("Images can only be streamed from logical units on this host")
+        snapshot_name = request.query_params.get("snapshot")
+        if snapshot_name and not logical_unit.snapshots.filter(name=snapshot_name).exists():
+            raise ParseError("Snapshot '%s' not found" % snapshot_name)
+        if request.META.get("HTTP_RANGE") and not snapshot_name and request.method != "HEAD":
+            raise ParseError("Range requests must name a snapshot, so that all ranges read the same image")
         logical_volume = self.get_logical_volume(logical_unit)
         if not logical_volume:
             raise ParseError("Logical volume not found")
-        if not request.data.__contains__('local_file') or not request.data.__getitem__('local_file'):
-            return Response("No valid 'local_file' key found", status=status.HTTP_400_BAD_REQUEST)
-        output = logical_volume.dump_to_image(request.data.__getitem__('local_file'))
-        if output:
-            message = "Successfully dumped the disk. Details: %s" % output
-            status_code = status.HTTP_200_OK
+        if request.method == "HEAD" and not snapshot_name:  # only the size is needed
+            path, cleanup = logical_volume.get_path(), None
         else:
-            message = "Failed to dump the disk. Details: %s" % output
-            status_code = status.HTTP_417_EXPECTATION_FAILED
-        return Response(message, status=status_code)
+            path, cleanup = open_image(logical_unit, snapshot_name)
+        try:
+            size = get_size(path)
+            byte_range = parse_range(request.META.get("HTTP_RANGE"), size)
+            start, end = byte_range or (0, size)
+            response = FileResponse(RangeFile(path, start, end, cleanup), content_type="application/octet-stream")
+        except RangeNotSatisfiable:
+            if cleanup:
+                cleanup()
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response["Content-Range"] = "bytes */%d" % size
+            return response
+        except Exception:
+            if cleanup:
+                cleanup()
+            raise
+        response.block_size = settings.IMAGE_STREAM_BLOCK_SIZE
+        response["Content-Length"] = end - start
+        response["Accept-Ranges"] = "bytes"
+        response["Content-Disposition"] = 'attachment; filename="%s.img"' % (snapshot_name or logical_unit.name)
+        if byte_range:
+            response.status_code = status.HTTP_206_PARTIAL_CONTENT
+            response["Content-Range"] = "bytes %d-%d/%d" % (start, end - 1, size)
+        return response
+
+    @detail_route(methods=["GET", "PUT"])
+    def upload(self, request, pk):
+        """restores the disk from the raw image in the request body, written as it arrives. ?offset= resumes an
+        interrupted upload from the offset a GET reports; the final part carries ?sha256= of the whole image, which is
+        checked against what reads back from the disk"""
+        logical_unit = LogicalUnit.objects.get(pk=pk)
+        if request.method == "GET":
+            return JsonResponse({"result": True, "offset": logical_unit.uploaded_bytes or 0})
+        if logical_unit.node is not None:
+            raise ParseError("Images can only be uploaded to logical units on this host")
+        try:
+            offset = int(request.query_params.get("offset", 0))
+        except ValueError:
+            raise ParseError("'offset' must be a number of bytes")
+        upload = get_upload_stream(request)
+        if upload is None:
+            raise ParseError("The request body must be the image, sent with a Content-Length or chunked")
+        stream, length = upload
+        with logical_unit_lock(logical_unit):
+            logical_unit.refresh_from_db()
+            if logical_unit.status in (LogicalUnitStatus.BUSY.value, LogicalUnitStatus.MOUNTED.value):
+                raise ParseError("Logical unit is in use")
+            if offset > (logical_unit.uploaded_bytes or 0):
+                return JsonResponse({"result": False, "offset": logical_unit.uploaded_bytes or 0,
+                                     "message": "Upload can only resume from offset %d" %
+                                                (logical_unit.uploaded_bytes or 0)}, status=status.HTTP_409_CONFLICT)
+            logical_volume = self.get_logical_volume(logical_unit)
+            if not logical_volume:
+                raise ParseError("Target disk not found")
+            path = logical_volume.get_path()
+            if length is not None and offset + length > get_size(path):
+                raise ParseError("Image does not fit in the logical volume")
+
+            def set_uploaded_bytes(end):  # update() sends no signals, so the response cache is told here
+                LogicalUnit.objects.filter(pk=logical_unit.pk).update(uploaded_bytes=end)
+                bump("logicalunit")
+
+            try:
+                end = write_stream(stream, path, offset, length, set_uploaded_bytes)
+            except OSError as e:
+                return JsonResponse({"result": False, "offset": LogicalUnit.objects.get(pk=pk).uploaded_bytes or 0,
+                                     "message": "Failed to write the disk. Details: %s" % e},
+                                    status=status.HTTP_417_EXPECTATION_FAILED)
+            if length is not None and end != offset + length:
+                return JsonResponse({"result": False, "offset": end, "message": "Upload ended early, resume it"})
+            if not request.query_params.get("sha256"):
+                return JsonResponse({"result": True, "offset": end, "message": "Written, more to come"})
+            digest = read_back_digest(path, end)
+            if digest != request.query_params.get("sha256").lower():
+                set_uploaded_bytes(None)
+                return JsonResponse({"result": False, "offset": 0, "sha256": digest,
+                                     "message": "Checksum mismatch, upload the image again"},
+                                    status=status.HTTP_417_EXPECTATION_FAILED)
+            set_uploaded_bytes(None)
+            return JsonResponse({"result": True, "offset": end, "sha256": digest,
+                                 "message": "Successfully restored the disk"})
 
     @detail_route(methods=["PATCH"])
     def restore(self, request, pk):
         logical_unit = LogicalUnit.objects.get(pk=pk)
-        logical_volume = self.get_logical_volume(logical_unit)
-        if not logical_volume:
-            raise ParseError("Target disk not found")
-        if not request.data.__contains__('local_file') or not request.data.__getitem__('local_file'):
-            return Response("No valid 'local_file' key found", status=status.HTTP_400_BAD_REQUEST)
-        output = logical_volume.restore_from_image(request.data.__getitem__('local_file'))
-        if output:
-            message = "Successfully restored the disk. Details: %s" % output
-            status_code = status.HTTP_200_OK
-        else:
-            message = "Failed to restore the disk. Details: %s" % output
-            status_code = status.HTTP_417_EXPECTATION_FAILED
-        return Response(message, status=status_code)
+        with logical_unit_lock(logical_unit):
+            logical_volume = self.get_logical_volume(logical_unit)
+            if not logical_volume:
+                raise ParseError("Target disk not found")
+            if request.data.__contains__('image') and request.data.__getitem__('image'):
+                result, message = restore_from_repository(logical_unit, request.data.__getitem__('image'),
+                                                          logical_volume.get_path())
+                return Response(message, status=status.HTTP_200_OK if result else status.HTTP_417_EXPECTATION_FAILED)
+            if not request.data.__contains__('local_file') or not request.data.__getitem__('local_file'):
+                return Response("No valid 'local_file' or 'image' key found", status=status.HTTP_400_BAD_REQUEST)
+            if logical_unit.node is not None:  # the agent does not take paths of its own file system
+                raise ParseError("'local_file' is only supported for logical units on this host, use 'image'")
+            output = logical_volume.restore_from_image(request.data.__getitem__('local_file'))
+            if output:
+                message = "Successfully restored the disk. Details: %s" % output
+                status_code = status.HTTP_200_OK
+            else:
+                message = "Failed to restore the disk. Details: %s" % output
+                status_code = status.HTTP_417_EXPECTATION_FAILED
+            return Response(message, status=status_code)
 
     def create(self, request):
         if not (request.data.__contains__('name') and request.data.__contains__('group')):
             raise ParseError("'name' & 'group' fields are required and should have valid data")
-        vg = VolumeGroup(request.data.__getitem__('group'))
+        if request.data.__contains__('tuning_profile') and request.data.__getitem__('tuning_profile') and \
+                request.data.__getitem__('tuning_profile') not in settings.TUNING_PROFILES:
+            raise ParseError("No tuning profile found with that name")
+        size = float(request.data.__getitem__('size_in_gb')) if request.data.__contains__('size_in_gb') else 20.0
+        placement = request.data.__getitem__('placement') if request.data.__contains__('placement') and \
+            request.data.__getitem__('placement') else settings.LV_DEFAULT_PLACEMENT
+        if placement not in PLACEMENTS:
+            raise ParseError("'placement' must be one of %s" % ", ".join(PLACEMENTS))
+        stripes = int(request.data.__getitem__('stripes')) if request.data.__contains__('stripes') and \
+            request.data.__getitem__('stripes') else (settings.LV_DEFAULT_STRIPES if placement == "striped" else 1)
+        stripe_size_in_kb = int(request.data.__getitem__('stripe_size_in_kb')) if \
+            request.data.__contains__('stripe_size_in_kb') and request.data.__getitem__('stripe_size_in_kb') else None
+        target = None
+        if request.data.__contains__('target') and request.data.__getitem__('target'):
+            target = Target.objects.get(pk=url_resolver(request.data.__getitem__('target')))
+        if request.data.__contains__('node') and request.data.__getitem__('node'):
+            node = StorageNode.objects.get(pk=url_resolver(request.data.__getitem__('node')))
+        elif target and (target.node or target.logical_units.exists()):
+            node = target.node  # a target is served by the tgtd of the node holding its logical units
+        else:
+            found, node = schedule_node(request.data.__getitem__('group'), size)
+            if not found:
+                raise ParseError("No storage node has %s GiB free in that volume group" % size)
+        if target and target.node != node:
+            if target.logical_units.exists():
+                raise ParseError("Logical unit must be placed on the storage node of its target")
+            target.node = node
+            target.save()
+        vg = get_volume_group(request.data.__getitem__('group'), node)
         if not vg:
             raise ParseError("No volume group found with that name")
         if vg.contains_logical_volume(request.data.__getitem__('name')):
             raise ParseError("Logical unit with that name does exist")
-        size = float(request.data.__getitem__('size_in_gb')) if request.data.__contains__('size_in_gb') else 20.0
-        if vg.create_logical_volume(request.data.__getitem__('name'), size):
+        if placement == "linear" and claim_logical_volume(request.data.__getitem__('group'), size,
+                                                          request.data.__getitem__('name'), node):
+            (placed, message) = (True, "Claimed from the warm pool")
+        else:
+            (placed, message) = create_placed_logical_volume(request.data.__getitem__('group'),
+                                                              request.data.__getitem__('name'), size, "GiB",
+                                                              placement, stripes, stripe_size_in_kb, node)
+        if placed:
             logical_unit, created = LogicalUnit.objects.get_or_create(name=request.data.__getitem__('name'),
                                                                       group=request.data.__getitem__('group'))
             if created:
@@ -336,63 +799,243 @@ class LogicalUnitViewSet(viewsets.ModelViewSet):
                     logical_unit.use = True if str(request.data.__getitem__('use')).lower() == "true" else False
                 if request.data.__contains__('status') and request.data.__getitem__('status'):
                     logical_unit.status = request.data.__getitem__('status')
+                if request.data.__contains__('tuning_profile') and request.data.__getitem__('tuning_profile'):
+                    logical_unit.tuning_profile = request.data.__getitem__('tuning_profile')
                 if request.data.__contains__('boot_count') and request.data.__getitem__('boot_count'):
                     logical_unit.boot_count = int(request.data.__getitem__('boot_count'))
-                if request.data.__contains__('target') and request.data.__getitem__('target'):
-                    logical_unit.target = Target.objects.get(pk=url_resolver(request.data.__getitem__('target')))
+                logical_unit.target = target
+                logical_unit.node = node
+                logical_unit.placement = placement
+                logical_unit.stripes = stripes if placement == "striped" else 1
+                logical_unit.stripe_size_in_kb = stripe_size_in_kb if placement == "striped" else None
                 logical_unit.save()
             return Response(LogicalUnitSerializer(instance=logical_unit, context={'request': request}).data)
-        raise ParseError("Logical unit could not be created. %s" % status)
+        raise ParseError("Logical unit could not be created. %s" % message)
 
     def destroy(self, request, pk):
         logical_unit = LogicalUnit.objects.get(pk=pk)
         if logical_unit:
-            self.detach_from_target(logical_unit)
-            volume_group = VolumeGroup(logical_unit.group)
-            if volume_group and volume_group.contains_logical_volume(logical_unit.name) and\
-                    not volume_group.remove_logical_volume(logical_unit.name):
-                        raise ParseError("Could not remove logical volume")
-            logical_unit.delete()
+            with logical_unit_lock(logical_unit):
+                self.detach_from_target(logical_unit)
+                volume_group = get_volume_group(logical_unit.group, logical_unit.node)
+                if volume_group and volume_group.contains_logical_volume(logical_unit.name) and\
+                        not volume_group.remove_logical_volume(logical_unit.name):
+                            raise ParseError("Could not remove logical volume")
+                logical_unit.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
         raise ParseError("Could not found the logical unit")
 
 
-class SnapshotViewSet(viewsets.ModelViewSet):
+class SnapshotViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Snapshot.objects.all()
     serializer_class = SnapshotSerializer
+    cache_models = ("snapshot", "storage")
 
-    def create(self, request):
-        if request.data.__contains__('name') and request.data.__contains__('logical_unit'):
-            logical_unit = LogicalUnit.objects.get(pk=url_resolver(request.data.__getitem__('logical_unit')))
-            if not logical_unit:
-                raise ParseError("Logical unit not found.")
+    @staticmethod
+    def take_snapshot(logical_unit, name, size=None, description=None, active=False):
+        """creates the snapshot of an offline logical unit; returns (snapshot, message), snapshot None on failure"""
+        with logical_unit_lock(logical_unit):
+            logical_unit.refresh_from_db()
             if logical_unit.status != LogicalUnitStatus.OFFLINE.value:
-                raise ParseError("Logical unit must be offline and its initiator machine must also be turned off")
+                return None, "Logical unit must be offline and its initiator machine must also be turned off"
             LogicalUnitViewSet.detach_from_target(logical_unit)
             logical_volume = LogicalUnitViewSet.get_logical_volume(logical_unit)
-            size = float(request.data.__getitem__('size_in_gb')) if request.data.__contains__('size_in_gb') else 5.0
-            if logical_volume and not logical_volume.contains_snapshot(request.data.__getitem__('name')) and \
-                    logical_volume.create_snapshot(request.data.__getitem__('name'), size):
-                snapshot, created = Snapshot.objects.get_or_create(name=request.data.__getitem__('name'),
-                                                                   logical_unit=logical_unit)
+            size = size if size else suggest_snapshot_size()
+            if logical_volume and not logical_volume.contains_snapshot(name) and \
+                    logical_volume.create_snapshot(name, size):
+                snapshot, created = Snapshot.objects.get_or_create(name=name, logical_unit=logical_unit)
                 if created:
                     snapshot.size_in_gb = size
-                    if request.data.__contains__('description') and request.data.__getitem__('description'):
-                        snapshot.description = request.data.__getitem__('description')
-                    if request.data.__contains__('active') and request.data.__getitem__('active'):
-                        snapshot.active = True if str(request.data.__getitem__('active')).lower() == "true" else False
+                    snapshot.description = description or None
+                    snapshot.active = active
                     snapshot.save()
-                return Response(SnapshotSerializer(instance=snapshot, context={'request': request}).data)
-            raise ParseError("Resource could not be created. %s" % status)
+                return snapshot, "Successfully created snapshot '%s'" % name
+        return None, "Resource could not be created"
+
+    def create(self, request):
+        if request.data.__contains__('name') and request.data.__contains__('logical_unit'):
+            logical_unit = LogicalUnit.objects.get(pk=url_resolver(request.data.__getitem__('logical_unit')))
+            if not logical_unit:
+                raise ParseError("Logical unit not found.")
+            size = float(request.data.__getitem__('size_in_gb')) if request.data.__contains__('size_in_gb') else None
+            active = False
+            if request.data.__contains__('active') and request.data.__getitem__('active'):
+                active = True if str(request.data.__getitem__('active')).lower() == "true" else False
+            description = request.data.__getitem__('description') if request.data.__contains__('description') \
+                else None
+            snapshot, message = self.take_snapshot(logical_unit, request.data.__getitem__('name'), size, description,
+                                                   active)
+            if not snapshot:
+                raise ParseError(message)
+            return Response(SnapshotSerializer(instance=snapshot, context={'request': request}).data)
         raise ParseError("'name' & 'group' fields are required and should have valid data")
 
     def destroy(self, request, pk):
         snapshot = Snapshot.objects.get(pk=pk)
-        if snapshot.logical_unit.status != LogicalUnitStatus.OFFLINE.value:
-            raise ParseError("Logical unit must be offline and its initiator machine must also be turned off")
-        LogicalUnitViewSet.detach_from_target(snapshot.logical_unit)
-        logical_volume = LogicalUnitViewSet.get_logical_volume(snapshot.logical_unit)
-        if logical_volume:
-            logical_volume.remove_snapshot(snapshot.name)
-        snapshot.delete()
+        with logical_unit_lock(snapshot.logical_unit):
+            snapshot.logical_unit.refresh_from_db()
+            if snapshot.logical_unit.status != LogicalUnitStatus.OFFLINE.value:
+                raise ParseError("Logical unit must be offline and its initiator machine must also be turned off")
+            LogicalUnitViewSet.detach_from_target(snapshot.logical_unit)
+            logical_volume = LogicalUnitViewSet.get_logical_volume(snapshot.logical_unit)
+            if logical_volume:
+                logical_volume.remove_snapshot(snapshot.name)
+            snapshot.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ImageViewSet(ConditionalGetMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                   mixins.ListModelMixin, viewsets.GenericViewSet):
+    """deduplicated disk images; created by dumping a logical unit, restored with the logical unit's restore. Not
+    updatable: the name is that of the manifest in the repository"""
+    queryset = Image.objects.all()
+    serializer_class = ImageSerializer
+    cache_models = ("image",)
+
+    def create(self, request):
+        if not (request.data.__contains__('name') and request.data.__contains__('logical_unit')):
+            raise ParseError("'name' & 'logical_unit' fields are required and should have valid data")
+        logical_unit = LogicalUnit.objects.get(pk=url_resolver(request.data.__getitem__('logical_unit')))
+        snapshot_name = request.data.__getitem__('snapshot') if request.data.__contains__('snapshot') else None
+        if snapshot_name and not logical_unit.snapshots.filter(name=snapshot_name).exists():
+            raise ParseError("Snapshot '%s' not found" % snapshot_name)
+        description = request.data.__getitem__('description') if request.data.__contains__('description') else None
+        with logical_unit_lock(logical_unit):
+            image, message = dump_to_repository(logical_unit, request.data.__getitem__('name'), snapshot_name or None,
+                                                description)
+        if not image:
+            raise ParseError(message)
+        return Response(ImageSerializer(instance=image, context={'request': request}).data)
+
+    def destroy(self, request, pk):
+        remove_image(Image.objects.get(pk=pk))
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @detail_route()
+    def verify(self, request, pk):
+        damaged = get_repository().verify(Image.objects.get(pk=pk).name)
+        if damaged is None:
+            return JsonResponse({"result": False, "message": "Manifest not found"})
+        return JsonResponse({"result": not damaged, "damaged_chunks": damaged})
+
+    @list_route()
+    def usage(self, request):
+        return JsonResponse(dict(get_repository().get_usage(), result=True))
+
+    @list_route(methods=["POST"])
+    def collect_garbage(self, request):
+        removed, freed = collect_garbage()
+        return JsonResponse({"result": True, "removed_chunks": removed, "freed_bytes": freed})
+
+
+class FleetViewSet(viewsets.ViewSet):
+    """revert, snapshot or prewarm every logical unit of a lab in one call"""
+
+    @staticmethod
+    def select_logical_units(data):
+        """logical units matching all given selectors: targets, logical_units (ids or URLs), group & tag"""
+        def to_pk(value):
+            return url_resolver(value) if "/" in str(value) else int(value)
+
+        logical_units = LogicalUnit.objects.select_related("target")
+        selected = False
+        if data.__contains__('targets') and data.__getitem__('targets'):
+            logical_units = logical_units.filter(target__in=[to_pk(target) for target in data.__getitem__('targets')])
+            selected = True
+        if data.__contains__('logical_units') and data.__getitem__('logical_units'):
+            logical_units = logical_units.filter(pk__in=[to_pk(pk) for pk in data.__getitem__('logical_units')])
+            selected = True
+        if data.__contains__('group') and data.__getitem__('group'):
+            logical_units = logical_units.filter(group=data.__getitem__('group'))
+            selected = True
+        if data.__contains__('tag') and data.__getitem__('tag'):
+            logical_units = logical_units.filter(tags__name=data.__getitem__('tag'))
+            selected = True
+        if not selected:
+            raise ParseError("One of 'targets', 'logical_units', 'group' or 'tag' is required")
+        return list(logical_units.distinct())
+
+    @staticmethod
+    def respond(results, started):
+        return JsonResponse({"result": all(result["result"] for result in results), "results": results,
+                             "seconds": round(time.monotonic() - started, 3)})
+
+    @list_route(methods=["POST"])
+    def revert(self, request):
+        started = time.monotonic()
+        logical_units = self.select_logical_units(request.data)
+        snapshot_name = request.data.__getitem__('snapshot') if request.data.__contains__('snapshot') else None
+        results = run_on_fleet(logical_units,
+                               lambda logical_unit: LogicalUnitViewSet.revert_logical_unit(logical_unit, snapshot_name))
+        return self.respond(results, started)
+
+    @list_route(methods=["POST"])
+    def snapshot(self, request):
+        """creates snapshot '<name>_<logical unit name>' of every selected logical unit"""
+        started = time.monotonic()
+        if not (request.data.__contains__('name') and request.data.__getitem__('name')):
+            raise ParseError("'name' field is required and should have valid data")
+        logical_units = self.select_logical_units(request.data)
+        name = request.data.__getitem__('name')
+        size = float(request.data.__getitem__('size_in_gb')) if request.data.__contains__('size_in_gb') else None
+        description = request.data.__getitem__('description') if request.data.__contains__('description') else None
+        active = str(request.data.__getitem__('active')).lower() == "true" if request.data.__contains__('active') \
+            else False
+
+        def take_snapshot(logical_unit):
+            snapshot, message = SnapshotViewSet.take_snapshot(logical_unit, "%s_%s" % (name, logical_unit.name), size,
+                                                              description, active)
+            return snapshot is not None, message
+
+        return self.respond(run_on_fleet(logical_units, take_snapshot), started)
+
+    @list_route(methods=["POST"])
+    def prewarm(self, request):
+        """reads the hot region of every selected logical unit into the page cache before a lab session"""
+        started = time.monotonic()
+        logical_units = self.select_logical_units(request.data)
+        return self.respond(run_on_fleet(logical_units, lambda logical_unit: (
+            True, describe_prewarm(prewarm_logical_unit(logical_unit)))), started)
+
+
+def metrics_view(request):
+    return JsonResponse(metrics.snapshot())
+
+
+def events_view(request):
+    """server-sent events of logical unit, target & job status changes, e.g. `new EventSource("/api/events/")`;
+    resumes after the Last-Event-ID header or ?since=<seq>, ?models=logical_unit,target narrows the stream. Past
+    EVENTS_MAX_CLIENTS streams in this worker process, further clients get 503"""
+    since = request.META.get("HTTP_LAST_EVENT_ID") or request.GET.get("since")
+    if since is not None and not str(since).isdigit():
+        return JsonResponse({"result": False, "message": "'since' must be an event sequence number"}, status=400)
+    models = [model for model in request.GET.get("models", "").split(",") if model]
+    subscription = events.subscribe(int(since) if since is not None else None, models)
+    if subscription is None:
+        response = JsonResponse({"result": False, "message": "Too many event streams, retry later"}, status=503)
+        response["Retry-After"] = max(1, int(settings.EVENTS_STREAM_SECONDS))  # when a stream is freed at the latest
+        return response
+    response = StreamingHttpResponse(subscription, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx would hold events back otherwise
+    return response
+
+
+def ipxe_script(*lines):
+    return HttpResponse("\n".join(("#!ipxe",) + lines) + "\n", content_type="text/plain")
+
+
+def boot_script(request, mac_address):
+    """single round trip boot for iPXE: `chain http://<portal>/boot/${net0/mac}` returns a ready sanboot script"""
+    mac_address = normalize_mac_address(mac_address)
+    if not mac_address:
+        return ipxe_script("echo Invalid MAC address", "exit 1")
+    target = Target.objects.select_related("initiator").filter(
+        initiator__mac_address__in=mac_address_variants(mac_address)).first()
+    if not target:
+        return ipxe_script("echo No target configured for %s" % mac_address, "exit 1")
+    logical_unit, iscsi_target, message = TargetViewSet.boot_handshake(target)
+    if not logical_unit:
+        return ipxe_script("echo %s" % message, "exit 1")
+    server = target.portal or settings.ISCSI_PORTAL_ADDRESS or request.get_host().rsplit(":", 1)[0]
+    return ipxe_script("sanboot iscsi:{0}:::{1:x}:{2}".format(server, logical_unit.id, iscsi_target.get_name()))
@@ -0,0 +1,41 @@
+import time
+from django.conf import settings
+from django.utils import timezone
+from api import metrics
+from api.models import Initiator
+from api.power import power_initiators
+from helpers.power.wol import send_wake_packets
+
+
+def wake_initiators(initiators, rate=None, deadline=None, retries=None, power_fallback=False):
+    """wakes the initiators with Wake-on-LAN paced to BOOTS_PER_SECOND, waits up to `deadline` seconds after each
+    round for every machine to ask for its boot disk (get_boot_disk_info stamps last_initiated) and wakes the
+    stragglers again, power cycling those left over when asked to; returns (result, message, data) for a job"""
+    rate = settings.BOOTS_PER_SECOND if rate is None else rate
+    deadline = settings.WOL_BOOT_DEADLINE_SECONDS if deadline is None else deadline
+    retries = settings.WOL_RETRIES if retries is None else retries
+    wave_started = timezone.now()
+    pending = dict((initiator.id, initiator) for initiator in initiators)
+    booted = {}
+    attempts = 0
+    while pending and attempts <= retries:
+        attempts += 1
+        sent = send_wake_packets([initiator.mac_address for initiator in pending.values()], rate,
+                                 settings.WOL_BROADCAST_ADDRESS, settings.WOL_PORT)
+        metrics.increment("wol.sent", len(sent))
+        wait_until = time.monotonic() + deadline
+        while pending and time.monotonic() < wait_until:
+            time.sleep(min(settings.WOL_POLL_INTERVAL, max(0.0, wait_until - time.monotonic())))
+            for initiator_id, last_initiated in Initiator.objects.filter(
+                    pk__in=list(pending), last_initiated__gte=wave_started).values_list("id", "last_initiated"):
+                booted[pending.pop(initiator_id).name] = round((last_initiated - wave_started).total_seconds(), 3)
+    metrics.increment("wol.booted", len(booted))
+    metrics.increment("wol.stragglers", len(pending))
+    power_cycled = []
+    if pending and power_fallback:
+        results = power_initiators([initiator for initiator in pending.values() if initiator.pdu_device_id], "cycle",
+                                   rate)
+        power_cycled = [result["name"] for result in results if result["result"]]
+    data = {"booted": booted, "stragglers": sorted(initiator.name for initiator in pending.values()),
+            "attempts": attempts, "power_cycled": power_cycled}
+    return not pending, "%d of %d initiators booted" % (len(booted), len(booted) + len(pending)), data
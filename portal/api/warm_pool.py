@@ -0,0 +1,70 @@
+import threading
+import uuid
+from django.conf import settings
+from django.db import connections
+from api.exceptions import LockTimeoutException
+from api.locks import lock_manager
+from api.nodes import get_volume_group
+
+# pool volumes are named warmpool_<size class>_<random>, e.g. warmpool_20g_1f3a9c0e
+POOL_PREFIX = "warmpool_"
+
+
+def size_class(size_in_gb):
+    return ("%gg" % float(size_in_gb)).replace(".", "p")
+
+
+def _pool_names(volume_group, size_in_gb):
+    prefix = POOL_PREFIX + size_class(size_in_gb) + "_"
+    return [name for name in volume_group.get_logical_volume_names() if name.startswith(prefix)]
+
+
+def claim_logical_volume(group, size_in_gb, lv_name, node=None):
+    """renames a pre-created, pre-wiped pool volume of that size to lv_name; False when the pool is empty or the
+    volume group has no pool (pools are kept on this portal server only)"""
+    if node is not None or float(size_in_gb) not in [float(size) for size in settings.WARM_POOL.get(group, {})]:
+        return False
+    volume_group = get_volume_group(group)
+    claimed = False
+    with lock_manager.lock("warm_pool:%s" % group):
+        for pool_name in _pool_names(volume_group, size_in_gb):
+            if volume_group.rename_logical_volume(pool_name, lv_name):
+                claimed = True
+                break
+    if claimed:
+        refill_in_background()
+    return claimed
+
+
+def refill():
+    """tops every configured volume group & size class up to its pool size; returns the number of volumes created"""
+    created = 0
+    try:
+        with lock_manager.lock("warm_pool:refill", timeout=0):
+            for group, size_classes in settings.WARM_POOL.items():
+                volume_group = get_volume_group(group)
+                for size_in_gb, count in size_classes.items():
+                    for _ in range(count - len(_pool_names(volume_group, size_in_gb))):
+                        name = POOL_PREFIX + size_class(size_in_gb) + "_" + uuid.uuid4().hex[:8]
+                        if not volume_group.create_logical_volume(name, size_in_gb):
+                            break
+                        created += 1
+    except LockTimeoutException:
+        pass  # another refill is already running
+    return created
+
+
+def _refill_and_close():
+    try:
+        refill()
+    finally:
+        connections.close_all()
+
+
+def refill_in_background():
+    threading.Thread(target=_refill_and_close, daemon=True).start()
+
+
+def discard_in_background(volume_group, lv_name):
+    """removes a volume off the request path"""
+    threading.Thread(target=volume_group.remove_logical_volume, args=(lv_name,), daemon=True).start()
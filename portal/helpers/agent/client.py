@@ -0,0 +1,76 @@
+import http.client
+import json
+import threading
+from urllib.parse import urlparse
+from helpers import listeners
+from helpers.agent import protocol
+
+# helper methods that only read state; anything else called on a storage node may change it
+READ_ONLY_PREFIXES = ("get_", "list_", "count_", "report_", "contains_", "is_", "exists")
+
+
+class AgentException(Exception):
+    pass
+
+
+class AgentClient(object):
+    """talks to the agent of a storage node, keeping one persistent HTTP connection per thread"""
+
+    def __init__(self, url, token=None, timeout=600):
+        parsed = urlparse(url)
+        self._host = parsed.hostname
+        self._port = parsed.port or 9100
+        self._token = token
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+        return self._local.connection
+
+    def _request(self, method, path, data=None):
+        body = json.dumps(data).encode("utf-8") if data is not None else None
+        headers = {"Content-Type": "application/json"}
+        if self._token:
+            headers["X-Agent-Token"] = self._token
+        for attempt in (1, 2):  # a pooled connection may have been dropped by the agent, retry once
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                payload = json.loads(response.read().decode("utf-8") or "{}")
+                break
+            except (http.client.HTTPException, ConnectionError) as e:
+                connection.close()
+                self._local.connection = None
+                if attempt == 2:
+                    raise AgentException(str(e))
+        if response.status != 200:
+            raise AgentException(payload.get("error", "Agent replied with status %d" % response.status))
+        return payload
+
+    def call(self, class_name, init_args, method, *args, **kwargs):
+        payload = self._request("POST", "/call", {"object": class_name, "init": list(init_args), "method": method,
+                                                  "args": protocol.encode(list(args)),
+                                                  "kwargs": protocol.encode(kwargs)})
+        if not method.startswith(READ_ONLY_PREFIXES):
+            listeners.notify("agent", method)  # the helpers ran in the agent, whose listeners are not ours
+        return protocol.decode(payload.get("result"), lambda name, arguments: RemoteEntity(self, name, *arguments))
+
+    def stats(self):
+        return self._request("GET", "/stats")
+
+
+class RemoteEntity(object):
+    """stands in for a helper entity (VolumeGroup, LogicalVolume, ISCSITarget, ...) living on a storage node"""
+
+    def __init__(self, client, class_name, *init_args):
+        self._client = client
+        self._class_name = class_name
+        self._init_args = init_args
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self._client.call(self._class_name, self._init_args, method, *args, **kwargs)
@@ -0,0 +1,70 @@
+from helpers.lvm2.entities import PhysicalVolume, VolumeGroup, LogicalVolume, Snapshot
+from helpers.tgtadm.iscsi_initiator import ISCSIInitiator
+from helpers.tgtadm.iscsi_target import ISCSITarget
+
+# classes (and the constructor arguments to rebuild them) a storage agent exposes to the portal
+EXPOSED_CLASSES = {
+    "PhysicalVolume": (PhysicalVolume, lambda entity: [entity.get_path_id()]),
+    "VolumeGroup": (VolumeGroup, lambda entity: [entity.get_name()]),
+    "LogicalVolume": (LogicalVolume, lambda entity: [entity._device_path]),
+    "Snapshot": (Snapshot, lambda entity: [entity._device_path]),
+    "ISCSITarget": (ISCSITarget, None),
+}
+
+# plain values passed as arguments, rebuilt on the other side rather than proxied
+VALUE_CLASSES = {
+    "ISCSIInitiator": (ISCSIInitiator, lambda initiator: [initiator.get_ip_address(), initiator.get_name()]),
+}
+
+_VOLUME_METHODS = ("get_all", "get_name", "get_path", "get_size", "get_layout", "get_snapshots", "contains_snapshot",
+                   "create_snapshot", "remove_snapshot", "revert_to_snapshot", "extend", "attach_cache",
+                   "detach_cache", "get_cache_status", "prewarm", "get_resident_ranges", "get_resident_bytes")
+
+# the methods the portal calls on each class; nothing else is run, whatever the caller asks for
+ALLOWED_METHODS = {
+    "PhysicalVolume": ("get_path_id", "get_size"),
+    "VolumeGroup": ("get_name", "get_logical_volumes", "get_logical_volume_names", "contains_logical_volume",
+                    "create_logical_volume", "create_cache_pool", "remove_logical_volume", "rename_logical_volume",
+                    "report_snapshots"),
+    "LogicalVolume": _VOLUME_METHODS,
+    "Snapshot": _VOLUME_METHODS,
+    "ISCSITarget": ("add", "remove", "exists", "get_id", "get_name", "get_control_port", "attach_logical_unit",
+                    "detach_logical_unit", "detach_all_logical_units", "tune_logical_unit",
+                    "update_logical_unit_params", "get_logical_unit_number", "list_active_logical_units",
+                    "bind_to_initiator", "unbind_from_initiator", "count_sessions", "list_session_addresses",
+                    "list_connections", "close_connection", "close_all_connections", "close_initiator_connections"),
+}
+
+
+def encode(value):
+    """turns helper return values into JSON data, entities become {"__object__": class, "args": [...]}"""
+    if isinstance(value, (list, tuple, set)):
+        return [encode(item) for item in value]
+    if isinstance(value, dict):
+        return dict((str(key), encode(item)) for key, item in value.items())
+    for name in ("Snapshot", "LogicalVolume", "PhysicalVolume", "VolumeGroup"):  # subclasses first
+        cls, arguments = EXPOSED_CLASSES[name]
+        if isinstance(value, cls):
+            return {"__object__": name, "args": arguments(value)}
+    for name, (cls, arguments) in VALUE_CLASSES.items():
+        if isinstance(value, cls):
+            return {"__object__": name, "args": arguments(value)}
+    return value
+
+
+def decode(value, factory):
+    """reverse of encode, factory(class name, args) builds the proxy for a remote entity"""
+    if isinstance(value, list):
+        return [decode(item, factory) for item in value]
+    if isinstance(value, dict):
+        if "__object__" in value:
+            return factory(value["__object__"], value["args"])
+        return dict((key, decode(item, factory)) for key, item in value.items())
+    return value
+
+
+def build_value(name, arguments):
+    """decode factory of the agent: only plain values are rebuilt, entities are never accepted as arguments"""
+    if name not in VALUE_CLASSES:
+        raise ValueError("'%s' cannot be passed as an argument" % name)
+    return VALUE_CLASSES[name][0](*arguments)
@@ -0,0 +1,86 @@
+import argparse
+import hmac
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from helpers.agent import protocol, stats
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    """runs lvm2 & tgtadm helper calls of the portal on this storage node
+
+    POST /call  {"object": "VolumeGroup", "init": ["vg0"], "method": "create_logical_volume", "args": [...]}
+    GET  /stats free volume group space & NIC throughput used by the portal placement scheduler
+    """
+
+    protocol_version = "HTTP/1.1"
+    token = None
+
+    def _reply(self, code, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if self.token and not hmac.compare_digest(self.headers.get("X-Agent-Token") or "", self.token):
+            self._reply(403, {"error": "Invalid agent token"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/stats":
+            return self._reply(200, stats.collect())
+        self._reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        if not self._authorized():
+            return
+        if self.path != "/call":
+            return self._reply(404, {"error": "Not found"})
+        exposed = protocol.EXPOSED_CLASSES.get(request.get("object"))
+        method = request.get("method") or ""
+        if not exposed or method not in protocol.ALLOWED_METHODS.get(request.get("object"), ()):
+            return self._reply(400, {"error": "Call not allowed"})
+        try:
+            entity = exposed[0](*request.get("init", []))
+            result = getattr(entity, method)(*protocol.decode(request.get("args", []), protocol.build_value),
+                                             **protocol.decode(request.get("kwargs", {}), protocol.build_value))
+        except Exception as e:
+            return self._reply(500, {"error": str(e)})
+        self._reply(200, {"result": protocol.encode(result)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host, port, token=None, insecure=False):
+    """an agent server checking its own token; refuses to make one without a token, since the agent runs as root,
+    unless insecure"""
+    if not token and not insecure:
+        raise ValueError("An agent token is required, pass insecure to serve without one")
+    return ThreadingHTTPServer((host, port), type("Handler", (AgentRequestHandler,), {"token": token}))
+
+
+def serve(host, port, token=None, insecure=False):
+    """serves until interrupted, see make_server()"""
+    server = make_server(host, port, token, insecure)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Storage node agent of the bare metal portal")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on, 0.0.0.0 for all")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--token", default=None, help="shared secret expected in the X-Agent-Token header")
+    parser.add_argument("--insecure", action="store_true", help="serve anyone, without a token")
+    arguments = parser.parse_args()
+    serve(arguments.host, arguments.port, arguments.token, arguments.insecure)
@@ -0,0 +1,66 @@
+import os
+import time
+from helpers.lvm2.entities import VolumeGroup
+from helpers.telemetry.block_stats import SECTOR_SIZE, get_stat_path, read_counters
+
+
+def read_network_bytes():
+    """total received + transmitted bytes per interface from /proc/net/dev"""
+    counters = {}
+    try:
+        with open("/proc/net/dev") as net_dev:
+            for line in net_dev.readlines()[2:]:
+                interface, values = line.split(":", 1)
+                values = values.split()
+                counters[interface.strip()] = int(values[0]) + int(values[8])
+    except (IOError, ValueError, IndexError) as e:
+        print(str(e))
+    return counters
+
+
+def _read_block_counters(paths):
+    counters = {}
+    for path in paths:
+        try:
+            fd = os.open(get_stat_path(path), os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            counters[path] = read_counters(fd)
+        except (OSError, ValueError, IndexError):
+            pass
+        finally:
+            os.close(fd)
+    return counters
+
+
+def collect(interval=0.2):
+    """free space of every volume group, free space & I/O load of their physical volumes and NIC throughput in
+    bytes per second, sampled over interval"""
+    before = read_network_bytes()
+    started = time.monotonic()
+    physical_volumes = VolumeGroup.report_physical_volumes()
+    pv_paths = [path for group in physical_volumes.values() for path in group]
+    block_before = _read_block_counters(pv_paths)
+    block_started = time.monotonic()
+    free_space = dict((volume_group.get_name(), volume_group.get_free_space())
+                      for volume_group in VolumeGroup.get_all())
+    remaining = interval - (time.monotonic() - started)
+    if remaining > 0:
+        time.sleep(remaining)
+    after = read_network_bytes()
+    block_after = _read_block_counters(pv_paths)
+    block_elapsed = max(time.monotonic() - block_started, 0.001)
+    elapsed = max(time.monotonic() - started, 0.001)
+    throughput = dict((interface, (after[interface] - before.get(interface, after[interface])) / elapsed)
+                      for interface in after if interface != "lo")
+    for group in physical_volumes.values():
+        for path, physical_volume in group.items():
+            if path in block_before and path in block_after:
+                (reads, read_sectors, _, writes, write_sectors, _) = [
+                    later - earlier for later, earlier in zip(block_after[path], block_before[path])]
+                physical_volume["iops"] = (reads + writes) / block_elapsed
+                physical_volume["bytes_per_second"] = (read_sectors + write_sectors) * SECTOR_SIZE / block_elapsed
+            else:
+                physical_volume["iops"] = physical_volume["bytes_per_second"] = None
+    return {"volume_groups": free_space, "physical_volumes": physical_volumes, "nic_bytes_per_second": throughput}
@@ -0,0 +1,260 @@
+import argparse
+import hashlib
+import hmac
+import json
+import queue
+import socket
+import socketserver
+import threading
+import time
+from helpers.imagestore.repository import Repository, check_digest
+
+MAX_HEADER = 16 * 1024 * 1024
+MAX_PAYLOAD = 64 * 1024 * 1024  # largest chunk accepted
+DIGESTS_PER_MESSAGE = 10000
+SEND_SLICE = 256 * 1024
+
+
+class ReplicationException(Exception):
+    pass
+
+
+def send_message(wfile, message, payload=b"", limiter=None):
+    """a message is one line of JSON with the length of the raw payload that follows it"""
+    wfile.write(json.dumps(dict(message, length=len(payload))).encode("utf-8") + b"\n")
+    view = memoryview(payload)
+    while view:
+        if limiter:
+            limiter.acquire(min(SEND_SLICE, len(view)))
+        wfile.write(view[:SEND_SLICE])
+        view = view[SEND_SLICE:]
+    wfile.flush()
+
+
+def read_message(rfile):
+    """(message, payload), (None, None) once the other side closed the connection"""
+    line = rfile.readline(MAX_HEADER)
+    if not line:
+        return None, None
+    if not line.endswith(b"\n"):
+        raise ReplicationException("Message header too long")
+    message = json.loads(line.decode("utf-8"))
+    length = message.get("length", 0) if isinstance(message, dict) else None
+    if not isinstance(length, int) or not 0 <= length <= MAX_PAYLOAD:
+        raise ReplicationException("Invalid message")
+    payload = rfile.read(length) if length else b""
+    if len(payload) != length:
+        raise ReplicationException("Connection closed in the middle of a message")
+    return message, payload
+
+
+class RateLimiter(object):
+    """paces the sends of all transfer threads together to bytes_per_second, None for no cap"""
+
+    def __init__(self, bytes_per_second=None):
+        self._rate = bytes_per_second
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self, amount):
+        if not self._rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + amount / float(self._rate)
+        if start > now:
+            time.sleep(start - now)
+
+
+class ReplicationHandler(socketserver.StreamRequestHandler):
+    """the receiving end, one connection at a time per thread:
+
+    {"op": "hello", "token": ...}            authenticates the connection when the server has a token
+    {"op": "manifest", "name": ...}          -> {"manifest": the image's manifest or null}
+    {"op": "missing", "digests": [...]}      -> {"missing": [digests of chunks this repository lacks]}
+    {"op": "put", "digest": ...} + chunk     stores the chunk once its content matches the digest
+    {"op": "commit", "manifest": {...}}      writes the manifest once all of its chunks are here
+    """
+
+    repository = None
+    token = None
+    on_manifest = None
+
+    def _reply(self, **message):
+        send_message(self.wfile, dict(message, ok=message.get("error") is None))
+
+    def handle(self):
+        authorized = not self.token
+        while True:
+            try:
+                message, payload = read_message(self.rfile)
+            except (ReplicationException, ValueError, OSError):
+                return
+            if message is None:
+                return
+            op = message.get("op")
+            try:
+                if op == "hello":
+                    authorized = authorized or hmac.compare_digest(str(message.get("token")), self.token)
+                    self._reply(error=None if authorized else "Invalid replication token")
+                elif not authorized:
+                    return self._reply(error="Not authorized")
+                elif op == "manifest":
+                    self._reply(manifest=self.repository.read_manifest(message["name"]))
+                elif op == "missing":
+                    for digest in message["digests"]:
+                        check_digest(digest)
+                    self._reply(missing=self.repository.get_missing_chunks(message["digests"]))
+                elif op == "put":
+                    if hashlib.sha256(payload).hexdigest() != check_digest(message["digest"]):
+                        self._reply(error="Chunk %s arrived damaged" % message["digest"])
+                    else:
+                        self.repository.put_chunk(payload, message["digest"])
+                        self._reply()
+                elif op == "commit":
+                    manifest = message["manifest"]
+                    Repository.check_manifest(manifest)
+                    missing = self.repository.get_missing_chunks(manifest["chunks"])
+                    if missing:
+                        self._reply(error="%d chunks are missing" % len(missing))
+                    else:
+                        self.repository.write_manifest(manifest)
+                        if self.on_manifest:
+                            self.on_manifest(manifest)
+                        self._reply()
+                else:
+                    self._reply(error="Unknown operation '%s'" % op)
+            except (KeyError, TypeError, ValueError, OSError) as e:
+                self._reply(error=str(e))
+
+
+class ReplicationServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def make_server(root, host, port, token=None, chunk_size=4 * 1024 * 1024, on_manifest=None, insecure=False):
+    """a server receiving images into the repository at root; on_manifest(manifest) runs after each image arrives.
+    Refuses to make one without a token, since any sender may replace images, unless insecure"""
+    if not token and not insecure:
+        raise ReplicationException("A replication token is required, pass insecure to serve without one")
+    handler = type("Handler", (ReplicationHandler,), {"repository": Repository(root, chunk_size), "token": token,
+                                                      "on_manifest": staticmethod(on_manifest) if on_manifest
+                                                      else None})
+    return ReplicationServer((host, port), handler)
+
+
+def serve(root, host, port, token=None, chunk_size=4 * 1024 * 1024, on_manifest=None, insecure=False):
+    """receives images into the repository at root until interrupted, see make_server()"""
+    server = make_server(root, host, port, token, chunk_size, on_manifest, insecure)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class PeerConnection(object):
+    def __init__(self, host, port, token=None, timeout=60, limiter=None):
+        self._socket = socket.create_connection((host, port), timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._rfile = self._socket.makefile("rb")
+        self._wfile = self._socket.makefile("wb")
+        self._limiter = limiter
+        if token:
+            self.request({"op": "hello", "token": token})
+
+    def request(self, message, payload=b""):
+        send_message(self._wfile, message, payload, self._limiter)
+        reply, _ = read_message(self._rfile)
+        if reply is None:
+            raise ReplicationException("Peer closed the connection")
+        if not reply.get("ok"):
+            raise ReplicationException(reply.get("error") or "Peer refused '%s'" % message.get("op"))
+        return reply
+
+    def close(self):
+        for closable in (self._rfile, self._wfile, self._socket):
+            try:
+                closable.close()
+            except OSError:
+                pass
+
+
+def replicate(repository, name, host, port, token=None, workers=4, bytes_per_second=None, timeout=60):
+    """brings image `name` of the local repository to the peer, sending only chunks the peer has in none of its
+    images over `workers` connections at bytes_per_second in total; returns transfer stats"""
+    started = time.monotonic()
+    manifest = repository.read_manifest(name)
+    if manifest is None:
+        raise ReplicationException("Image '%s' not found" % name)
+    digests = sorted(set(filter(None, manifest["chunks"])))
+    connection = PeerConnection(host, port, token, timeout)
+    try:
+        peer_manifest = connection.request({"op": "manifest", "name": name})["manifest"]
+        if peer_manifest and peer_manifest.get("sha256") == manifest["sha256"] and \
+                peer_manifest["chunks"] == manifest["chunks"]:
+            return {"image": name, "chunks": len(digests), "sent_chunks": 0, "sent_bytes": 0, "up_to_date": True,
+                    "seconds": round(time.monotonic() - started, 3)}
+        missing = []
+        for index in range(0, len(digests), DIGESTS_PER_MESSAGE):
+            missing.extend(connection.request({"op": "missing",
+                                               "digests": digests[index:index + DIGESTS_PER_MESSAGE]})["missing"])
+    finally:
+        connection.close()
+
+    pending = queue.Queue()
+    for digest in missing:
+        pending.put(digest)
+    limiter = RateLimiter(bytes_per_second)
+    sent = {"chunks": 0, "bytes": 0}
+    failures = []
+    lock = threading.Lock()
+
+    def transfer():
+        try:
+            peer = PeerConnection(host, port, token, timeout, limiter)
+        except (OSError, ReplicationException) as e:
+            failures.append(e)
+            return
+        try:
+            while not failures:
+                try:
+                    digest = pending.get_nowait()
+                except queue.Empty:
+                    return
+                data = repository.get_chunk(digest)
+                peer.request({"op": "put", "digest": digest}, data)
+                with lock:
+                    sent["chunks"] += 1
+                    sent["bytes"] += len(data)
+        except (OSError, ReplicationException) as e:
+            failures.append(e)
+        finally:
+            peer.close()
+
+    threads = [threading.Thread(target=transfer, daemon=True) for _ in range(max(1, min(workers, len(missing))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise ReplicationException(str(failures[0]))
+    connection = PeerConnection(host, port, token, timeout)
+    try:
+        connection.request({"op": "commit", "manifest": manifest})
+    finally:
+        connection.close()
+    return {"image": name, "chunks": len(digests), "sent_chunks": sent["chunks"], "sent_bytes": sent["bytes"],
+            "up_to_date": False, "seconds": round(time.monotonic() - started, 3)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Receives replicated images into an image repository")
+    parser.add_argument("root", help="directory of the image repository")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--token", default=None, help="shared secret senders must present")
+    parser.add_argument("--insecure", action="store_true", help="accept images from anyone, without a token")
+    arguments = parser.parse_args()
+    serve(arguments.root, arguments.host, arguments.port, arguments.token, insecure=arguments.insecure)
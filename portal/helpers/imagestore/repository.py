@@ -0,0 +1,303 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import stat
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def check_digest(digest):
+    """the digest when it is a lowercase hex SHA-256, anything else could name a path outside the repository"""
+    if not isinstance(digest, str) or not _DIGEST.match(digest):
+        raise ValueError("Invalid chunk digest %r" % (digest,))
+    return digest
+
+
+class Repository(object):
+    """content addressed store of disk images.
+
+    An image is cut in fixed size chunks, each kept once under chunks/<2 hex>/<sha256> however many images share it;
+    manifests/<name>.json lists the chunk digests of an image in order, null for all-zero chunks which are not
+    stored. Chunks are referenced by the manifests alone: collect_garbage() counts references across all manifests
+    and removes chunks nothing refers to, holding the repository lock exclusively while storing holds it shared.
+    """
+
+    def __init__(self, root, chunk_size=4 * 1024 * 1024):
+        self._root = root
+        self._chunk_size = chunk_size
+        for directory in ("chunks", "manifests", "tmp"):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    def get_root(self):
+        return self._root
+
+    def get_chunk_size(self):
+        return self._chunk_size
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """flock() of the repository, shared by writers of chunks & manifests and exclusive for garbage collection;
+        taken on a descriptor of its own, so threads of one process exclude each other too"""
+        fd = os.open(os.path.join(self._root, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def _chunk_path(self, digest):
+        check_digest(digest)
+        return os.path.join(self._root, "chunks", digest[:2], digest)
+
+    def _manifest_path(self, name):
+        if not name or "/" in name or name.startswith("."):
+            raise ValueError("Invalid image name '%s'" % name)
+        return os.path.join(self._root, "manifests", name + ".json")
+
+    def _write_temporary(self, data):
+        temporary = os.path.join(self._root, "tmp", uuid.uuid4().hex)
+        with open(temporary, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return temporary
+
+    def _write_atomically(self, path, data):
+        temporary = self._write_temporary(data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temporary, path)
+
+    def has_chunk(self, digest):
+        return os.path.exists(self._chunk_path(digest))
+
+    def put_chunk(self, data, digest=None):
+        """stores the chunk unless already there; returns (digest, True when newly stored)"""
+        with self._locked():
+            return self._put_chunk(data, digest)
+
+    def _put_chunk(self, data, digest=None):
+        digest = digest or hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            os.utime(path)  # shields it from collections until a manifest (sent later, say) refers to it
+            return digest, False
+        temporary = self._write_temporary(data)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.link(temporary, path)  # unlike a rename, only one of the threads storing the same chunk gets here
+            return digest, True
+        except FileExistsError:
+            os.utime(path)
+            return digest, False
+        finally:
+            os.remove(temporary)
+
+    def get_chunk(self, digest):
+        with open(self._chunk_path(digest), "rb") as f:
+            return f.read()
+
+    def get_missing_chunks(self, digests):
+        return [digest for digest in digests if digest is not None and not self.has_chunk(digest)]
+
+    @staticmethod
+    def check_manifest(manifest):
+        """raises ValueError unless the manifest is well formed: sizes that add up and valid chunk digests"""
+        try:
+            size, chunk_size, chunks = manifest["size"], manifest["chunk_size"], manifest["chunks"]
+        except (KeyError, TypeError):
+            raise ValueError("Incomplete manifest")
+        if not (isinstance(size, int) and isinstance(chunk_size, int) and isinstance(chunks, list)) or size < 0 \
+                or chunk_size <= 0 or len(chunks) != (size + chunk_size - 1) // chunk_size:
+            raise ValueError("Manifest sizes do not match its chunks")
+        for digest in chunks:
+            if digest is not None:
+                check_digest(digest)
+
+    def write_manifest(self, manifest):
+        with self._locked():
+            self._write_manifest(manifest)
+
+    def _write_manifest(self, manifest):
+        self.check_manifest(manifest)
+        self._write_atomically(self._manifest_path(manifest["name"]), json.dumps(manifest).encode("utf-8"))
+
+    def read_manifest(self, name):
+        """the manifest of an image, None when there is no such image"""
+        try:
+            with open(self._manifest_path(name), "rb") as f:
+                return json.loads(f.read().decode("utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def list_images(self):
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self._root, "manifests"))
+                      if name.endswith(".json"))
+
+    def remove_image(self, name):
+        """drops the manifest only, its chunks go with the next garbage collection"""
+        try:
+            os.remove(self._manifest_path(name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def store(self, source_path, name, workers=8, size=None):
+        """chunks the device or file into the repository as image `name`: read sequentially, hashed & written by
+        `workers` threads with at most 2 * workers chunks in memory; returns the manifest with its store stats"""
+        chunk_size = self._chunk_size
+        zero = bytes(chunk_size)
+        digests = []
+        stats = {"new_chunks": 0, "new_bytes": 0}
+        stats_lock = threading.Lock()
+        in_flight = threading.BoundedSemaphore(2 * workers)
+        image_digest = hashlib.sha256()
+
+        def put(index, data):
+            try:
+                digest, new = self._put_chunk(data)
+                digests[index] = digest
+                if new:
+                    with stats_lock:
+                        stats["new_chunks"] += 1
+                        stats["new_bytes"] += len(data)
+            finally:
+                in_flight.release()
+
+        with self._locked():  # no collection while chunks are written whose manifest is not there yet
+            fd = os.open(source_path, os.O_RDONLY)
+            try:
+                size = os.lseek(fd, 0, os.SEEK_END) if size is None else size
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = []
+                    for index, offset in enumerate(range(0, size, chunk_size)):
+                        data = os.pread(fd, min(chunk_size, size - offset), offset)
+                        if len(data) != min(chunk_size, size - offset):
+                            raise IOError("Short read at offset %d of '%s'" % (offset, source_path))
+                        image_digest.update(data)
+                        digests.append(None)
+                        if data == zero[:len(data)]:
+                            continue
+                        in_flight.acquire()
+                        futures.append(executor.submit(put, index, data))
+                    for future in futures:
+                        future.result()
+            finally:
+                os.close(fd)
+            manifest = {"name": name, "size": size, "chunk_size": chunk_size, "sha256": image_digest.hexdigest(),
+                        "chunks": digests, "created": time.time()}
+            self._write_manifest(manifest)
+        manifest.update(stats)
+        return manifest
+
+    def restore(self, name, destination_path, workers=8, skip_zero=False):
+        """writes image `name` onto the device or file, `workers` chunks at a time; all-zero chunks are written as
+        zeros unless skip_zero (the destination is known to read back zeros, like a new sparse file). Returns the
+        manifest, None when there is no such image"""
+        manifest = self.read_manifest(name)
+        if manifest is None:
+            return None
+        chunk_size = manifest["chunk_size"]
+        size = manifest["size"]
+        fd = os.open(destination_path, os.O_WRONLY | os.O_CREAT, 0o644)
+
+        def write(index):
+            digest = manifest["chunks"][index]
+            offset = index * chunk_size
+            length = min(chunk_size, size - offset)
+            if digest is None and skip_zero:
+                return
+            data = self.get_chunk(digest) if digest else bytes(length)
+            if len(data) != length:
+                raise IOError("Chunk %s of image '%s' is damaged" % (digest, name))
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(write, range(len(manifest["chunks"]))))
+            info = os.fstat(fd)
+            if stat.S_ISREG(info.st_mode) and info.st_size < size:
+                os.ftruncate(fd, size)  # a plain file ending in skipped zero chunks
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return manifest
+
+    def verify(self, name):
+        """digests of the chunks of image `name` which are missing or damaged, None when there is no such image"""
+        manifest = self.read_manifest(name)
+        if manifest is None:
+            return None
+        damaged = []
+        for digest in set(filter(None, manifest["chunks"])):
+            try:
+                if hashlib.sha256(self.get_chunk(digest)).hexdigest() != digest:
+                    damaged.append(digest)
+            except FileNotFoundError:
+                damaged.append(digest)
+        return sorted(damaged)
+
+    def reference_counts(self):
+        """{digest: number of references} over the manifests of all images"""
+        references = Counter()
+        for name in self.list_images():
+            manifest = self.read_manifest(name)
+            if manifest:
+                references.update(filter(None, manifest["chunks"]))
+        return references
+
+    def collect_garbage(self, grace_seconds=3600):
+        """removes chunks no manifest refers to and left over temporary files, sparing both when touched within the
+        last grace_seconds since a replicating peer sends chunks well before their manifest; returns (chunks
+        removed, bytes freed)"""
+        with self._locked(exclusive=True):
+            references = self.reference_counts()
+            cutoff = time.time() - grace_seconds
+            removed = freed = 0
+            for directory, _, names in os.walk(os.path.join(self._root, "chunks")):
+                for digest in names:
+                    path = os.path.join(directory, digest)
+                    try:
+                        info = os.stat(path)
+                        if digest not in references and info.st_mtime < cutoff:
+                            os.remove(path)
+                            removed += 1
+                            freed += info.st_size
+                    except FileNotFoundError:
+                        pass
+            for name in os.listdir(os.path.join(self._root, "tmp")):
+                path = os.path.join(self._root, "tmp", name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return removed, freed
+
+    def get_usage(self):
+        """logical bytes of all images against the bytes their chunks take up"""
+        logical = 0
+        for name in self.list_images():
+            manifest = self.read_manifest(name)
+            logical += manifest["size"] if manifest else 0
+        stored = chunks = 0
+        for directory, _, names in os.walk(os.path.join(self._root, "chunks")):
+            for digest in names:
+                try:
+                    stored += os.stat(os.path.join(directory, digest)).st_size
+                    chunks += 1
+                except FileNotFoundError:
+                    pass
+        return {"images": len(self.list_images()), "logical_bytes": logical, "stored_bytes": stored,
+                "chunks": chunks, "ratio": round(logical / stored, 2) if stored else None}
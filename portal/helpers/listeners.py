@@ -0,0 +1,21 @@
+_listeners = []
+
+
+def add_listener(listener):
+    """listener(source, action) is called after every storage state change the helpers make, e.g. ("lvm2",
+    "lvcreate") or ("tgtadm", "bind"), so callers can drop whatever they derived from the old state"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def notify(source, action):
+    for listener in list(_listeners):
+        try:
+            listener(source, action)
+        except Exception as e:
+            print(str(e))
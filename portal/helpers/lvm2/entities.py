@@ -1,6 +1,7 @@
 import re
 import os
 from helpers.lvm2.helper import Helper
+from helpers.pagecache import page_cache
 from enum import Enum, unique
 import inspect
 
@@ -255,6 +256,12 @@ class VolumeGroup(object):
                 vgs.append(VolumeGroup(line.split(":")[0]))
         return vgs
 
+    def get_free_space(self, unit="g"):
+        output = Helper.execute(["vgs", "--noheadings", "--nosuffix", "--units", unit, "-o", "vg_free", self._vg_name])
+        if output and output.strip():
+            return float(output.strip())
+        return None
+
     def remove(self):
         output = Helper.execute(["vgremove", self._vg_name])
         if output and 'Volume group "' + self._vg_name + '" successfully removed' in output:
@@ -274,10 +281,19 @@ class VolumeGroup(object):
                     return True
         return False
 
-    def create_logical_volume(self, lv_name, size, unit="GiB"):
+    def create_logical_volume(self, lv_name, size, unit="GiB", stripes=None, stripe_size_in_kb=None,
+                              physical_volume_paths=None):
+        """without stripes & PVs lvm2 allocates extents itself, usually all on the first PV with room"""
         if lv_name and size:
-            output = Helper.execute(["lvcreate", "--name", lv_name,
-                                  "--size", str(size)+unit, "-W", "y", self._vg_name])
+            command = ["lvcreate", "--name", lv_name, "--size", str(size)+unit, "-W", "y"]
+            if stripes and stripes > 1:
+                command.extend(["--stripes", str(stripes)])
+                if stripe_size_in_kb:
+                    command.extend(["--stripesize", str(stripe_size_in_kb)+"k"])
+            command.append(self._vg_name)
+            if physical_volume_paths:
+                command.extend(physical_volume_paths)
+            output = Helper.execute(command)
             if output and 'Logical volume "' + lv_name + '" created' in output:
                 return True
         return False
@@ -296,6 +312,22 @@ class VolumeGroup(object):
                 return True
         return False
 
+    def create_cache_pool(self, pool_name, size, physical_volume_path=None, unit="GiB"):
+        """a cache pool (dm-cache data & metadata) to speed up one logical volume, placed on the fast PV given"""
+        command = ["lvcreate", "--type", "cache-pool", "--name", pool_name, "--size", str(size)+unit, self._vg_name]
+        if physical_volume_path:
+            command.append(physical_volume_path)
+        output = Helper.execute(command)
+        if output and 'Logical volume "' + pool_name + '" created' in output:
+            return True
+        return False
+
+    def get_logical_volume_names(self):
+        output = Helper.execute(["lvs", "--noheadings", "-o", "lv_name", self._vg_name])
+        if output:
+            return [line.strip() for line in output.split("\n") if line.strip()]
+        return []
+
     def get_logical_volumes(self, name=None):
 
         def is_snapshot(lv_path):
@@ -323,6 +355,53 @@ class VolumeGroup(object):
                     lvs.append(LogicalVolume(columns[0]))
         return lvs
 
+    @staticmethod
+    def report_snapshots(vg_names=None):
+        """COW usage of every snapshot in the given (or all) volume groups from a single lvs call,
+        as {"vg name/snapshot name": {"origin", "size" in GiB, "data_percent", "invalid"}}"""
+        command = ["lvs", "--noheadings", "--nosuffix", "--units", "g", "--separator", "|",
+                   "-o", "vg_name,lv_name,origin,lv_size,data_percent,lv_attr"]
+        if vg_names:
+            command.extend(vg_names)
+        output = Helper.execute(command)
+        snapshots = {}
+        if output:
+            for line in output.split("\n"):
+                columns = [column.strip() for column in line.split("|")]
+                if len(columns) != 6 or not columns[2]:
+                    continue
+                (vg_name, lv_name, origin, size, data_percent, attributes) = columns
+                snapshots[vg_name + "/" + lv_name] = {
+                    "origin": origin,
+                    "size": float(size),
+                    "data_percent": float(data_percent) if data_percent else None,
+                    "invalid": len(attributes) > 4 and attributes[4] == "I"
+                }
+        return snapshots
+
+    @staticmethod
+    def report_physical_volumes(vg_names=None):
+        """size & free space in GiB and free extents of the PVs in the given (or all) volume groups from a single
+        pvs call, as {"vg name": {"pv path": {"size", "free", "free_extents"}}}"""
+        command = ["pvs", "--noheadings", "--nosuffix", "--units", "g", "--separator", "|",
+                   "-o", "vg_name,pv_name,pv_size,pv_free,pv_pe_count,pv_pe_alloc_count"]
+        if vg_names:
+            command.extend(vg_names)
+        output = Helper.execute(command)
+        physical_volumes = {}
+        if output:
+            for line in output.split("\n"):
+                columns = [column.strip() for column in line.split("|")]
+                if len(columns) != 6 or not columns[0]:
+                    continue
+                (vg_name, pv_name, size, free, extents, allocated_extents) = columns
+                physical_volumes.setdefault(vg_name, {})[pv_name] = {
+                    "size": float(size),
+                    "free": float(free),
+                    "free_extents": int(extents) - int(allocated_extents)
+                }
+        return physical_volumes
+
     def include_physical_volume(self, pv):
         output = Helper.execute(["vgextend", self._vg_name, pv.get_name()])
         if output:
@@ -384,6 +463,84 @@ class LogicalVolume(Disk):
     def get_volume_group(self):
         return VolumeGroup(self._filter_info("VG Name"))
 
+    def _get_volume_group_name(self):
+        splits = self._device_path.split("/")
+        if len(splits) == 4 and splits[1] == "dev":  # /dev/<vg name>/<lv name>, spares an lvdisplay call
+            return splits[2]
+        return self.get_volume_group().get_name()
+
+    def extend(self, size, unit="GiB"):
+        output = Helper.execute(["lvextend", "--size", "+"+str(size)+unit, self._device_path])
+        if output and "successfully resized" in output:
+            return True
+        return False
+
+    def get_layout(self):
+        """segments of the LV with their type, stripes & the PVs (and first extent on each) they live on"""
+        output = Helper.execute(["lvs", "--noheadings", "--nosuffix", "--units", "k", "--separator", "|",
+                                 "-o", "seg_type,stripes,stripe_size,seg_size,devices", self._device_path])
+        segments = []
+        if output:
+            for line in output.split("\n"):
+                columns = [column.strip() for column in line.split("|")]
+                if len(columns) != 5 or not columns[0]:
+                    continue
+                (segment_type, stripes, stripe_size, segment_size, devices) = columns
+                physical_volumes = []
+                for device in devices.split(","):
+                    match = re.search(r"^(.+)\((\d+)\)$", device.strip())
+                    if match:
+                        physical_volumes.append({"path": match.group(1), "start_extent": int(match.group(2))})
+                segments.append({
+                    "type": segment_type,
+                    "stripes": int(stripes) if stripes.isdigit() else 1,
+                    "stripe_size_in_kb": float(stripe_size) if stripe_size else 0.0,
+                    "size_in_gb": float(segment_size) / 1024 / 1024 if segment_size else 0.0,
+                    "physical_volumes": physical_volumes
+                })
+        return segments
+
+    def prewarm(self, ranges, workers=8):
+        """reads [offset, length] byte ranges into the page cache, returns the bytes read"""
+        return page_cache.prewarm(self._device_path, ranges, workers)
+
+    def get_resident_ranges(self, ranges=None, merge_gap=page_cache.MERGE_GAP):
+        return page_cache.get_resident_ranges(self._device_path, ranges, merge_gap)
+
+    def get_resident_bytes(self, ranges=None):
+        return page_cache.get_resident_bytes(self._device_path, ranges)
+
+    def attach_cache(self, cache_pool_name, mode="writethrough"):
+        output = Helper.execute(["lvconvert", "--yes", "--type", "cache", "--cachemode", mode,
+                                 "--cachepool", self._get_volume_group_name()+"/"+cache_pool_name, self._device_path])
+        if output and "is now cached" in output:
+            return True
+        return False
+
+    def detach_cache(self):
+        """drops the cache, flushing dirty blocks first; the cache pool is removed along with it"""
+        output = Helper.execute(["lvconvert", "--yes", "--uncache", self._device_path])
+        if output and "not cached" in output:
+            return True
+        return False
+
+    def get_cache_status(self):
+        columns = ["cache_mode", "cache_read_hits", "cache_read_misses", "cache_write_hits", "cache_write_misses",
+                   "cache_dirty_blocks", "cache_used_blocks", "cache_total_blocks"]
+        output = Helper.execute(["lvs", "--noheadings", "--separator", "|", "-o", ",".join(columns), self._device_path])
+        if not output or not output.strip():
+            return None
+        values = [value.strip() for value in output.strip().split("|")]
+        if len(values) != len(columns) or not values[0]:
+            return None
+        status = dict(zip(columns[1:], [int(value) if value.isdigit() else 0 for value in values[1:]]))
+        status["cache_mode"] = values[0]
+        reads = status["cache_read_hits"] + status["cache_read_misses"]
+        writes = status["cache_write_hits"] + status["cache_write_misses"]
+        status["read_hit_ratio"] = status["cache_read_hits"] / reads if reads else None
+        status["write_hit_ratio"] = status["cache_write_hits"] / writes if writes else None
+        return status
+
     def dump_to_image(self, destination_path):
         return Helper.execute_dd(self.get_path(), destination_path)
 
@@ -415,16 +572,17 @@ class LogicalVolume(Disk):
 
     def remove_snapshot(self, snap_name):
         if snap_name:
-            output = Helper.execute(["lvremove", "--force", self.get_volume_group().get_name()+'/'+snap_name])
+            output = Helper.execute(["lvremove", "--force", self._get_volume_group_name()+'/'+snap_name])
             if output and 'Logical volume "' + snap_name + '" successfully removed' in output:
                 return True
         return False
 
-    def revert_to_snapshot(self, snap_name):
-        snaps = self.get_snapshots(snap_name)
-        if not snaps:
-            return False
-        (size, unit) = snaps[0].get_size()
+    def revert_to_snapshot(self, snap_name, size=None, unit="GiB"):
+        if size is None:
+            snaps = self.get_snapshots(snap_name)
+            if not snaps:
+                return False
+            (size, unit) = snaps[0].get_size()
         if self.remove_snapshot(snap_name):
             if self.create_snapshot(snap_name, size, unit):
                 return True
@@ -465,7 +623,7 @@ class Snapshot(LogicalVolume):
     def remove_snapshot(self, snap_name):
         raise Exception("Not applicable since snapshot(s) of snapshot is not supported.")
 
-    def revert_to_snapshot(self, snap_name):
+    def revert_to_snapshot(self, snap_name, size=None, unit="GiB"):
         raise Exception("Not applicable since snapshot(s) of snapshot is not supported.")
 
     def rename_snapshot(self, snap_name, new_snap_name):
@@ -1,5 +1,10 @@
 import subprocess
 import re
+from helpers import listeners
+
+# commands that change LVM metadata, as opposed to the reporting ones (lvs, lvdisplay, vgs, ...)
+MUTATING_COMMANDS = {"pvcreate", "pvremove", "vgcreate", "vgremove", "vgextend", "vgreduce", "lvcreate", "lvremove",
+                     "lvrename", "lvextend", "lvresize", "lvreduce", "lvconvert", "lvchange"}
 
 
 class Helper(object):
@@ -88,6 +93,8 @@ class Helper(object):
             return None
         try:
             output = subprocess.check_output(argument_list)
+            if argument_list[0] in MUTATING_COMMANDS:
+                listeners.notify("lvm2", argument_list[0])
             if output:
                 return output.decode("utf-8")
         except Exception as e:
@@ -0,0 +1,64 @@
+import asyncio
+import shutil
+
+
+async def _tcp_alive(address, port, timeout):
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except ConnectionRefusedError:
+        return True  # a reset comes from a running network stack
+    except (asyncio.TimeoutError, OSError):
+        return False
+    writer.close()
+    return True
+
+
+async def _ping_alive(ping, address, timeout):
+    try:
+        process = await asyncio.create_subprocess_exec(ping, "-c", "1", "-W", str(max(1, int(round(timeout)))),
+                                                       address, stdout=asyncio.subprocess.DEVNULL,
+                                                       stderr=asyncio.subprocess.DEVNULL)
+    except OSError:
+        return False
+    try:
+        return await process.wait() == 0
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+
+
+async def _probe(address, ports, timeout, ping, semaphore):
+    async with semaphore:
+        checks = [asyncio.ensure_future(_tcp_alive(address, port, timeout)) for port in ports]
+        if ping:
+            checks.append(asyncio.ensure_future(_ping_alive(ping, address, timeout)))
+        try:
+            for check in asyncio.as_completed(checks):
+                if await check:
+                    return True
+            return False
+        finally:
+            for check in checks:
+                check.cancel()
+            await asyncio.gather(*checks, return_exceptions=True)
+
+
+async def _probe_all(addresses, ports, timeout, ping, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*[_probe(address, ports, timeout, ping, semaphore) for address in addresses])
+    return dict(zip(addresses, results))
+
+
+def probe_addresses(addresses, ports=(22,), timeout=1.0, icmp=True, concurrency=256):
+    """whether each address answers a TCP connect (accepted or refused) on any of the ports or, when icmp is set and
+    a ping binary is around (raw sockets need privileges it has), an echo request; as {address: bool}"""
+    addresses = list(addresses)
+    if not addresses:
+        return {}
+    ping = shutil.which("ping") if icmp else None
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_probe_all(addresses, list(ports), timeout, ping, concurrency))
+    finally:
+        loop.close()
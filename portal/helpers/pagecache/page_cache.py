@@ -0,0 +1,108 @@
+import ctypes
+import ctypes.util
+import mmap
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+PAGE_SIZE = mmap.PAGESIZE
+READ_SIZE = 4 * 1024 * 1024  # bytes per pread, a few of them in flight keep every spindle busy
+MAP_SIZE = 1024 * 1024 * 1024  # residency is checked one window of this size at a time
+MERGE_GAP = 1024 * 1024  # resident ranges closer than this are merged into one
+
+_RESIDENT = bytes.maketrans(bytes(range(256)), bytes(value & 1 for value in range(256)))
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                              ctypes.c_long]
+        libc.mmap.restype = ctypes.c_void_p
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+        _libc = libc
+    return _libc
+
+
+def get_size(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+
+
+def _clip(ranges, size):
+    """[offset, length] ranges limited to the device & aligned to pages"""
+    clipped = []
+    for offset, length in ranges:
+        start = max(0, int(offset)) // PAGE_SIZE * PAGE_SIZE
+        end = min(size, int(offset) + int(length))
+        if end > start:
+            clipped.append((start, end - start))
+    return clipped
+
+
+def prewarm(path, ranges, workers=8):
+    """brings byte ranges of a file or block device into the page cache; WILLNEED queues readahead of every range
+    and preads from a pool of threads keep several requests in flight; returns the bytes read"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        ranges = _clip(ranges, os.lseek(fd, 0, os.SEEK_END))
+        for offset, length in ranges:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+        reads = [(chunk, min(READ_SIZE, offset + length - chunk))
+                 for offset, length in ranges for chunk in range(offset, offset + length, READ_SIZE)]
+
+        def read(chunk):
+            return len(os.pread(fd, chunk[1], chunk[0]))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return sum(executor.map(read, reads))
+    finally:
+        os.close(fd)
+
+
+def _resident_pages(fd, offset, length):
+    """mincore() vector of a window, one byte per page with bit 0 set when the page is cached"""
+    libc = _get_libc()
+    address = libc.mmap(None, length, mmap.PROT_READ, mmap.MAP_SHARED, fd, offset)
+    if address is None or address == ctypes.c_void_p(-1).value:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    try:
+        vector = (ctypes.c_ubyte * ((length + PAGE_SIZE - 1) // PAGE_SIZE))()
+        if libc.mincore(address, length, vector) != 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        return vector
+    finally:
+        libc.munmap(address, length)
+
+
+def get_resident_ranges(path, ranges=None, merge_gap=MERGE_GAP):
+    """[offset, length] ranges of the file or block device (or of the given ranges) held in the page cache"""
+    fd = os.open(path, os.O_RDONLY)
+    resident = []
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+        for offset, length in _clip(ranges if ranges is not None else [(0, size)], size):
+            for window in range(offset, offset + length, MAP_SIZE):
+                window_length = min(MAP_SIZE, offset + length - window)
+                pages = bytes(_resident_pages(fd, window, window_length)).translate(_RESIDENT)
+                for run in re.finditer(b"\x01+", pages):
+                    start = window + run.start() * PAGE_SIZE
+                    end = min(window + run.end() * PAGE_SIZE, offset + length)
+                    if resident and start - (resident[-1][0] + resident[-1][1]) <= merge_gap:
+                        resident[-1][1] = end - resident[-1][0]
+                    else:
+                        resident.append([start, end - start])
+    finally:
+        os.close(fd)
+    return resident
+
+
+def get_resident_bytes(path, ranges=None):
+    return sum(length for _, length in get_resident_ranges(path, ranges, merge_gap=0))
@@ -0,0 +1,163 @@
+import base64
+import http.client
+import json
+import queue
+import subprocess
+import time
+
+
+class PowerException(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """keep-alive HTTP connections to one PDU, at most `size` of them so its embedded web server isn't swamped"""
+
+    def __init__(self, host, port, size=4, timeout=10):
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = queue.Queue()
+        for _ in range(size):
+            self._slots.put(None)
+
+    def request(self, method, path, body=None, headers=None):
+        """returns (status, body), retrying once on a fresh connection when an idle one was dropped by the PDU"""
+        self._slots.get()
+        try:
+            for attempt in (1, 2):
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    connection = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+                try:
+                    connection.request(method, path, body=body, headers=headers or {})
+                    response = connection.getresponse()
+                    payload = response.read()
+                    self._idle.put(connection)
+                    return response.status, payload
+                except (http.client.HTTPException, OSError) as e:
+                    connection.close()
+                    if attempt == 2:
+                        raise PowerException("%s:%s %s" % (self._host, self._port, e))
+        finally:
+            self._slots.put(None)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class PDUDriver(object):
+    """switches the outlets of a PDU; outlets are numbered from 1"""
+
+    def __init__(self, host, port=None, username=None, password=None):
+        self._host = host
+        self._port = port
+        self._username = username
+        self._password = password
+
+    def power_on(self, outlet):
+        raise NotImplementedError
+
+    def power_off(self, outlet):
+        raise NotImplementedError
+
+    def get_state(self, outlet):
+        """True when the outlet is powered, False when off"""
+        raise NotImplementedError
+
+    def power_cycle(self, outlet, off_seconds=5):
+        if not self.power_off(outlet):
+            return False
+        time.sleep(off_seconds)
+        return self.power_on(outlet)
+
+    def close(self):
+        pass
+
+
+class HTTPDriver(PDUDriver):
+    """JSON over HTTP: GET /outlets/<n> returns {"state": "on"|"off"}, PUT /outlets/<n> with {"state": ...} switches"""
+
+    def __init__(self, host, port=None, username=None, password=None, pool_size=4):
+        super().__init__(host, port or 80, username, password)
+        self._pool = ConnectionPool(host, self._port, pool_size)
+        self._headers = {"Content-Type": "application/json"}
+        if username:
+            credentials = ("%s:%s" % (username, password or "")).encode("utf-8")
+            self._headers["Authorization"] = "Basic " + base64.b64encode(credentials).decode("ascii")
+
+    def _set_state(self, outlet, state):
+        status, _ = self._pool.request("PUT", "/outlets/%d" % outlet, json.dumps({"state": state}).encode("utf-8"),
+                                       self._headers)
+        return status == 200
+
+    def power_on(self, outlet):
+        return self._set_state(outlet, "on")
+
+    def power_off(self, outlet):
+        return self._set_state(outlet, "off")
+
+    def get_state(self, outlet):
+        status, body = self._pool.request("GET", "/outlets/%d" % outlet, headers=self._headers)
+        if status != 200:
+            raise PowerException("%s replied with status %d" % (self._host, status))
+        return json.loads(body.decode("utf-8")).get("state") == "on"
+
+    def close(self):
+        self._pool.close()
+
+
+class SNMPDriver(PDUDriver):
+    """SNMP v2c through net-snmp's snmpset/snmpget, the password being the write community; OIDs & values default
+    to APC's PowerNet-MIB sPDUOutletCtl (1 on, 2 off)"""
+
+    OUTLET_CONTROL_OID = ".1.3.6.1.4.1.318.1.1.4.4.2.1.3"
+    ON = "1"
+    OFF = "2"
+
+    def __init__(self, host, port=None, username=None, password=None, timeout=5):
+        super().__init__(host, port or 161, username, password or "private")
+        self._timeout = timeout
+
+    def _agent(self):
+        return "%s:%d" % (self._host, self._port)
+
+    def _run(self, command):
+        try:
+            return subprocess.check_output(command, timeout=self._timeout * 2).decode("utf-8")
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            raise PowerException(str(e))
+
+    def _set_state(self, outlet, value):
+        output = self._run(["snmpset", "-v2c", "-c", self._password, "-t", str(self._timeout), "-Oqv",
+                            self._agent(), "%s.%d" % (self.OUTLET_CONTROL_OID, outlet), "i", value])
+        return output.strip().split(" ")[-1] in (value, "outletOn" if value == self.ON else "outletOff")
+
+    def power_on(self, outlet):
+        return self._set_state(outlet, self.ON)
+
+    def power_off(self, outlet):
+        return self._set_state(outlet, self.OFF)
+
+    def get_state(self, outlet):
+        output = self._run(["snmpget", "-v2c", "-c", self._password, "-t", str(self._timeout), "-Oqv",
+                            self._agent(), "%s.%d" % (self.OUTLET_CONTROL_OID, outlet)])
+        return output.strip() in (self.ON, "outletOn")
+
+
+DRIVERS = {
+    "http": HTTPDriver,
+    "snmp": SNMPDriver,
+}
+
+
+def get_driver(name, host, port=None, username=None, password=None):
+    if name not in DRIVERS:
+        raise PowerException("No PDU driver named '%s'" % name)
+    return DRIVERS[name](host, port, username, password)
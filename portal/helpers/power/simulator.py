@@ -0,0 +1,84 @@
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class SimulatedPDU(object):
+    """outlet states of a fake PDU speaking the HTTPDriver protocol, with a log of when each outlet was switched"""
+
+    def __init__(self, outlets=24, latency=0.0):
+        self.outlets = outlets
+        self.latency = latency
+        self.states = dict((outlet, "off") for outlet in range(1, outlets + 1))
+        self.events = []  # (monotonic time, outlet, state)
+        self.lock = threading.Lock()
+
+    def switch(self, outlet, state):
+        time.sleep(self.latency)
+        with self.lock:
+            self.states[outlet] = state
+            self.events.append((time.monotonic(), outlet, state))
+
+
+def make_handler(pdu):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, as real PDUs & the driver's connection pool do
+
+        def _reply(self, status, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _outlet(self):
+            match = re.match(r"^/outlets/(\d+)$", self.path)
+            if match and int(match.group(1)) in pdu.states:
+                return int(match.group(1))
+            return None
+
+        def do_GET(self):
+            outlet = self._outlet()
+            if outlet is None:
+                return self._reply(404, {"error": "No such outlet"})
+            self._reply(200, {"outlet": outlet, "state": pdu.states[outlet]})
+
+        def do_PUT(self):
+            outlet = self._outlet()
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if outlet is None:
+                return self._reply(404, {"error": "No such outlet"})
+            if data.get("state") not in ("on", "off"):
+                return self._reply(400, {"error": "'state' must be 'on' or 'off'"})
+            pdu.switch(outlet, data["state"])
+            self._reply(200, {"outlet": outlet, "state": pdu.states[outlet]})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8080, outlets=24, latency=0.0):
+    """starts a simulator in a background thread, returns (server, SimulatedPDU)"""
+    pdu = SimulatedPDU(outlets, latency)
+    server = ThreadingHTTPServer((host, port), make_handler(pdu))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, pdu
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated PDU for testing the HTTP power driver")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--outlets", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds each switch takes")
+    arguments = parser.parse_args()
+    server = ThreadingHTTPServer((arguments.host, arguments.port),
+                                 make_handler(SimulatedPDU(arguments.outlets, arguments.latency)))
+    server.serve_forever()
@@ -0,0 +1,46 @@
+import asyncio
+import re
+import socket
+import time
+
+
+def magic_packet(mac_address):
+    digits = re.sub(r"[^0-9a-fA-F]", "", mac_address)
+    if len(digits) != 12:
+        raise ValueError("Invalid MAC address '%s'" % mac_address)
+    return b"\xff" * 6 + bytes.fromhex(digits) * 16
+
+
+async def _send(mac_addresses, rate, broadcast_address, port, repeat):
+    loop = asyncio.get_event_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, sock=sock)
+    interval = 1.0 / rate if rate and rate > 0 else 0.0
+    started = loop.time()
+    sent = {}
+    try:
+        for index, mac_address in enumerate(mac_addresses):
+            delay = started + index * interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                packet = magic_packet(mac_address)
+            except ValueError as e:
+                print(str(e))
+                continue
+            for _ in range(repeat):  # WoL is fire & forget over UDP, a few copies survive a lossy switch
+                transport.sendto(packet, (broadcast_address, port))
+            sent[mac_address] = time.time()
+    finally:
+        transport.close()
+    return sent
+
+
+def send_wake_packets(mac_addresses, rate=None, broadcast_address="255.255.255.255", port=9, repeat=3):
+    """sends magic packets paced to `rate` machines per second; returns {mac address: time sent}"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_send(list(mac_addresses), rate, broadcast_address, port, repeat))
+    finally:
+        loop.close()
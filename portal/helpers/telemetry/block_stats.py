@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from array import array
+
+SECTOR_SIZE = 512
+
+# fields kept per sample: time, reads completed, sectors read, ms reading, writes completed, sectors written, ms writing
+FIELDS = 7
+_STAT_COLUMNS = (0, 2, 3, 4, 6, 7)  # positions of the counters above in /sys/block/<dev>/stat
+
+
+def get_stat_path(device_path):
+    """/sys/block/dm-N/stat of a device path such as /dev/vg0/lv0, partitions resolve via /sys/class/block"""
+    name = os.path.basename(os.path.realpath(device_path))
+    return os.path.join("/sys/class/block", name, "stat")
+
+
+def read_counters(fd):
+    values = os.pread(fd, 512, 0).split()
+    return [int(values[column]) for column in _STAT_COLUMNS]
+
+
+class RingBuffer(object):
+    """fixed size buffer of samples, each FIELDS doubles, stored flat in one array"""
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._values = array("d", bytes(8 * FIELDS * capacity))
+        self._count = 0
+        self._next = 0
+
+    def append(self, sample):
+        offset = self._next * FIELDS
+        self._values[offset:offset + FIELDS] = array("d", sample)
+        self._next = (self._next + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def __len__(self):
+        return self._count
+
+    def get(self, back=0):
+        """the sample taken `back` samples before the latest one"""
+        if back >= self._count:
+            return None
+        offset = ((self._next - 1 - back) % self._capacity) * FIELDS
+        return self._values[offset:offset + FIELDS]
+
+
+class BlockDeviceSampler(threading.Thread):
+    """samples sysfs I/O counters of many block devices at a fixed interval, keeping a ring buffer per device.
+
+    device_source() returns {key: device path} and is re-read every refresh_interval seconds.
+    """
+
+    def __init__(self, device_source, interval=1.0, capacity=300, refresh_interval=60.0):
+        super().__init__(daemon=True)
+        self._device_source = device_source
+        self._interval = interval
+        self._capacity = capacity
+        self._refresh_interval = refresh_interval
+        self._devices = {}  # key: (stat path, fd, ring buffer)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def get_interval(self):
+        return self._interval
+
+    def refresh(self):
+        try:
+            wanted = dict((key, get_stat_path(path)) for key, path in self._device_source().items())
+        except Exception as e:
+            print(str(e))
+            return
+        with self._lock:
+            for key in list(self._devices):
+                if wanted.get(key) != self._devices[key][0]:
+                    os.close(self._devices.pop(key)[1])
+            for key, stat_path in wanted.items():
+                if key not in self._devices:
+                    try:
+                        self._devices[key] = (stat_path, os.open(stat_path, os.O_RDONLY),
+                                              RingBuffer(self._capacity))
+                    except OSError:
+                        pass  # device not active (yet)
+
+    def sample(self):
+        now = time.monotonic()
+        with self._lock:
+            for key, (stat_path, fd, ring) in self._devices.items():
+                try:
+                    counters = read_counters(fd)
+                except (OSError, ValueError, IndexError):
+                    continue
+                ring.append([now] + counters)
+
+    def run(self):
+        next_refresh = 0
+        next_sample = time.monotonic()
+        while not self._stopped.is_set():
+            if time.monotonic() >= next_refresh:
+                self.refresh()
+                next_refresh = time.monotonic() + self._refresh_interval
+            self.sample()
+            next_sample += self._interval
+            self._stopped.wait(max(0.0, next_sample - time.monotonic()))
+
+    def stop(self):
+        self._stopped.set()
+
+    def keys(self):
+        with self._lock:
+            return list(self._devices)
+
+    def rates(self, key, window=10.0):
+        """IOPS, bytes per second & average latency in ms over the last `window` seconds, None without data"""
+        with self._lock:
+            device = self._devices.get(key)
+            if not device or len(device[2]) < 2:
+                return None
+            ring = device[2]
+            latest = ring.get(0)
+            back = min(len(ring) - 1, max(1, int(round(window / self._interval))))
+            earliest = ring.get(back)
+        elapsed = latest[0] - earliest[0]
+        if elapsed <= 0:
+            return None
+        (reads, read_sectors, read_ms, writes, write_sectors, write_ms) = [
+            latest[field] - earliest[field] for field in range(1, FIELDS)]
+        return {
+            "seconds": round(elapsed, 3),
+            "read_iops": reads / elapsed,
+            "write_iops": writes / elapsed,
+            "read_bytes_per_second": read_sectors * SECTOR_SIZE / elapsed,
+            "write_bytes_per_second": write_sectors * SECTOR_SIZE / elapsed,
+            "read_latency_ms": read_ms / reads if reads else 0.0,
+            "write_latency_ms": write_ms / writes if writes else 0.0,
+        }
@@ -1,17 +1,25 @@
 import subprocess
 import re
+from concurrent.futures import ThreadPoolExecutor
+from helpers import listeners
+
+MAX_WORKERS = 16
 
 
 class ISCSITarget(object):
     """a wrapper for tgtadm tool"""
 
+    # caching mode page (0x08) with WCE cleared, what tgt-admin sets for "write-cache off"
+    WRITE_CACHE_OFF_MODE_PAGE = "8:0:18:0x10:0:0xff:0xff:0:0:0xff:0xff:0xff:0xff:0x80:0x14:0:0:0:0:0:0"
+
     @staticmethod
     def get_iscsi_qualified_name(name):
         return "%s:%s" % (r"iqn.2018-01.com.nls90.iscsitarget", name)
 
-    def __init__(self, tid, tname):
+    def __init__(self, tid, tname, control_port=None):
         self._id = str(tid)
         self._name = self.get_iscsi_qualified_name(tname)
+        self._control_port = control_port
 
     def get_id(self):
         return self._id
@@ -25,12 +33,34 @@ class ISCSITarget(object):
     def set_name(self, name):
         self._name = self.get_iscsi_qualified_name(name)
 
+    def get_control_port(self):
+        return self._control_port
+
     @staticmethod
-    def _execute(args, mode="target"):
+    def run_batch(calls, max_workers=MAX_WORKERS):
+        """runs (key, function, args) calls concurrently on a bounded pool, returns {key: result} per item"""
+        results = {}
+        if not calls:
+            return results
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calls)))) as executor:
+            futures = [(key, executor.submit(function, *args)) for key, function, args in calls]
+            for key, future in futures:
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    print(str(e))
+                    results[key] = False
+        return results
+
+    def _execute(self, args, mode="target"):
         arguments = ["tgtadm", "--lld", "iscsi", "--mode", mode]
+        if self._control_port is not None:
+            arguments.extend(["--control-port", str(self._control_port)])
         arguments.extend(args)
         try:
             output = subprocess.check_output(arguments, stderr=subprocess.STDOUT)
+            if "--op" in args and args[args.index("--op") + 1] != "show":
+                listeners.notify("tgtadm", args[args.index("--op") + 1])
             if output:
                 output = output.decode("utf-8")
             if output:
@@ -105,14 +135,27 @@ class ISCSITarget(object):
             return False
         return True
 
-    def attach_logical_unit(self, block_device_path, lun):
-        output = self._execute(
-            ["--op", "new", "--tid", self._id, "--lun", str(lun), "--backing-store", block_device_path], "logicalunit"
-        )
+    def attach_logical_unit(self, block_device_path, lun, bstype=None, bsoflags=None):
+        args = ["--op", "new", "--tid", self._id, "--lun", str(lun), "--backing-store", block_device_path]
+        if bstype:
+            args.extend(["--bstype", bstype])
+        if bsoflags:
+            args.extend(["--bsoflags", bsoflags])
+        output = self._execute(args, "logicalunit")
         if output:
             return False
         return True
 
+    def tune_logical_unit(self, lun, readonly=False, write_cache=True):
+        params = {}
+        if readonly:
+            params["readonly"] = 1
+        if not write_cache:
+            params["mode_page"] = self.WRITE_CACHE_OFF_MODE_PAGE
+        if not params:
+            return True
+        return self.update_logical_unit_params(lun, **params)
+
     def update_logical_unit_params(self, lun, **kwargs):
         if not kwargs:
             return False
@@ -136,11 +179,46 @@ class ISCSITarget(object):
             return False
         return True
 
-    def detach_all_logical_units(self):
-        active_logical_units = self.list_active_logical_units()
-        if active_logical_units:
-            for active_logical_unit_path in active_logical_units:
-                self.detach_logical_unit(active_logical_units[active_logical_unit_path])
+    def detach_logical_units(self, luns, max_workers=MAX_WORKERS):
+        return self.run_batch([(str(lun), self.detach_logical_unit, (lun,)) for lun in luns], max_workers)
+
+    def detach_all_logical_units(self, max_workers=MAX_WORKERS):
+        return self.detach_logical_units(list(self.list_active_logical_units()), max_workers)
+
+    def count_sessions(self):
+        """number of I_T nexuses (sessions) of every target of this tgtd from a single show, as {tid: count}"""
+        sessions = {}
+        output = self._execute(["--op", "show"])
+        if output:
+            target_id = None
+            for line in output.split("\n"):
+                line = line.strip()
+                matched = re.match(r"^Target (\d+): ", line)
+                if matched:
+                    target_id = matched.group(1)
+                    sessions[target_id] = 0
+                    continue
+                if target_id and re.match(r"^I_T nexus: \d+", line):
+                    sessions[target_id] += 1
+        return sessions
+
+    def list_session_addresses(self):
+        """initiator IP addresses logged in to every target of this tgtd from a single show, as {tid: [address]}"""
+        addresses = {}
+        output = self._execute(["--op", "show"])
+        if output:
+            target_id = None
+            for line in output.split("\n"):
+                line = line.strip()
+                matched = re.match(r"^Target (\d+): ", line)
+                if matched:
+                    target_id = matched.group(1)
+                    addresses[target_id] = []
+                    continue
+                matched = re.match(r"^IP Address: ([0-9a-fA-F.:]+)", line)
+                if target_id and matched and matched.group(1) not in addresses[target_id]:
+                    addresses[target_id].append(matched.group(1))
+        return addresses
 
     def list_connections(self, initiator=None):
         connections = {}
@@ -182,15 +260,18 @@ class ISCSITarget(object):
             return False
         return True
 
-    def _close_connections(self, connections):
-        if not connections:
-            return True
-        closed = []
-        for ip_address in connections:
+    def close_connections(self, connections, max_workers=MAX_WORKERS):
+        """closes connections as listed by list_connections, returns {(ip, session id, connection id): closed}"""
+        calls = []
+        for ip_address in connections or {}:
             for session_id in connections[ip_address]:
                 for connection_id in connections[ip_address][session_id]:
-                    closed.append(self.close_connection(session_id, connection_id))
-        return all(closed)
+                    calls.append(((ip_address, session_id, connection_id), self.close_connection,
+                                  (session_id, connection_id)))
+        return self.run_batch(calls, max_workers)
+
+    def _close_connections(self, connections):
+        return all(self.close_connections(connections).values())
 
     def close_initiator_connections(self, initiator):
         return self._close_connections(self.list_connections(initiator))
@@ -198,6 +279,25 @@ class ISCSITarget(object):
     def close_all_connections(self):
         return self._close_connections(self.list_connections())
 
+    @classmethod
+    def close_all_connections_of(cls, iscsi_targets, max_workers=MAX_WORKERS):
+        """closes every connection of many targets at once, returns {target id: {connection: closed}}"""
+        listed = cls.run_batch([(iscsi_target.get_id(), iscsi_target.list_connections, ())
+                                for iscsi_target in iscsi_targets], max_workers)
+        calls = []
+        for iscsi_target in iscsi_targets:
+            connections = listed.get(iscsi_target.get_id()) or {}
+            for ip_address in connections:
+                for session_id in connections[ip_address]:
+                    for connection_id in connections[ip_address][session_id]:
+                        calls.append(((iscsi_target.get_id(), ip_address, session_id, connection_id),
+                                      iscsi_target.close_connection, (session_id, connection_id)))
+        closed = cls.run_batch(calls, max_workers)
+        results = dict((iscsi_target.get_id(), {}) for iscsi_target in iscsi_targets)
+        for (target_id, ip_address, session_id, connection_id), result in closed.items():
+            results[target_id][(ip_address, session_id, connection_id)] = result
+        return results
+
     def _bind_or_unbind(self, operation, initiator=None, by="address"):
         if by not in ("address", "name"):
             by = "name"
@@ -0,0 +1,44 @@
+import subprocess
+
+
+class TGTDaemon(object):
+    """a tgtd instance, identified by its control port and serving iSCSI on its own portal address"""
+
+    def __init__(self, control_port, portal=None):
+        self._control_port = int(control_port)
+        self._portal = portal
+
+    def get_control_port(self):
+        return self._control_port
+
+    def get_portal(self):
+        return self._portal
+
+    def is_running(self):
+        try:
+            subprocess.check_output(["tgtadm", "--lld", "iscsi", "--mode", "sys", "--op", "show",
+                                     "--control-port", str(self._control_port)], stderr=subprocess.STDOUT)
+            return True
+        except (subprocess.CalledProcessError, OSError):
+            return False
+
+    def start(self):
+        if self.is_running():
+            return True
+        arguments = ["tgtd", "--control-port", str(self._control_port)]
+        if self._portal:
+            arguments.extend(["--iscsi", "portal=" + self._portal])
+        try:
+            subprocess.check_output(arguments, stderr=subprocess.STDOUT)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(str(e))
+            return False
+        return True
+
+    def stop(self):
+        try:
+            subprocess.check_output(["tgtadm", "--lld", "iscsi", "--mode", "sys", "--op", "delete",
+                                     "--control-port", str(self._control_port)], stderr=subprocess.STDOUT)
+            return True
+        except (subprocess.CalledProcessError, OSError):
+            return False
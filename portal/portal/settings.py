@@ -120,3 +120,237 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Resource locking
+# Seconds to wait for a target/logical unit lock and seconds after which a lock is considered stale; held locks are
+# renewed while their process lives, so only locks of crashed processes go stale
+
+LOCK_TIMEOUT = 30
+
+LOCK_LEASE = 600
+
+
+# iSCSI
+# Address initiators use to reach the iSCSI portal, defaults to the host the boot request was sent to
+
+ISCSI_PORTAL_ADDRESS = None
+
+# tgtd instances targets are spread over; each needs its own control port & portal listen address.
+# "portals" optionally lists the addresses (one per NIC) initiators are balanced over by session count
+
+TGTD_SHARDS = [
+    {"control_port": 0, "portal": "0.0.0.0:3260", "portals": []},
+]
+
+# seconds a target handed a portal counts as loading it before its initiator logs in
+
+PORTAL_PENDING_SECONDS = 60
+
+
+# Storage nodes
+# Shared secret sent to storage node agents (which refuse to run without one unless --insecure), seconds their
+# collected stats are reused for & weights of the placement scheduler for new logical units
+
+STORAGE_AGENT_TOKEN = None
+
+NODE_STATS_CACHE_SECONDS = 5
+
+PLACEMENT_INCLUDE_LOCAL = True
+
+LOCAL_NIC_SPEED_MBPS = 1000
+
+PLACEMENT_LUN_WEIGHT = 1.0
+
+PLACEMENT_NIC_WEIGHT = 10.0
+
+
+# Logical unit tuning profiles, applied by tgtd when a logical unit is attached to its target; compare them on the
+# storage at hand with manage.py benchmark_tuning_profiles <scratch device>
+
+TUNING_PROFILES = {
+    "default": {},
+    # read-mostly golden disks: buffered reads so every initiator shares the page cache
+    "golden": {"bstype": "rdwr", "readonly": True},
+    # write-heavy build disks: asynchronous direct I/O bypassing the page cache
+    "build": {"bstype": "aio", "bsoflags": "direct", "write_cache": True},
+    # disposable scratch disks: buffered, write cache on, nothing forced to disk
+    "scratch": {"bstype": "rdwr", "write_cache": True},
+    # disks that must survive a server crash: synchronous writes & write cache reported off
+    "durable": {"bstype": "rdwr", "bsoflags": "sync", "write_cache": False},
+}
+
+
+# Snapshot monitoring
+# a snapshot is extended once its COW fill passes the threshold or is expected to fill within the horizon
+
+SNAPSHOT_EXTEND_THRESHOLD_PERCENT = 80.0
+
+SNAPSHOT_EXTEND_HORIZON_HOURS = 0.5
+
+SNAPSHOT_EXTEND_MIN_GB = 1.0
+
+SNAPSHOT_DEFAULT_SIZE_GB = 5.0
+
+SNAPSHOT_SIZE_HEADROOM = 1.25
+
+
+# Fleet operations (revert/snapshot a whole lab in one call)
+
+FLEET_MAX_WORKERS = 32
+
+FLEET_VOLUME_GROUP_CONCURRENCY = 4
+
+
+# Warm pool of pre-created logical volumes, per volume group: {size in GiB: number of volumes kept ready}
+
+WARM_POOL = {}
+
+
+# I/O telemetry of logical units sampled from /sys/block/dm-*/stat
+
+IO_TELEMETRY_ENABLED = False
+
+IO_TELEMETRY_INTERVAL = 1.0
+
+IO_TELEMETRY_CAPACITY = 120
+
+IO_TELEMETRY_REFRESH_INTERVAL = 60.0
+
+IO_TELEMETRY_METRICS_WINDOW = 10
+
+
+# SSD cache tier: fast physical volume (already part of the volume group) holding cache pools, per volume group
+
+CACHE_PHYSICAL_VOLUMES = {}
+
+CACHE_DEFAULT_SIZE_GB = 10.0
+
+
+# Logical volume placement over physical volumes: linear (left to lvm2), pinned (least loaded PV) or striped
+
+LV_DEFAULT_PLACEMENT = "linear"
+
+LV_DEFAULT_STRIPES = 2
+
+PLACEMENT_IO_COST_BYTES = 64 * 1024
+
+
+# Page cache prewarming: region read when no hot region was recorded after a boot & reader threads per device
+
+PREWARM_DEFAULT_GB = 2.0
+
+PREWARM_WORKERS = 8
+
+
+# Boot admission: machines powered on or woken per second across the lab (match what the boot portal & storage
+# can take)
+
+BOOTS_PER_SECOND = 2.0
+
+
+# PDU power control: requests in flight per PDU and how long outlets stay off in a power cycle
+
+POWER_PDU_CONCURRENCY = 4
+
+POWER_CYCLE_OFF_SECONDS = 5
+
+POWER_MAX_WORKERS = 64
+
+
+# Wake-on-LAN: where magic packets go, how long a woken machine may take to ask for its boot disk and how many
+# times stragglers are woken again
+
+WOL_BROADCAST_ADDRESS = "255.255.255.255"
+
+WOL_PORT = 9
+
+WOL_BOOT_DEADLINE_SECONDS = 120
+
+WOL_RETRIES = 2
+
+WOL_POLL_INTERVAL = 2.0
+
+
+# Initiator liveness: TCP ports probed (a refused connection counts as alive too), whether to ping as well and
+# how long an initiator may stay silent before its busy or mounted logical units are released
+
+LIVENESS_PORTS = [22, 135, 445, 3389]
+
+LIVENESS_ICMP = True
+
+LIVENESS_TIMEOUT = 2.0
+
+LIVENESS_CONCURRENCY = 512
+
+LIVENESS_GRACE_SECONDS = 300
+
+
+# Server-sent change events: events kept for resuming, how long a stream lasts before the client reconnects and
+# how often other worker processes' events are looked for. Every stream holds a WSGI worker thread & a database
+# connection while open, so each worker process serves at most EVENTS_MAX_CLIENTS of them (refusing more with 503);
+# keep it well below the threads of a process so API requests still get one
+
+EVENTS_RETENTION = 100000
+
+EVENTS_STREAM_SECONDS = 300
+
+EVENTS_RETRY_SECONDS = 1.0
+
+EVENTS_KEEPALIVE_SECONDS = 15
+
+EVENTS_POLL_INTERVAL = 0.5
+
+EVENTS_BATCH_SIZE = 500
+
+EVENTS_MAX_CLIENTS = 8
+
+
+# Rendered responses of read endpoints, keyed by ETag so every worker process can keep its own copy
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "portal-responses",
+    }
+}
+
+RESPONSE_CACHE_SECONDS = 300
+
+
+# Image streaming: COW size in GiB of the temporary snapshot a download reads from (None sizes it like any new
+# snapshot) and the piece size images are read & sent in when the server cannot sendfile()
+
+DOWNLOAD_SNAPSHOT_SIZE_GB = None
+
+IMAGE_STREAM_BLOCK_SIZE = 1024 * 1024
+
+# Uploads: blocks (of IMAGE_STREAM_BLOCK_SIZE) buffered between the request and the disk, and how often written data
+# is synced & recorded as the offset an interrupted upload resumes from
+
+UPLOAD_QUEUE_BLOCKS = 16
+
+UPLOAD_SYNC_BYTES = 256 * 1024 * 1024
+
+# Image repository: where deduplicated images are kept, the chunk size they are cut in (shared content is only found
+# at chunk aligned offsets, so smaller chunks dedupe better but mean more files) and threads hashing/writing chunks
+
+IMAGE_REPOSITORY_PATH = os.path.join(BASE_DIR, "images")
+
+IMAGE_CHUNK_SIZE = 4 * 1024 * 1024
+
+IMAGE_WORKERS = 8
+
+IMAGE_GC_GRACE_SECONDS = 3600
+
+# Image replication between portal nodes: port serve_replication listens on, the secret senders present (required
+# by serve_replication unless run with --insecure), chunks sent concurrently and the total send rate cap in bytes per
+# second (None for no cap)
+
+REPLICATION_PORT = 9200
+
+REPLICATION_TOKEN = None
+
+REPLICATION_WORKERS = 4
+
+REPLICATION_BYTES_PER_SECOND = None
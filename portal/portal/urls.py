@@ -16,17 +16,27 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
-from api.views import PDUViewSet, KVMViewSet, InitiatorViewSet, TargetViewSet, LogicalUnitViewSet, SnapshotViewSet
+from api.views import PDUViewSet, KVMViewSet, InitiatorViewSet, TagViewSet, StorageNodeViewSet, TargetViewSet,\
+    LogicalUnitViewSet, SnapshotViewSet, FleetViewSet, JobViewSet, ImageViewSet, metrics_view, events_view,\
+    boot_script
 
 router = routers.DefaultRouter()
 router.register("pdus", PDUViewSet)
 router.register("kvms", KVMViewSet)
 router.register("initiators", InitiatorViewSet)
+router.register("storage_nodes", StorageNodeViewSet)
 router.register("targets", TargetViewSet)
 router.register("logical_units", LogicalUnitViewSet)
 router.register("snapshots", SnapshotViewSet)
+router.register("tags", TagViewSet)
+router.register("fleet", FleetViewSet, base_name="fleet")
+router.register("jobs", JobViewSet)
+router.register("images", ImageViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('boot/<str:mac_address>', boot_script, name="boot-script"),
+    path('api/metrics/', metrics_view, name="metrics"),
+    path('api/events/', events_view, name="events"),
     path('api/', include(router.urls)),
 ]
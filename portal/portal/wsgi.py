@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "portal.settings")
 
 application = get_wsgi_application()
+
+# only processes serving requests sample I/O (runserver loads this in its serving child, not in the reloader), so
+# management commands & shells don't start a sampler of their own
+from django.conf import settings  # noqa: E402
+if settings.IO_TELEMETRY_ENABLED:
+    from api import telemetry
+    telemetry.start()